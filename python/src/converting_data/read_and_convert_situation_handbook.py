@@ -3,6 +3,7 @@ import fitz
 import json
 import re
 import rulebot
+from rulebot.rule_references import extract_rule_references
 
 class SituationHandbookExtractor:
     def __init__(self):
@@ -445,28 +446,7 @@ class SituationHandbookExtractor:
         return {"status": True, "text": answer_text.strip()}
 
     def extract_rule_reference_from_answer(self, text):
-        rule_references = []
-
-        pattern = r"Rule\s(\d{1,3}(?:\.\d{1,3}){0,2}\.?(?:\s\((?:I|II|III|IV|V|VI|VII|VIII|IX|X|XI|XII|XIII|XIV|XV|XVI|XVII|XVIII|XIX|XX)\))?|\s\((?:\d{1,3}(?:\.\d{1,3}){0,2})\))?(?=\s|[.,;!?)]|$)"
-        matches = re.findall(pattern, text)
-        if matches:
-            for match in matches:
-                if match.rstrip(".").strip() not in rule_references:
-                    rule_references.append(match.rstrip(".").strip())
-
-        # another pattern for in-text references that have "and", "or" or "," in between
-        pattern = r"(?i)\bRules?\s\d{1,3}(?:\.\d{1,3}){0,2}\.?(?:\s\((?=[\s.,;!?)]|$)(?:I|II|III|IV|V|VI|VII|VIII|IX|X|XI|XII|XIII|XIV|XV|XVI|XVII|XVIII|XIX|XX)(?=[\s.,;!?)]|$)\)|\s(?<=[\s(])(?:I|II|III|IV|V|VI|VII|VIII|IX|X|XI|XII|XIII|XIV|XV|XVI|XVII|XVIII|XIX|XX)(?=[\s.,;!?)]|$))?(?:\s(?:and|or)\s\d{1,3}(?:\.\d{1,3}){0,2}\.?(?:\s\((?=[\s.,;!?)]|$)(?:I|II|III|IV|V|VI|VII|VIII|IX|X|XI|XII|XIII|XIV|XV|XVI|XVII|XVIII|XIX|XX)(?=[\s.,;!?)]|$)\)|\s(?<=[\s(])(?:I|II|III|IV|V|VI|VII|VIII|IX|X|XI|XII|XIII|XIV|XV|XVI|XVII|XVIII|XIX|XX)(?=[\s.,;!?)]|$))?)?(?:,\s\d{1,3}(?:\.\d{1,3}){0,2}\.?(?:\s\((?=[\s.,;!?)]|$)(?:I|II|III|IV|V|VI|VII|VIII|IX|X|XI|XII|XIII|XIV|XV|XVI|XVII|XVIII|XIX|XX)(?=[\s.,;!?)]|$)\)|\s(?<=[\s(])(?:I|II|III|IV|V|VI|VII|VIII|IX|X|XI|XII|XIII|XIV|XV|XVI|XVII|XVIII|XIX|XX)(?=[\s.,;!?)]|$))?)*"
-        matches = re.findall(pattern, text)
-        if matches:
-            for match in matches:
-                rule_number_pattern = r"(\d{1,3}(?:\.\d{1,3}){0,2}\.?\s*(?:\((?:I|II|III|IV|V|VI|VII|VIII|IX|X|XI|XII|XIII|XIV|XV|XVI|XVII|XVIII|XIX|XX)\))?)"
-                rule_numbers = re.findall(rule_number_pattern, match)
-                if rule_numbers:
-                    for rule_number in rule_numbers:
-                        if rule_number.rstrip(".").strip() not in rule_references:
-                            rule_references.append(rule_number.rstrip(".").strip())
-
-        return rule_references if len(rule_references) > 0 else None
+        return extract_rule_references(text)
 
     def add_rule_if_needed(self, current_section, current_rule):
         if current_rule is None:
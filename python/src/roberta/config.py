@@ -1,4 +1,5 @@
 ﻿from .. import rulebot
+from ..rulebot.config import STOPWORDS  # shared with the BM25 retrieval of the rulebot
 
 FirstTrainingConfig = {
     "model_name": "roberta-base",  # Pretrained model name
@@ -48,18 +49,6 @@ EvaluationConfig = {
     "max_seq_length": 512,  # Max sequence length for tokenization
 }
 
-STOPWORDS = [
-    "the", "a", "an", "in", "on", "at", "is", "are", "was", "were", "be", "have", "has", "had",
-    "do", "does", "did", "with", "for", "about", "between", "this", "that", "these", "those",
-    "of", "to", "from", "and", "or", "by", "as", "if", "it", "its", "which", "what", "when",
-    "where", "who", "whom", "why", "how", "all", "any", "each", "few", "more", "most", "some",
-    "such", "no", "nor", "not", "only", "own", "same", "so", "than", "too", "very",
-    "can", "will", "just", "should", "now", "then", "but", "because", "while", "before",
-    "after", "above", "below", "up", "down", "out", "over", "under", "again", "further",
-    "once", "here", "there", "etc", "i.e", "e.g", "rule", "rules", "section", "article",
-    "paragraph", "subparagraph", "clause", "shall", "must", "may", "might", "could", "would"
-]
-
 EmbeddingConfig = {
     "tokenizer_model_name": "roberta-base",  # Path to the trained model
     "embedder_model_name": "sentence-transformers/all-MiniLM-L6-v2",#"sentence-transformers/all-mpnet-base-v2",
@@ -1,6 +1,9 @@
 ﻿import openai
 from openai import OpenAIError
 
+from .openai_client_pool import OpenAIClientPool, client_pool as default_client_pool
+from .query_options import QueryOptions
+
 
 class AnswerGenerator:
     # SYSTEM_PROMPT = """You are an ice hockey rule assistant.
@@ -50,63 +53,115 @@ class AnswerGenerator:
     but not followed by any list.
     """
 
-    def __init__(self, openai_api_key: str, model: str, temperature: float = 0.0, max_length: int = 4096):
+    def __init__(self, client_pool: OpenAIClientPool = None):
+        """
+        Initializes the answer generator. It is created once and shared by all requests,
+        the OpenAI API key, model, temperature and maximum length are passed per call.
+
+        :param client_pool: Pool of long-lived OpenAI clients, the shared pool of the module is used if None.
         """
-        Initializes the answer generator with OpenAI API parameters.
+        self._client_pool = client_pool if client_pool is not None else default_client_pool
+
+    def _messages(self, prompt: str) -> list:
+        return [
+            {"role": "system", "content": self.SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
 
-        :param openai_api_key: OpenAI API key.
-        :param model: Name of the GPT model (e.g. "gpt-4o-mini").
-        :param temperature: Sampling temperature for response variability.
-        :param max_length: Maximum token length of the generated response.
+    @staticmethod
+    def _error_message(error: Exception) -> str:
         """
-        self._openai_api_key = openai_api_key
-        self._model = model
-        self._temperature = temperature
-        self._max_length = max_length
+        Maps an exception raised by the OpenAI client to the answer text shown to the user.
+        :param error: The raised exception.
+        :return: The error message.
+        """
+        if isinstance(error, openai.APITimeoutError):
+            return "OpenAI API error, request timed out."
+        if isinstance(error, openai.APIConnectionError):
+            return "OpenAI API error, request failed to connect."
+        # the subclasses before openai.APIError, in the order of check_openai_api_key
+        if isinstance(error, openai.AuthenticationError):
+            return "OpenAI API error, request was not authorized."
+        if isinstance(error, openai.PermissionDeniedError):
+            return "OpenAI API error, request was not permitted."
+        if isinstance(error, openai.RateLimitError):
+            return "OpenAI API error, request exceeded rate limit."
+        if isinstance(error, openai.APIError):
+            return "OpenAI API error, returned an API Error."
+        return "An unknown error occurred."
 
-    def generate_answer(self, prompt: str) -> dict:
+    def generate_answer(self, prompt: str, options: QueryOptions) -> dict:
         """
         Calls the OpenAI API to generate an answer based on the prompt.
         :param prompt: The full prompt including question and context.
+        :param options: Per-request settings (OpenAI API key, model, temperature and maximum output length).
         :return: The generated answer as a string.
         """
         try:
-            openai.api_key = self._openai_api_key
-            response = openai.chat.completions.create(
-                model=self._model,
-                messages=[
-                    {"role": "system", "content": self.SYSTEM_PROMPT},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=self._temperature,
-                max_tokens=self._max_length
-            )
+            with self._client_pool.client(options.openai_api_key) as client:
+                response = client.chat.completions.create(
+                    model=options.model,
+                    messages=self._messages(prompt),
+                    temperature=options.temperature,
+                    max_tokens=options.max_length
+                )
             success = True
             answer = response.choices[0].message.content.strip()
-
-        except openai.APITimeoutError as e:
-            success = False
-            answer = "OpenAI API error, request timed out."
-        except openai.APIConnectionError as e:
-            success = False
-            answer = "OpenAI API error, request failed to connect."
-        except openai.APIError as e:
-            success = False
-            answer = "OpenAI API error, returned an API Error."
-        except openai.AuthenticationError as e:
-            success = False
-            answer = "OpenAI API error, request was not authorized."
-        except openai.PermissionDeniedError as e:
-            success = False
-            answer = "OpenAI API error, request was not permitted."
-        except openai.RateLimitError as e:
+        except Exception as e:
             success = False
-            answer = "OpenAI API error, request exceeded rate limit."
+            answer = self._error_message(e)
+
+        return {
+            "success": success,
+            "answer": answer,
+        }
+
+    async def generate_answer_async(self, prompt: str, options: QueryOptions) -> dict:
+        """
+        Same as generate_answer, but uses the async OpenAI client so the event loop is not blocked
+        while waiting for the completion.
+        :param prompt: The full prompt including question and context.
+        :param options: Per-request settings (OpenAI API key, model, temperature and maximum output length).
+        :return: The generated answer as a string.
+        """
+        try:
+            async with self._client_pool.async_client(options.openai_api_key) as client:
+                response = await client.chat.completions.create(
+                    model=options.model,
+                    messages=self._messages(prompt),
+                    temperature=options.temperature,
+                    max_tokens=options.max_length
+                )
+            success = True
+            answer = response.choices[0].message.content.strip()
         except Exception as e:
             success = False
-            answer = "An unknown error occurred."
+            answer = self._error_message(e)
 
         return {
             "success": success,
             "answer": answer,
         }
+
+    async def stream_answer_async(self, prompt: str, options: QueryOptions):
+        """
+        Streams the answer from the OpenAI API token by token.
+        :param prompt: The full prompt including question and context.
+        :param options: Per-request settings (OpenAI API key, model, temperature and maximum output length).
+        :return: Async generator of dictionaries, either {"success": True, "token": str} for each received
+                 part of the answer or a final {"success": False, "answer": str} if the request failed.
+        """
+        try:
+            async with self._client_pool.async_client(options.openai_api_key) as client:
+                stream = await client.chat.completions.create(
+                    model=options.model,
+                    messages=self._messages(prompt),
+                    temperature=options.temperature,
+                    max_tokens=options.max_length,
+                    stream=True
+                )
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield {"success": True, "token": chunk.choices[0].delta.content}
+        except Exception as e:
+            yield {"success": False, "answer": self._error_message(e)}
@@ -1,12 +1,17 @@
 ﻿from fastapi import FastAPI, HTTPException, Depends, Security
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from typing import List, Union
 import uvicorn
+import json
 import numpy as np
 from contextlib import asynccontextmanager
 
 from .auth import get_api_key
 from .rag_pipeline import RagPipeline
+from .openai_client_pool import client_pool
+from .query_options import QueryOptions
 from .config import ApiConfig
 
 
@@ -31,6 +36,49 @@ class QueryResponse(BaseModel):
     retrieved_top_rules: list
     retrieved_situations: list
 
+
+class BatchQueryRequest(BaseModel):
+    gpt_model: str
+    embedder_model_name: str
+    embedding_dim: int
+    top_k_chunks: int
+    top_k_rules: int
+    top_k_situations: int
+    threshold: float
+    situation_threshold: float
+    questions: List[str]
+    temperature: float
+    max_length: int
+
+
+class BatchQueryResponse(BaseModel):
+    results: List[QueryResponse]
+
+def build_query_options(query: Union[QueryRequest, BatchQueryRequest], api_key: str, pipeline: RagPipeline) -> QueryOptions:
+    """
+    Creates the immutable per-request options from the request body.
+    The embedder and its index are loaded once at startup and shared between requests,
+    so a request can only use the embedder the pipeline was started with.
+    """
+    if query.embedder_model_name != pipeline.embedder_model_name or query.embedding_dim != pipeline.embedding_dim:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Embedder '{query.embedder_model_name}' ({query.embedding_dim}) is not available. "
+                   f"Loaded embedder: '{pipeline.embedder_model_name}' ({pipeline.embedding_dim})."
+        )
+
+    return QueryOptions(
+        openai_api_key=api_key,
+        model=query.gpt_model,
+        top_k_chunks=query.top_k_chunks,
+        top_k_rules=query.top_k_rules,
+        top_k_situations=query.top_k_situations,
+        threshold=query.threshold,
+        situation_threshold=query.situation_threshold,
+        temperature=query.temperature,
+        max_length=query.max_length,
+    )
+
 def convert_np_floats(item):
     """
     Rekursive Funktion zur Umwandlung von numpy.float32/float64 in native Python-Floats.
@@ -44,6 +92,12 @@ def convert_np_floats(item):
     else:
         return item
 
+def format_sse(event: str, data) -> str:
+    """
+    Formats a single Server-Sent Event.
+    """
+    return f"event: {event}\ndata: {json.dumps(convert_np_floats(data))}\n\n"
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # initialize pipeline and store in app.state
@@ -63,12 +117,34 @@ async def lifespan(app: FastAPI):
             mapping_path=ApiConfig["chunk_mapping_path"],
             casebook_index_path=ApiConfig["casebook_index_path"],
             casebook_mapping_path=ApiConfig["casebook_chunk_mapping_path"],
+            retrieval_workers=ApiConfig["retrieval_workers"],
+            segmenter=ApiConfig["segmenter"],
+            query_cache_size=ApiConfig["query_embedding_cache_size"],
+            query_cache_path=ApiConfig["query_embedding_cache_path"],
+            answer_cache_size=ApiConfig["answer_cache_size"],
+            answer_cache_ttl=ApiConfig["answer_cache_ttl"],
+            answer_cache_path=ApiConfig["answer_cache_path"],
+            client_pool=client_pool,
+            batch_max_concurrency=ApiConfig["batch_max_concurrency"],
+            mapping_mmap=ApiConfig["mapping_mmap"],
+            rule_aggregation=ApiConfig["rule_aggregation"],
+            index_search_params=ApiConfig["index_search_params"],
+            index_mmap=ApiConfig["index_mmap"],
+            index_search_threads=ApiConfig["index_search_threads"],
+            hybrid_retrieval=ApiConfig["hybrid_retrieval"],
+            bm25_top_k=ApiConfig["bm25_top_k"],
+            rrf_k=ApiConfig["rrf_k"],
+            bm25_min_score=ApiConfig["bm25_min_score"],
+            reference_routing=ApiConfig["reference_routing"],
+            reference_max_rules=ApiConfig["reference_max_rules"],
         )
 
     # persistently save pipeline
     app.state.pipeline_instance = pipeline_instance
     print("Pipeline (Index und Mapping) was loaded successfully.")
     yield
+    pipeline_instance.close()
+    await client_pool.aclose()
 
 app = FastAPI(title="Ice Hockey Rule Assistant API", lifespan=lifespan)
 app.add_middleware(
@@ -85,23 +161,12 @@ async def ask_question(query: QueryRequest, api_key: str = Depends(get_api_key))
     Verarbeitet die USER_QUESTION unter Verwendung der GptRagPipeline.
     Der API-Schlüssel wird sicher über einen HTTP-Header übergeben (via get_api_key).
     """
+    # the shared pipeline is never modified, every request gets its own options
+    pipeline = app.state.pipeline_instance
+    options = build_query_options(query, api_key, pipeline)
+
     try:
-        # getting pipeline instance and overwrite the parameters from request
-        pipeline = app.state.pipeline_instance
-
-        pipeline._openai_api_key = api_key
-        pipeline._embedder_model_name = query.embedder_model_name
-        pipeline._embedding_dim = query.embedding_dim
-        pipeline.top_k_chunks = query.top_k_chunks
-        pipeline._top_k_rules = query.top_k_rules
-        pipeline._top_k_situations = query.top_k_situations
-        pipeline._threshold = query.threshold
-        pipeline._situation_threshold = query.situation_threshold
-        pipeline._model_name = query.gpt_model
-        pipeline._temperature = query.temperature
-        pipeline._max_length = query.max_length
-
-        answer, prompt, retrieved_all_rules, retrieved_top_rules, retrieved_situations = pipeline.process_query(query.question)
+        answer, prompt, retrieved_all_rules, retrieved_top_rules, retrieved_situations = await pipeline.process_query_async(query.question, options)
 
         print(prompt)
 
@@ -116,5 +181,68 @@ async def ask_question(query: QueryRequest, api_key: str = Depends(get_api_key))
         print(str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/ask/batch", response_model=BatchQueryResponse)
+async def ask_questions(query: BatchQueryRequest, api_key: str = Depends(get_api_key)):
+    """
+    Beantwortet mehrere USER_QUESTIONs mit denselben Einstellungen (z.B. einen ganzen Fragenkatalog).
+    Alle Fragen werden gemeinsam eingebettet und gesucht, die OpenAI-Anfragen laufen parallel.
+    """
+    if len(query.questions) > ApiConfig["batch_max_questions"]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many questions ({len(query.questions)}), at most {ApiConfig['batch_max_questions']} per batch."
+        )
+
+    pipeline = app.state.pipeline_instance
+    options = build_query_options(query, api_key, pipeline)
+
+    try:
+        results = await pipeline.process_queries_async(query.questions, options)
+
+        return BatchQueryResponse(results=[
+            QueryResponse(
+                answer=convert_np_floats(answer),
+                prompt=convert_np_floats(prompt),
+                retrieved_all_rules=convert_np_floats(retrieved_all_rules),
+                retrieved_top_rules=convert_np_floats(retrieved_top_rules),
+                retrieved_situations=convert_np_floats(retrieved_situations),
+            )
+            for answer, prompt, retrieved_all_rules, retrieved_top_rules, retrieved_situations in results
+        ])
+    except Exception as e:
+        print(str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/stats/cache")
+async def cache_stats():
+    """
+    Liefert die Hit/Miss-Zähler der Caches dieses Workers.
+    """
+    return app.state.pipeline_instance.cache_stats()
+
+@app.post("/ask/stream")
+async def ask_question_stream(query: QueryRequest, api_key: str = Depends(get_api_key)):
+    """
+    Wie /ask, aber die Antwort wird als Server-Sent Events gestreamt:
+    zuerst der abgerufene Kontext ("context"), dann die Antwort-Tokens ("token")
+    und zum Schluss die Quellen ("sources") bzw. ein Fehler ("error").
+    """
+    pipeline = app.state.pipeline_instance
+    options = build_query_options(query, api_key, pipeline)
+
+    async def event_stream():
+        try:
+            async for event, data in pipeline.stream_query_async(query.question, options):
+                yield format_sse(event, data)
+        except Exception as e:
+            print(str(e))
+            yield format_sse("error", {"answer": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
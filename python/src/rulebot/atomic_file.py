@@ -0,0 +1,24 @@
+import os
+import tempfile
+
+
+def write_atomically(path: str, write):
+    """
+    Writes a file through a temporary file with a unique name in the same directory and replaces the file
+    atomically, so readers never see a half-written file and concurrent writers (builds, API workers)
+    do not overwrite each other's temporary files.
+    :param path: Path of the file.
+    :param write: Function that writes the complete file to the temporary path it is given.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    descriptor, temporary_path = tempfile.mkstemp(dir=directory, prefix=name + ".", suffix=".tmp")
+    os.close(descriptor)
+    try:
+        write(temporary_path)
+        # mkstemp creates the file readable by its owner only, workers of other users read it as well
+        os.chmod(temporary_path, 0o644)
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
@@ -1,18 +1,45 @@
 import os
+import hashlib
+import threading
 
 from fastapi.security.api_key import APIKeyHeader
 from fastapi import Security, HTTPException
+from starlette.concurrency import run_in_threadpool
 from starlette.status import HTTP_403_FORBIDDEN
 import openai
 
+from .cache import create_cache
+from .config import ApiConfig
+
 api_key_header = APIKeyHeader(name="access_token", auto_error=False)
 
+# validated keys are only stored as SHA-256 hashes, shared between workers if a cache path is configured
+_api_key_cache = None
+_api_key_cache_lock = threading.Lock()
+_validation_locks = {}  # key hash -> [lock, number of requests holding or waiting for the lock]
+_validation_locks_lock = threading.Lock()
+
+def get_api_key_cache():
+    """
+    The cache of validated API keys, created on first use so importing the module does not open the cache file.
+    """
+    global _api_key_cache
+    if _api_key_cache is None:
+        with _api_key_cache_lock:
+            if _api_key_cache is None:
+                _api_key_cache = create_cache(max_size=ApiConfig["api_key_cache_size"],
+                                              ttl=ApiConfig["api_key_cache_ttl"],
+                                              path=ApiConfig["api_key_cache_path"],
+                                              table="api_keys")
+    return _api_key_cache
+
 async def get_api_key(api_key_header: str = Security(api_key_header)):
     api_key = api_key_header
     if api_key_header == "masterarbeit2025abgabe":
         api_key = get_api_key_local()
 
-    result = check_openai_api_key(api_key)
+    # the check is a blocking network call, keep it off the event loop
+    result = await run_in_threadpool(validate_api_key, api_key)
     if result["success"]:
         return api_key
     else:
@@ -21,27 +48,68 @@ async def get_api_key(api_key_header: str = Security(api_key_header)):
             detail=f"Could not validate API KEY. \nError: {result['error_message']}"
         )
 
+def hash_api_key(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+def validate_api_key(api_key):
+    """
+    Cached version of check_openai_api_key. Valid keys are cached for api_key_cache_ttl seconds,
+    rejected keys for api_key_cache_negative_ttl seconds. Transient errors (timeouts, connection
+    problems, rate limits) are not cached. Parallel requests with the same key validate it only once.
+    :param api_key: The OpenAI API key.
+    :return: Dictionary with the keys "success" and "error_message".
+    """
+    key_hash = hash_api_key(api_key or "")
+    cache = get_api_key_cache()
+    result = cache.get(key_hash)
+    if result is not None:
+        return result
+
+    with _validation_locks_lock:
+        entry = _validation_locks.setdefault(key_hash, [threading.Lock(), 0])
+        entry[1] += 1
+
+    try:
+        with entry[0]:
+            # another request might have validated the key while waiting for the lock
+            result = cache.get(key_hash)
+            if result is None:
+                result = check_openai_api_key(api_key)
+                if result["success"]:
+                    cache.set(key_hash, result)
+                elif result["cacheable"]:
+                    cache.set(key_hash, result, ttl=ApiConfig["api_key_cache_negative_ttl"])
+    finally:
+        # the lock is dropped by the last request using it, a later request for the key would otherwise get a new one
+        with _validation_locks_lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _validation_locks[key_hash]
+
+    return result
+
 def check_openai_api_key(api_key):
-    openai.api_key = api_key
     try:
-        openai.models.list()
+        # a short-lived client of this key instead of the module-level openai.api_key, which is shared between
+        # parallel requests, and not a pooled one: unvalidated (wrong or made up) keys would evict the valid keys
+        with openai.OpenAI(api_key=api_key, timeout=ApiConfig["openai_timeout"] or openai.DEFAULT_TIMEOUT) as client:
+            client.models.list()
     except openai.APITimeoutError as e:
-        return {"success": False, "error_message": "OpenAI API request timed out."}
+        return {"success": False, "error_message": "OpenAI API request timed out.", "cacheable": False}
     except openai.APIConnectionError as e:
-        return {"success": False, "error_message": "OpenAI API request failed to connect."}
-    except openai.APIError as e:
-        return {"success": False, "error_message": "OpenAI API returned an API Error."}
+        return {"success": False, "error_message": "OpenAI API request failed to connect.", "cacheable": False}
     except openai.AuthenticationError as e:
-        return {"success": False, "error_message": "OpenAI API request was not authorized."}
+        return {"success": False, "error_message": "OpenAI API request was not authorized.", "cacheable": True}
     except openai.PermissionDeniedError as e:
-        return {"success": False, "error_message": "OpenAI API request was not permitted."}
+        return {"success": False, "error_message": "OpenAI API request was not permitted.", "cacheable": True}
     except openai.RateLimitError as e:
-        return {"success": False, "error_message": "OpenAI API request exceeded rate limit."}
+        return {"success": False, "error_message": "OpenAI API request exceeded rate limit.", "cacheable": False}
+    except openai.APIError as e:
+        return {"success": False, "error_message": "OpenAI API returned an API Error.", "cacheable": False}
     except Exception as e:
-        return {"success": False, "error_message": "An unknown error occurred."}
+        return {"success": False, "error_message": "An unknown error occurred.", "cacheable": False}
     else:
-        return {"success": True, "error_message": None}
-
+        return {"success": True, "error_message": None, "cacheable": True}
 
 def get_api_key_local():
     if os.environ.get('OPENAI_API_KEY'):
@@ -0,0 +1,118 @@
+import re
+from collections import Counter
+
+import numpy as np
+
+from .config import STOPWORDS
+
+# words and rule numbers ("116", "78.5"), hyphenated terms ("off-side") are split into their parts
+TOKEN_PATTERN = re.compile(r"\d+(?:\.\d+)*|[^\W\d_]+")
+
+
+class BM25Index:
+    def __init__(self, documents: list, k1: float = 1.5, b: float = 0.75, stopwords: list = STOPWORDS):
+        """
+        Okapi BM25 over an inverted index. The postings (documents containing a term) of all terms are stored in
+        flat arrays, so a search only touches the postings of the query terms instead of every document.
+
+        :param documents: Texts of the documents, the position of a text is its document id.
+        :param k1: Saturation of the term frequency.
+        :param b: Strength of the document length normalization (0 = none, 1 = full).
+        :param stopwords: Lowercase words that are neither indexed nor searched.
+        """
+        self._stopwords = frozenset(stopwords)
+        self._num_documents = len(documents)
+
+        term_ids = {}
+        posting_terms, posting_documents, posting_frequencies = [], [], []
+        document_lengths = np.zeros(len(documents), dtype=np.float32)
+        for document_id, text in enumerate(documents):
+            tokens = self.tokenize(text)
+            document_lengths[document_id] = len(tokens)
+            for term, frequency in Counter(tokens).items():
+                posting_terms.append(term_ids.setdefault(term, len(term_ids)))
+                posting_documents.append(document_id)
+                posting_frequencies.append(frequency)
+
+        # postings grouped by term (CSR layout): the postings of term t are offsets[t]:offsets[t + 1]
+        posting_terms = np.array(posting_terms, dtype=np.int32)
+        order = np.argsort(posting_terms, kind="stable")
+        document_frequencies = np.bincount(posting_terms, minlength=len(term_ids))
+        self._term_ids = term_ids
+        self._offsets = np.concatenate([[0], np.cumsum(document_frequencies)])
+        self._documents = np.array(posting_documents, dtype=np.int32)[order]
+
+        # the BM25 weight of a posting does not depend on the query, so it is computed once here
+        frequencies = np.array(posting_frequencies, dtype=np.float32)[order]
+        lengths = document_lengths[self._documents]
+        average_length = document_lengths.mean() if len(documents) else 1.0
+        idf = np.log1p((len(documents) - document_frequencies + 0.5) / (document_frequencies + 0.5)).astype(np.float32)
+        self._weights = idf[posting_terms[order]] * frequencies * (k1 + 1) \
+            / (frequencies + k1 * (1 - b + b * lengths / max(average_length, 1.0)))
+
+    def __len__(self) -> int:
+        return self._num_documents
+
+    def tokenize(self, text: str) -> list:
+        """
+        Splits a text into lowercase terms without stopwords. A rule number also yields its parent rules
+        ("78.5" -> "78.5", "78"), so "Rule 78" finds the subrules of rule 78.
+        :param text: The text.
+        :return: List of terms in text order.
+        """
+        tokens = []
+        for token in TOKEN_PATTERN.findall((text or "").lower()):
+            if token in self._stopwords:
+                continue
+            tokens.append(token)
+            if token[0].isdigit() and "." in token:
+                parts = token.split(".")
+                tokens.extend(".".join(parts[:end]) for end in range(len(parts) - 1, 0, -1))
+        return tokens
+
+    def scores(self, query: str) -> np.ndarray:
+        """
+        :param query: The query text.
+        :return: BM25 score of every document [of shape: (num_documents,)], 0 for documents without query terms.
+        """
+        scores = np.zeros(self._num_documents, dtype=np.float32)
+        for term, count in Counter(self.tokenize(query)).items():
+            term_id = self._term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = self._offsets[term_id], self._offsets[term_id + 1]
+            # a document occurs once in the postings of a term, so the fancy-indexed add is safe
+            scores[self._documents[start:end]] += count * self._weights[start:end]
+        return scores
+
+    def search(self, query: str, k: int) -> tuple:
+        """
+        Searches the k best matching documents.
+        :param query: The query text.
+        :param k: Maximum number of documents.
+        :return: Tuple (scores, document_ids) sorted by score (descending), only documents with a score > 0.
+        """
+        scores = self.scores(query)
+        candidates = np.flatnonzero(scores > 0)
+        if k <= 0:
+            candidates = candidates[:0]
+        elif k < len(candidates):
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        # stable order for equal scores: the lower document id first
+        candidates = candidates[np.lexsort((candidates, -scores[candidates]))]
+        return scores[candidates], candidates
+
+
+def reciprocal_rank_fusion(rankings: list, k: int = 60) -> dict:
+    """
+    Combines several rankings of the same kind of items (e.g. rule IDs) by reciprocal rank fusion:
+    every ranking adds 1 / (k + rank) to the score of its items, the rank starting at 1.
+    :param rankings: Lists of item keys, each sorted from best to worst.
+    :param k: Rank constant, a higher k weights the top ranks less strongly.
+    :return: Dictionary from item key to fused score, ordered by score (descending) and first occurrence.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return dict(sorted(scores.items(), key=lambda item: item[1], reverse=True))
@@ -0,0 +1,272 @@
+import hashlib
+import json
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class LRUCache:
+    def __init__(self, max_size: int = 1024, ttl: float = None):
+        """
+        Thread-safe in-memory cache with least-recently-used eviction and optional expiry.
+        :param max_size: Maximum number of entries, the least recently used entry is evicted first.
+        :param ttl: Default time to live of an entry in seconds (None = no expiry).
+        """
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value for the key or the default if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at is None or expires_at > time.time():
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return value
+                del self._entries[key]
+            self._misses += 1
+            return default
+
+    def set(self, key, value, ttl: float = None):
+        """
+        Stores a value, evicting the least recently used entries if the cache is full.
+        :param ttl: Time to live in seconds for this entry, the cache default is used if None.
+        """
+        ttl = self._ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """
+        :return: Dictionary with hit and miss counters and the current size.
+        """
+        return {"hits": self._hits, "misses": self._misses, "size": len(self._entries), "max_size": self._max_size}
+
+
+class SqliteCache:
+    def __init__(self, path: str, max_size: int = 1024, ttl: float = None, table: str = "cache",
+                 access_resolution: float = 60.0):
+        """
+        File-backed cache with the same interface as LRUCache. SQLite handles the locking,
+        so several processes (e.g. uvicorn workers) can share one cache file and entries survive restarts.
+        Values are stored pickled.
+        :param path: Path to the SQLite database file, missing directories are created.
+        :param max_size: Maximum number of entries, the least recently used entry is evicted first.
+        :param ttl: Default time to live of an entry in seconds (None = no expiry).
+        :param table: Name of the table, allows several caches in one file.
+        :param access_resolution: Seconds within which a hit does not update the last access time again, so most
+                                  hits only read. The least-recently-used order is only exact to this resolution.
+        """
+        self._path = path
+        self._max_size = max_size
+        self._ttl = ttl
+        self._table = table
+        self._access_resolution = access_resolution
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._connection().execute(
+            f"CREATE TABLE IF NOT EXISTS {self._table} "
+            f"(key TEXT PRIMARY KEY, value BLOB, expires_at REAL, last_access REAL)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite connections must not be shared between threads, so every thread gets its own
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self._path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key, default=None):
+        now = time.time()
+        connection = self._connection()
+        row = connection.execute(
+            f"SELECT value, expires_at, last_access FROM {self._table} WHERE key = ?", (str(key),)
+        ).fetchone()
+
+        if row is not None:
+            value, expires_at, last_access = row
+            if expires_at is None or expires_at > now:
+                if last_access is None or now - last_access >= self._access_resolution:
+                    connection.execute(f"UPDATE {self._table} SET last_access = ? WHERE key = ?", (now, str(key)))
+                with self._stats_lock:
+                    self._hits += 1
+                return pickle.loads(value)
+            connection.execute(f"DELETE FROM {self._table} WHERE key = ?", (str(key),))
+
+        with self._stats_lock:
+            self._misses += 1
+        return default
+
+    def set(self, key, value, ttl: float = None):
+        now = time.time()
+        ttl = self._ttl if ttl is None else ttl
+        expires_at = now + ttl if ttl is not None else None
+        connection = self._connection()
+        connection.execute(
+            f"INSERT OR REPLACE INTO {self._table} (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+            (str(key), pickle.dumps(value), expires_at, now)
+        )
+        connection.execute(
+            f"DELETE FROM {self._table} WHERE key IN "
+            f"(SELECT key FROM {self._table} ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self._max_size,)
+        )
+
+    def delete(self, key):
+        self._connection().execute(f"DELETE FROM {self._table} WHERE key = ?", (str(key),))
+
+    def clear(self):
+        self._connection().execute(f"DELETE FROM {self._table}")
+
+    def __len__(self):
+        return self._connection().execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()[0]
+
+    def stats(self) -> dict:
+        return {"hits": self._hits, "misses": self._misses, "size": len(self), "max_size": self._max_size}
+
+
+class EmbeddingCache:
+    def __init__(self, directory: str, model_name: str, dtype: str = "float32"):
+        """
+        Persistent, content-addressed cache of text embeddings for index builds, keyed by (model name, text hash),
+        so builds with other chunking settings only encode the chunk texts that are new.
+        Every model has its own subdirectory with two append-only files: the 16-byte BLAKE2b hashes of the texts
+        and the embedding rows in the same order, read through a read-only memory map.
+        Only one build at a time may write to a cache directory.
+
+        :param directory: Cache directory, missing directories are created.
+        :param model_name: Name of the embedding model, embeddings of different models never mix.
+        :param dtype: Storage type of the embeddings, "float32" (exact) or "float16" (half the size, the returned
+                      embeddings are rounded to float16 whether they come from the cache or the model).
+        """
+        self._dtype = np.dtype(dtype)
+        if self._dtype not in (np.float32, np.float16):
+            raise ValueError(f"Unsupported embedding cache type '{dtype}', expected 'float32' or 'float16'.")
+        self._directory = os.path.join(directory, re.sub(r"[^\w.-]+", "_", model_name))
+        os.makedirs(self._directory, exist_ok=True)
+        self._keys_path = os.path.join(self._directory, f"keys.{self._dtype.name}.bin")
+        self._vectors_path = os.path.join(self._directory, f"vectors.{self._dtype.name}.bin")
+        self._meta_path = os.path.join(self._directory, "meta.json")
+        self._hits = 0
+        self._misses = 0
+        self._load()
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def _load(self):
+        self._dim = None
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                self._dim = json.load(f)["dim"]
+
+        num_rows = 0
+        if self._dim is not None and os.path.exists(self._keys_path) and os.path.exists(self._vectors_path):
+            # rows of an interrupted write (key or vector incomplete) are cut off
+            num_rows = min(os.path.getsize(self._keys_path) // 16,
+                           os.path.getsize(self._vectors_path) // (self._dim * self._dtype.itemsize))
+            for path, row_size in ((self._keys_path, 16), (self._vectors_path, self._dim * self._dtype.itemsize)):
+                if os.path.getsize(path) != num_rows * row_size:
+                    os.truncate(path, num_rows * row_size)
+
+        keys = b""
+        if num_rows:
+            with open(self._keys_path, "rb") as f:
+                keys = f.read(num_rows * 16)
+        self._rows = {keys[start:start + 16]: row for row, start in enumerate(range(0, len(keys), 16))}
+        self._map_vectors()
+
+    def _map_vectors(self):
+        self._vectors = np.memmap(self._vectors_path, dtype=self._dtype, mode="r",
+                                  shape=(len(self._rows), self._dim)) if self._rows else None
+
+    def _append(self, keys: list, embeddings: np.ndarray):
+        if self._dim is None:
+            self._dim = embeddings.shape[1]
+            with open(self._meta_path, "w", encoding="utf-8") as f:
+                json.dump({"dim": self._dim}, f)
+        # vectors first: a key without its complete vector is cut off by the next _load
+        with open(self._vectors_path, "ab") as f:
+            f.write(np.ascontiguousarray(embeddings, dtype=self._dtype).tobytes())
+        with open(self._keys_path, "ab") as f:
+            f.write(b"".join(keys))
+        for key in keys:
+            self._rows[key] = len(self._rows)
+        self._map_vectors()
+
+    def embed(self, texts: list, encode) -> np.ndarray:
+        """
+        Returns the embeddings of the texts, only the texts missing in the cache are encoded (each once).
+        :param texts: List of texts, e.g. the chunks of an index build.
+        :param encode: Function that embeds a list of texts, e.g. SentenceTransformer.encode.
+        :return: float32 NumPy array [of shape: (len(texts), embedding_dim)].
+        """
+        keys = [self.key(text) for text in texts]
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in self._rows:
+                missing.setdefault(key, text)
+        self._misses += len(missing)
+        self._hits += len(texts) - len(missing)
+        print(f"Embedding cache: {len(texts) - len(missing)} of {len(texts)} texts cached, {len(missing)} to encode.")
+
+        if missing:
+            self._append(list(missing), np.asarray(encode(list(missing.values())), dtype=np.float32))
+        if not keys:
+            return np.empty((0, self._dim or 0), dtype=np.float32)
+        rows = np.fromiter((self._rows[key] for key in keys), dtype=np.int64, count=len(keys))
+        return np.array(self._vectors[rows], dtype=np.float32)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def stats(self) -> dict:
+        return {"hits": self._hits, "misses": self._misses, "size": len(self._rows)}
+
+
+def create_cache(max_size: int, ttl: float = None, path: str = None, table: str = "cache"):
+    """
+    Creates an in-memory LRUCache or, if a path is given, a file-backed SqliteCache.
+    """
+    if path:
+        return SqliteCache(path, max_size=max_size, ttl=ttl, table=table)
+    return LRUCache(max_size=max_size, ttl=ttl)
@@ -0,0 +1,219 @@
+import glob
+import hashlib
+import json
+import os
+import pickle
+
+import numpy as np
+
+from .atomic_file import write_atomically
+
+# per-chunk fields the retrieval never reads, they are not copied into the columnar mapping
+# (the prompt uses the resolved "referenced_rules_text" of a situation, not the "referenced_rules" it was built from)
+DROPPED_FIELDS = ("chunk_text", "referenced_rules")
+
+
+class ChunkMapping:
+    def __init__(self, rows: np.ndarray, entries: list):
+        """
+        Columnar mapping from FAISS row to chunk metadata. Instead of one dictionary per chunk, every row
+        only stores the position of its entry (int32), the entries (e.g. one per rule) are stored once.
+
+        :param rows: Array of shape (num_rows,) with the entry position of every FAISS row (-1 = no entry).
+        :param entries: List of metadata dictionaries, e.g. {"rule_id": "1.1.", ...}.
+        """
+        self.rows = rows
+        self.entries = entries
+        self._columns = {}
+        self._codes = {}
+
+    @staticmethod
+    def paths(mapping_path: str, version: str = None) -> tuple:
+        """
+        Derives the file names of the columnar mapping from the path of the pickled mapping. The row and entry
+        files carry a version (hash of their content), a small index file names the current version. A new
+        version is published by replacing the index file, so workers always load a matching pair of files.
+        :param mapping_path: Path of the pickle file (e.g. "rulebook_chunk_mapping.pkl").
+        :param version: Version of the row and entry files, None = only the index file is needed.
+        :return: Tuple (index_path, rows_path, entries_path), the rows and entries paths are None without version.
+        """
+        base, _ = os.path.splitext(mapping_path)
+        if version is None:
+            return base + ".columnar.json", None, None
+        return base + ".columnar.json", f"{base}.{version}.rows.npy", f"{base}.{version}.entries.pkl"
+
+    @classmethod
+    def from_dict(cls, mapping: dict) -> "ChunkMapping":
+        """
+        Converts the pickled dict-of-dicts mapping {row: {field: value}}. Identical entries are stored once.
+        :param mapping: Mapping from FAISS row to chunk metadata.
+        :return: The columnar mapping.
+        """
+        rows = np.full(max(mapping, default=-1) + 1, -1, dtype=np.int32)
+        entries = []
+        positions = {}
+        for row, chunk_info in mapping.items():
+            entry = {field: value for field, value in chunk_info.items() if field not in DROPPED_FIELDS}
+            key = json.dumps(entry, sort_keys=True)
+            if key not in positions:
+                positions[key] = len(entries)
+                entries.append(entry)
+            rows[row] = positions[key]
+        return cls(rows, entries)
+
+    def save(self, mapping_path: str):
+        """
+        Saves the mapping next to the pickled mapping, see paths.
+        The row and entry files of the new version are written first, then the index file is replaced atomically,
+        so running workers never read a half-written mapping or rows and entries of different versions.
+        Files of older versions are removed, except the previous version (a worker may be loading it right now).
+        The index file also records the hash of the pickle file, see load.
+        :param mapping_path: Path of the pickle file.
+        """
+        # pickled: the entries load about twice as fast as from JSON (the casebook has one entry per situation)
+        entries_bytes = pickle.dumps(self.entries, protocol=pickle.HIGHEST_PROTOCOL)
+        version = hashlib.sha256(self.rows.astype(np.int32).tobytes() + entries_bytes).hexdigest()[:16]
+        index_path, rows_path, entries_path = self.paths(mapping_path, version)
+        previous_version = self._read_index(index_path).get("version")
+
+        def write_rows(path: str):
+            with open(path, "wb") as f:
+                np.save(f, self.rows)
+
+        def write_entries(path: str):
+            with open(path, "wb") as f:
+                f.write(entries_bytes)
+
+        def write_index(path: str):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"version": version, "source": self._source_hash(mapping_path)}, f)
+
+        write_atomically(rows_path, write_rows)
+        write_atomically(entries_path, write_entries)
+        write_atomically(index_path, write_index)
+        self._remove_versions(mapping_path, keep={version, previous_version})
+        print(f"Columnar mapping saved to '{rows_path}' and '{entries_path}'.")
+
+    @classmethod
+    def _remove_versions(cls, mapping_path: str, keep: set):
+        base, _ = os.path.splitext(mapping_path)
+        for path in glob.glob(glob.escape(base) + ".*.rows.npy") + glob.glob(glob.escape(base) + ".*.entries.pkl"):
+            version = os.path.basename(path)[len(os.path.basename(base)) + 1:].split(".")[0]
+            if version not in keep:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _source_hash(mapping_path: str):
+        if not os.path.exists(mapping_path):
+            return None
+        with open(mapping_path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    @staticmethod
+    def _read_index(index_path: str) -> dict:
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @classmethod
+    def load(cls, mapping_path: str, mmap: bool = True) -> "ChunkMapping":
+        """
+        Loads the columnar mapping. The builds save it next to the pickled mapping. Only if it is missing or was
+        converted from a different pickle file (compared by content, not by modification time, which a checkout
+        or copy does not preserve), it is converted here and saved for the next start; concurrent conversions of
+        several workers write the same version through unique temporary files.
+        :param mapping_path: Path of the pickle file.
+        :param mmap: Memory-map the row array, so all workers share the same pages.
+        :return: The columnar mapping.
+        """
+        index_path, _, _ = cls.paths(mapping_path)
+
+        if not cls._is_up_to_date(mapping_path, index_path):
+            with open(mapping_path, "rb") as f:
+                mapping = cls.from_dict(pickle.load(f))
+            try:
+                mapping.save(mapping_path)
+            except OSError as e:
+                # e.g. read-only data directory, the converted mapping is still used
+                print(f"Columnar mapping could not be saved: {e}")
+                return mapping
+
+        for attempt in range(2):
+            _, rows_path, entries_path = cls.paths(mapping_path, cls._read_index(index_path).get("version"))
+            try:
+                rows = np.load(rows_path, mmap_mode="r" if mmap else None)
+                with open(entries_path, "rb") as f:
+                    entries = pickle.load(f)
+                return cls(rows, entries)
+            except OSError:
+                # the version was replaced twice while it was loaded, the index file names the current one
+                if attempt == 1:
+                    raise
+
+    @classmethod
+    def _is_up_to_date(cls, mapping_path: str, index_path: str) -> bool:
+        index = cls._read_index(index_path)
+        if index.get("version") is None:
+            return False
+        _, rows_path, entries_path = cls.paths(mapping_path, index["version"])
+        if not os.path.exists(rows_path) or not os.path.exists(entries_path):
+            return False
+        return not os.path.exists(mapping_path) or index.get("source") == cls._source_hash(mapping_path)
+
+    def column(self, field: str) -> np.ndarray:
+        """
+        :param field: Name of an entry field (e.g. "rule_id").
+        :return: Object array with the field value of every entry, indexable with entry positions.
+        """
+        column = self._columns.get(field)
+        if column is None:
+            column = np.empty(len(self.entries), dtype=object)
+            # element-wise, list values (e.g. rule_reference) must not be broadcast by numpy
+            for position, entry in enumerate(self.entries):
+                column[position] = entry.get(field)
+            self._columns[field] = column
+        return column
+
+    def codes(self, field: str) -> tuple:
+        """
+        Integer codes of an entry field for NumPy group-by operations (np.bincount, np.add.at, ...).
+        :param field: Name of an entry field (e.g. "rule_id").
+        :return: Tuple (entry_codes, values) with the int32 code of every entry and the distinct values,
+                 values[code] is the field value of the code.
+        """
+        codes = self._codes.get(field)
+        if codes is None:
+            positions = {}
+            entry_codes = np.empty(len(self.entries), dtype=np.int32)
+            for position, entry in enumerate(self.entries):
+                entry_codes[position] = positions.setdefault(entry.get(field), len(positions))
+            codes = (entry_codes, list(positions))
+            self._codes[field] = codes
+        return codes
+
+    def lookup(self, indices: np.ndarray) -> np.ndarray:
+        """
+        Vectorized lookup of the entry positions of FAISS search results.
+        :param indices: Array of FAISS row indices of any shape, -1 for missing results.
+        :return: Array of the same shape with the entry positions, -1 where no entry exists.
+        """
+        valid = (indices >= 0) & (indices < len(self.rows))
+        if not valid.any():
+            return np.full(indices.shape, -1, dtype=np.int32)
+        return np.where(valid, self.rows[np.where(valid, indices, 0)], -1)
+
+    def get(self, row: int, default=None):
+        """
+        Returns the entry of a single FAISS row, like dict.get on the pickled mapping.
+        """
+        if 0 <= row < len(self.rows) and self.rows[row] >= 0:
+            return self.entries[self.rows[row]]
+        return default
+
+    def __len__(self):
+        return len(self.rows)
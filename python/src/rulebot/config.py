@@ -1,5 +1,18 @@
 ﻿from . import data_dir
 
+# words that are not indexed for the lexical (BM25) retrieval, see bm25_index.py
+STOPWORDS = [
+    "the", "a", "an", "in", "on", "at", "is", "are", "was", "were", "be", "have", "has", "had",
+    "do", "does", "did", "with", "for", "about", "between", "this", "that", "these", "those",
+    "of", "to", "from", "and", "or", "by", "as", "if", "it", "its", "which", "what", "when",
+    "where", "who", "whom", "why", "how", "all", "any", "each", "few", "more", "most", "some",
+    "such", "no", "nor", "not", "only", "own", "same", "so", "than", "too", "very",
+    "can", "will", "just", "should", "now", "then", "but", "because", "while", "before",
+    "after", "above", "below", "up", "down", "out", "over", "under", "again", "further",
+    "once", "here", "there", "etc", "i.e", "e.g", "rule", "rules", "section", "article",
+    "paragraph", "subparagraph", "clause", "shall", "must", "may", "might", "could", "would"
+]
+
 ApiConfig = {
     "embedder_model_name": "sentence-transformers/all-MiniLM-L6-v2",
     "embedding_dim": 384,#768,
@@ -8,6 +21,7 @@ ApiConfig = {
     "top_k_situations": 2,
     "threshold": 0.6,
     "situation_threshold": 0.8,
+    "rule_aggregation": "sum", # chunk similarities per rule: "sum", "max" or "mean"
     "model": "gpt-4o-mini",
     "temperature": 0.0,
     "max_length": 4096,
@@ -16,6 +30,31 @@ ApiConfig = {
     "casebook_index_path": str(data_dir) + "/roberta/embeddings/casebook_faiss_index.index",
     "casebook_chunk_mapping_path": str(data_dir) + "/roberta/embeddings/casebook_chunk_mapping.pkl",
     "rulebook_path": str(data_dir) + "/json/rules/rules_for_embedding.json",
+    "index_search_params": {"ef_search": 64, "nprobe": 8, "k_factor": 4}, # only used by HNSW and IVF indices (k_factor: IVF-PQ with refine)
+    "mapping_mmap": True, # memory-map the columnar chunk mappings (shared pages between workers)
+    "index_mmap": True, # memory-map the FAISS indexes read-only (shared pages between workers), all index types need faiss-cpu >= 1.11
+    "hybrid_retrieval": True, # fuse BM25 keyword hits with the FAISS hits (reciprocal rank fusion)
+    "bm25_top_k": 10, # BM25 hits per corpus taken into the fusion
+    "rrf_k": 60, # rank constant of the reciprocal rank fusion, higher = flatter weighting of the ranks
+    "bm25_min_score": 8.0, # rules/situations found only by BM25 need this score (a single common word scores ~4-7)
+    "reference_routing": True, # lookups of rules/situations ("What does Rule 4.1 say?") skip embedding and vector search, other questions get the named rules first
+    "reference_max_rules": 10, # more resolved rules (e.g. a whole rule with many subrules) use the normal retrieval
+    "index_search_threads": 0, # threads searching the casebook parallel to the rulebook, 0 = sequential (faster for these indexes, see test/multi_index_search_benchmark.py), None = by CPU cores
+    "retrieval_workers": 4, # threads for embedding and FAISS search of async requests
+    "batch_max_questions": 500, # questions per /ask/batch request
+    "batch_max_concurrency": 8, # parallel OpenAI requests of one /ask/batch request
+    "segmenter": "parser", # sentence segmentation of long queries, must match EmbeddingConfig["segmenter"] so queries are chunked like the rulebook
+    "query_embedding_cache_size": 4096, # query embeddings kept in memory per worker
+    "query_embedding_cache_path": str(data_dir) + "/cache/query_embedding_cache.sqlite", # shared by all workers, None = memory only
+    "answer_cache_size": 2048, # complete answers of requests with temperature 0, 0 = disabled
+    "answer_cache_ttl": 86400, # seconds a cached answer is reused
+    "answer_cache_path": str(data_dir) + "/cache/answer_cache.sqlite", # survives restarts, None = in-process only
+    "openai_client_pool_size": 64, # API keys with long-lived OpenAI clients (kept-alive connections) per worker
+    "openai_timeout": None, # seconds until an OpenAI request times out, None = SDK default (600 s), long completions take minutes
+    "api_key_cache_size": 1024,
+    "api_key_cache_ttl": 900, # seconds a validated OpenAI key is trusted without asking OpenAI again
+    "api_key_cache_negative_ttl": 30, # seconds a rejected OpenAI key stays rejected
+    "api_key_cache_path": str(data_dir) + "/cache/api_key_cache.sqlite", # shared by all workers, None = per process
 }
 
 EmbeddingConfig = {
@@ -29,5 +68,15 @@ EmbeddingConfig = {
     "casebook_chunk_mapping_path": str(data_dir) + "/roberta/embeddings/casebook_chunk_mapping.pkl",
     "max_tokens": 256,
     "overlap": 1,
+    "segmenter": "parser", # sentence segmentation of the rulebook, only "parser" is validated: "senter" and "rules" need the chunk differences of test/segmentation_parity_report.py first
     "embedding_dim": 384, # see: https://huggingface.co/sentence-transformers/all-MiniLM-L6-v2
+    "index_type": "flat", # rulebook index: "flat" (exact), "flat_fp16", "flat_sq8", "hnsw", "ivf_flat" or "ivf_pq", see test/ann_index_benchmark.py and test/quantized_index_report.py
+    "casebook_index_type": "flat",
+    "index_params": {"hnsw_m": 32, "ef_construction": 200, "nlist": 100, "pq_m": 48, "pq_nbits": 8,
+                     "refine": None}, # refine: "flat", "fp16" or "sq8" vectors re-rank the IVF-PQ shortlist
+    "incremental_build": True, # only new or changed rules/situations are embedded again, False = full rebuild
+    "embedding_cache_dir": str(data_dir) + "/cache/embeddings", # chunk embeddings per model and text, None = no cache
+    "embedding_cache_dtype": "float32", # "float16" halves the cache size, the embeddings are rounded
+    "embed_batch_size": 1024, # chunks encoded and added to the index at once, bounds the memory of a build
+    "chunk_processes": 1, # worker processes chunking the rulebook (at most the CPU cores), 1 = in the build process, see test/parallel_chunking_benchmark.py
 }
\ No newline at end of file
@@ -1,17 +1,27 @@
 ﻿from sentence_transformers import SentenceTransformer
 
+from .cache import EmbeddingCache
+
 class Embedder:
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", cache_dir: str = None,
+                 cache_dtype: str = "float32"):
         """
         :param model_name: Name of the pretrained model from the Sentence-Transformers library.
+        :param cache_dir: Directory of the persistent embedding cache, so repeated builds only encode new texts
+                          (None = no cache), see EmbeddingCache.
+        :param cache_dtype: Storage type of the cached embeddings, "float32" or "float16".
         """
         self.model = SentenceTransformer(model_name)
+        self._cache = EmbeddingCache(cache_dir, model_name, dtype=cache_dtype) if cache_dir else None
 
-    def embed(self, texts):
+    def embed(self, texts, show_progress_bar: bool = True):
         """
         Generates embeddings for a list of texts or text chunks.
         :param texts: List of texts or text chunks.
+        :param show_progress_bar: Show the progress of the encoding, e.g. off for the batches of a streaming build.
         :return: numpy array with embedding vectors.
         """
-        embeddings = self.model.encode(texts, show_progress_bar=True)
+        if self._cache is not None:
+            return self._cache.embed(texts, lambda missing: self.model.encode(missing, show_progress_bar=show_progress_bar))
+        embeddings = self.model.encode(texts, show_progress_bar=show_progress_bar)
         return embeddings
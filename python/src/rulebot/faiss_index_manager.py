@@ -1,59 +1,324 @@
 ﻿import faiss
 import numpy as np
 
+from .atomic_file import write_atomically
+
+# supported index types, see FaissIndexManager
+INDEX_TYPES = ("flat", "flat_fp16", "flat_sq8", "hnsw", "ivf_flat", "ivf_pq")
+
+# scalar quantizers of the flat index types that store compressed vectors
+SCALAR_QUANTIZERS = {"flat_fp16": faiss.ScalarQuantizer.QT_fp16, "flat_sq8": faiss.ScalarQuantizer.QT_8bit}
+
+# storage of the vectors that re-rank the IVF-PQ shortlist (index_params["refine"]), as index_factory names it
+REFINE_STORAGES = {"flat": "Flat", "fp16": "SQfp16", "sq8": "SQ8"}
+
+# build and search parameters of the approximate indices, unused parameters are ignored
+DEFAULT_INDEX_PARAMS = {
+    "hnsw_m": 32,            # HNSW: neighbors per node
+    "ef_construction": 200,  # HNSW: candidate list size while building
+    "ef_search": 64,         # HNSW: candidate list size while searching (higher = better recall, slower)
+    "nlist": 100,            # IVF: number of clusters
+    "nprobe": 8,             # IVF: clusters visited per search (higher = better recall, slower)
+    "pq_m": 48,              # IVF-PQ: sub-quantizers, must divide the embedding dimension
+    "pq_nbits": 8,           # IVF-PQ: bits per sub-quantizer code
+    "refine": None,          # IVF-PQ: re-rank the shortlist with "flat", "fp16" or "sq8" vectors, None = PQ distances
+    "k_factor": 4,           # IVF-PQ with refine: shortlist of k * k_factor candidates per search
+}
+
+# parameters that only affect the search, not the stored index, see FaissIndexManager.build_params
+SEARCH_PARAMS = ("ef_search", "nprobe", "k_factor")
+
+# maps the vectors of all index types from the file instead of copying them (IO_FLAG_MMAP_IFC, FAISS >= 1.11),
+# older FAISS versions only map the inverted lists of IVF indexes, all other index data is read into private memory
+MMAP_ALL_INDEX_TYPES = hasattr(faiss, "IO_FLAG_MMAP_IFC")
+MMAP_IO_FLAGS = (faiss.IO_FLAG_MMAP_IFC if MMAP_ALL_INDEX_TYPES else faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
 class FaissIndexManager:
-    def __init__(self, embedding_dim: int):
+    def __init__(self, embedding_dim: int, index_type: str = "flat", index_params: dict = None, id_map: bool = False):
         """
         Initializes the FAISS index with the given embedding dimension.
         :param embedding_dim: Dimension of the embedding vectors.
+        :param index_type: Type of the index, all of them use inner product (IP) on normalized vectors:
+            - "flat": exact search, scans all vectors (default).
+            - "flat_fp16": like "flat", the vectors are stored as float16 (half the memory, nearly exact).
+            - "flat_sq8": like "flat", every dimension is scalar-quantized to 8 bits (a quarter of the memory,
+                          needs training for the value ranges).
+            - "hnsw": graph based approximate search, no training needed.
+            - "ivf_flat": vectors are clustered, a search only scans the nprobe closest clusters (needs training).
+            - "ivf_pq": like "ivf_flat", but the vectors are compressed with product quantization (needs training).
+                        With index_params["refine"] the shortlist of the PQ codes is re-ranked with stored
+                        "flat" (float32), "fp16" or "sq8" vectors.
+        :param index_params: Build and search parameters, missing keys are taken from DEFAULT_INDEX_PARAMS.
+        :param id_map: Store an own ID per vector instead of its row number, so vectors can be removed and added
+                       without renumbering the others (incremental builds). Flat, HNSW and refined IVF-PQ
+                       indices are wrapped in an IndexIDMap2, IVF indices store the IDs in their inverted lists anyway.
         """
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}.")
+        refine = (index_params or {}).get("refine")
+        if refine is not None and refine not in REFINE_STORAGES:
+            raise ValueError(f"Unknown refine storage '{refine}', expected one of {tuple(REFINE_STORAGES)}.")
+
         self.embedding_dim = embedding_dim
-        # We use an index for exact search with inner product (IP).
-        self.index = faiss.IndexFlatIP(embedding_dim)
+        self.index_type = index_type
+        self.index_params = {**DEFAULT_INDEX_PARAMS, **(index_params or {})}
+        self.id_map = id_map
+        self.index = self._create_index()
+
+    @property
+    def build_params(self) -> dict:
+        """The index_params that determine the stored index, without the search parameters (SEARCH_PARAMS)."""
+        return {key: value for key, value in self.index_params.items() if key not in SEARCH_PARAMS}
 
-    def add_embeddings(self, embeddings: np.ndarray):
+    @property
+    def _is_refined(self) -> bool:
+        return self.index_type == "ivf_pq" and self.index_params["refine"] is not None
+
+    def _create_index(self):
+        index = self._create_storage_index()
+        # the IndexIDMap renumbering on removal expects the row numbers of flat storage, not for IVF lists;
+        # the refine vectors are looked up by row number, so a refined IVF-PQ index needs the IDMap as well
+        wrap = self.index_type in ("flat", "flat_fp16", "flat_sq8", "hnsw") or self._is_refined
+        return faiss.IndexIDMap2(index) if self.id_map and wrap else index
+
+    def _create_storage_index(self):
+        params = self.index_params
+        if self.index_type == "flat":
+            # We use an index for exact search with inner product (IP).
+            return faiss.IndexFlatIP(self.embedding_dim)
+
+        if self.index_type in SCALAR_QUANTIZERS:
+            return faiss.IndexScalarQuantizer(self.embedding_dim, SCALAR_QUANTIZERS[self.index_type],
+                                              faiss.METRIC_INNER_PRODUCT)
+
+        if self.index_type == "hnsw":
+            index = faiss.IndexHNSWFlat(self.embedding_dim, params["hnsw_m"], faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = params["ef_construction"]
+            return index
+
+        if self.index_type == "ivf_flat":
+            description = f"IVF{params['nlist']},Flat"
+        else:
+            description = f"IVF{params['nlist']},PQ{params['pq_m']}x{params['pq_nbits']}"
+            if params["refine"] is not None:
+                description += f",Refine({REFINE_STORAGES[params['refine']]})"
+        return faiss.index_factory(self.embedding_dim, description, faiss.METRIC_INNER_PRODUCT)
+
+    @staticmethod
+    def _detect_index_type(index) -> str:
+        if isinstance(index, faiss.IndexIDMap):
+            index = faiss.downcast_index(index.index)
+        if isinstance(index, faiss.IndexRefine):
+            index = faiss.downcast_index(index.base_index)
+        if isinstance(index, faiss.IndexHNSW):
+            return "hnsw"
+        if isinstance(index, faiss.IndexScalarQuantizer):
+            return next(index_type for index_type, qtype in SCALAR_QUANTIZERS.items() if qtype == index.sq.qtype)
+        ivf_index = faiss.try_extract_index_ivf(index)
+        if ivf_index is not None:
+            return "ivf_pq" if isinstance(faiss.downcast_index(ivf_index), faiss.IndexIVFPQ) else "ivf_flat"
+        return "flat"
+
+    @staticmethod
+    def _detect_refine(index):
+        if isinstance(index, faiss.IndexIDMap):
+            index = faiss.downcast_index(index.index)
+        if not isinstance(index, faiss.IndexRefine):
+            return None
+        refine_index = faiss.downcast_index(index.refine_index)
+        if isinstance(refine_index, faiss.IndexScalarQuantizer):
+            return "fp16" if refine_index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+        return "flat"
+
+    @staticmethod
+    def normalize(embeddings: np.ndarray, inplace: bool = False) -> np.ndarray:
         """
-        Adds a batch of embeddings to the index.
+        Normalizes the embeddings row-wise to unit length (float32), as the inner product index expects them.
         :param embeddings: NumPy array [of shape: (num_vectors, embedding_dim)].
+        :param inplace: Normalize the given array itself if it already is a contiguous float32 array,
+                        otherwise (and by default) a normalized copy is returned.
+        :return: The normalized embeddings.
         """
-        if embeddings.dtype != np.float32:
-            embeddings = embeddings.astype("float32")
+        if inplace:
+            embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        else:
+            embeddings = np.array(embeddings, dtype=np.float32, order="C")
+        faiss.normalize_L2(embeddings)
+        return embeddings
+
+    def _prepare(self, embeddings: np.ndarray, normalized: bool, inplace: bool = False) -> np.ndarray:
+        if normalized:
+            # pre-normalized contract of the caller, only the memory layout FAISS needs is ensured (no copy if it fits)
+            return np.ascontiguousarray(embeddings, dtype=np.float32)
+        return self.normalize(embeddings, inplace=inplace)
 
+    @property
+    def is_trained(self) -> bool:
+        return self.index.is_trained
+
+    @property
+    def training_size(self) -> int:
+        """
+        Number of vectors to collect for training an empty index (39 per IVF cluster or PQ centroid,
+        below that FAISS warns about poor clusters), 0 for index types without training.
+        """
+        if self.index_type == "flat_sq8":
+            # value range of every dimension, from a sample as large as for a codebook of 256 centroids
+            return 39 * 256
+        if self.index_type == "ivf_flat":
+            return 39 * self.index_params["nlist"]
+        if self.index_type == "ivf_pq":
+            return 39 * max(self.index_params["nlist"], 2 ** self.index_params["pq_nbits"])
+        return 0
+
+    def train(self, embeddings: np.ndarray, normalized: bool = False):
+        """
+        Trains the index (IVF clusters, PQ codebooks, 8-bit value ranges). Flat, float16 and HNSW indices
+        need no training.
+        A trained, still empty index can be saved with save_index and reused for later builds.
+        :param embeddings: Representative sample of the vectors [of shape: (num_vectors, embedding_dim)],
+                           at least nlist vectors (IVF) and 2^pq_nbits vectors (IVF-PQ).
+        :param normalized: The embeddings are already normalized, no normalized copy is made.
+        """
+        if self.index.is_trained:
+            return
+        self.index.train(self._prepare(embeddings, normalized))
+        print(f"FAISS index ({self.index_type}) was trained on {embeddings.shape[0]} vectors.")
+
+    def add_embeddings(self, embeddings: np.ndarray, normalized: bool = False, inplace: bool = False,
+                       ids: np.ndarray = None):
+        """
+        Adds a batch of embeddings to the index. An untrained index is trained on the batch first.
+        :param embeddings: NumPy array [of shape: (num_vectors, embedding_dim)].
+        :param normalized: The embeddings are already normalized (unit length), they are added as they are.
+        :param inplace: Normalize the given float32 array in place instead of a normalized copy of the
+                        whole batch (halves the peak memory of large builds, the caller's array is changed).
+        :param ids: IDs of the vectors [of shape: (num_vectors,)], only for an index with id_map.
+                    None = the vectors are numbered on from the current number of vectors.
+        """
         # Normalize embeddings row-wise
-        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
-        embeddings_norm = embeddings / norms
-        self.index.add(embeddings_norm)
+        embeddings_norm = self._prepare(embeddings, normalized, inplace)
+        if not self.index.is_trained:
+            self.train(embeddings_norm, normalized=True)
+        if ids is not None:
+            self.index.add_with_ids(embeddings_norm, np.ascontiguousarray(ids, dtype=np.int64))
+        else:
+            self.index.add(embeddings_norm)
         print(f"{embeddings_norm.shape[0]} vectors have been added to the FAISS index.")
 
+    @property
+    def ids(self) -> np.ndarray:
+        """IDs of the stored vectors, the row numbers for an index without id_map."""
+        if isinstance(self.index, faiss.IndexIDMap):
+            return faiss.vector_to_array(self.index.id_map)
+        ivf_index = faiss.try_extract_index_ivf(self.index)
+        if ivf_index is None:
+            return np.arange(self.index.ntotal, dtype=np.int64)
+        invlists = ivf_index.invlists
+        ids = []
+        for list_no in range(ivf_index.nlist):
+            list_ids = invlists.get_ids(list_no)
+            ids.append(faiss.rev_swig_ptr(list_ids, invlists.list_size(list_no)).copy())
+            invlists.release_ids(list_no, list_ids)
+        return np.concatenate(ids) if ids else np.empty(0, dtype=np.int64)
+
+    def remove_ids(self, ids) -> int:
+        """
+        Removes vectors from an index with id_map, unknown IDs are ignored.
+        HNSW graphs cannot delete nodes, so an HNSW index is rebuilt from its remaining vectors
+        (stored unquantized, nothing has to be embedded again). A refined IVF-PQ index cannot delete
+        vectors either, it is refilled from its refine vectors (the training is kept; the reconstructed
+        float16/8-bit vectors are encoded to the same codes again).
+        :param ids: IDs of the vectors to remove.
+        :return: Number of removed vectors.
+        """
+        if not self.id_map:
+            raise ValueError("Vectors can only be removed from an index created with id_map=True.")
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) == 0:
+            return 0
+
+        if self._is_refined:
+            stored_ids = self.ids
+            keep = ~np.isin(stored_ids, ids)
+            vectors = faiss.downcast_index(self.index.index).reconstruct_n(0, self.index.ntotal)[keep]
+            removed = int((~keep).sum())
+            self.index.reset()
+            if len(vectors) > 0:
+                self.index.add_with_ids(vectors, stored_ids[keep])
+        elif self.index_type != "hnsw":
+            removed = self.index.remove_ids(ids)
+        else:
+            stored_ids = self.ids
+            keep = ~np.isin(stored_ids, ids)
+            vectors = faiss.downcast_index(self.index.index).reconstruct_n(0, self.index.ntotal)[keep]
+            removed = int((~keep).sum())
+            self.index = self._create_index()
+            if len(vectors) > 0:
+                self.index.add_with_ids(vectors, stored_ids[keep])
+        print(f"{removed} vectors have been removed from the FAISS index.")
+        return removed
+
     def save_index(self, index_path: str):
         """
         Saves the FAISS index to disk.
+        The file is replaced atomically, so workers that memory-mapped the old file keep a valid mapping,
+        and concurrent builds write to their own temporary files (see write_atomically).
         :param index_path: Path to the index file (e.g., 'faiss_index.index').
         """
-        faiss.write_index(self.index, index_path)
+        write_atomically(index_path, lambda path: faiss.write_index(self.index, path))
         print(f"FAISS index was saved to '{index_path}'.")
 
-    def load_index(self, index_path: str):
+    def load_index(self, index_path: str, mmap: bool = False):
         """
-        Loads a FAISS index from disk.
+        Loads a FAISS index from disk. The index type (and the refine storage) is taken from the file,
+        the search parameters (ef_search, nprobe, k_factor) from index_params.
         :param index_path: Path to the saved index file.
+        :param mmap: Memory-map the index read-only instead of reading it into private memory, so all
+                     worker processes share the pages of the OS page cache. A mapped index cannot be extended.
+                     FAISS before 1.11 only maps IVF indexes without refine, the others are read as without mmap.
         """
-        self.index = faiss.read_index(index_path)
-        print(f"FAISS index was loaded from '{index_path}'.")
+        self.index = faiss.read_index(index_path, MMAP_IO_FLAGS if mmap else 0)
+        self.index_type = self._detect_index_type(self.index)
+        self.index_params["refine"] = self._detect_refine(self.index)
+        self.id_map = isinstance(self.index, faiss.IndexIDMap) or \
+            (self.index_type in ("ivf_flat", "ivf_pq") and not self._is_refined)
+        if mmap and not MMAP_ALL_INDEX_TYPES and not (self.index_type in ("ivf_flat", "ivf_pq") and not self._is_refined):
+            print(f"Warning: FAISS {faiss.__version__} cannot memory-map {self.index_type} indexes (needs FAISS >= 1.11), "
+                  f"the index is read into private memory of every worker.")
+            mmap = False
+        print(f"FAISS index ({self.index_type}) was {'memory-mapped' if mmap else 'loaded'} from '{index_path}'.")
 
-    def search(self, query_embeddings: np.ndarray, k: int = 5):
+    def _search_parameters(self, ef_search: int = None, nprobe: int = None, k_factor: int = None):
+        # passed per search instead of set on the index, so parallel searches can use different values
+        if self.index_type == "hnsw":
+            return faiss.SearchParametersHNSW(efSearch=ef_search or self.index_params["ef_search"])
+        if self.index_type in ("ivf_flat", "ivf_pq"):
+            ivf_params = faiss.SearchParametersIVF(nprobe=nprobe or self.index_params["nprobe"])
+            if not self._is_refined:
+                return ivf_params
+            params = faiss.IndexRefineSearchParameters(k_factor=k_factor or self.index_params["k_factor"],
+                                                       base_index_params=ivf_params)
+            params.ivf_params = ivf_params  # the C++ struct only points to it
+            return params
+        return None
+
+    def search(self, query_embeddings: np.ndarray, k: int = 5, ef_search: int = None, nprobe: int = None,
+               normalized: bool = False, k_factor: int = None):
         """
         Searches the index and returns the k nearest neighbors.
         The query embeddings are also normalized.
         :param query_embeddings: NumPy array [of shape: (num_queries, embedding_dim)].
         :param k: Number of nearest neighbors to retrieve.
+        :param ef_search: HNSW candidate list size for this search, index_params["ef_search"] if None.
+        :param nprobe: Number of visited IVF clusters for this search, index_params["nprobe"] if None.
+        :param k_factor: Shortlist factor of a refined IVF-PQ index for this search, index_params["k_factor"] if None.
+        :param normalized: The query embeddings are already normalized (e.g. by QueryEmbedder or MultiIndexSearch),
+                           the search then allocates no normalized copy.
         :return: Tuple (distances, indices), both as NumPy arrays.
         """
-        if query_embeddings.dtype != np.float32:
-            query_embeddings = query_embeddings.astype("float32")
-
-        # Normalize query embeddings
-        query_norms = np.linalg.norm(query_embeddings, axis=1, keepdims=True)
-        query_embeddings_norm = query_embeddings / query_norms
-        distances, indices = self.index.search(query_embeddings_norm, k)
+        # Normalize query embeddings (a copy, the caller's array is not changed)
+        query_embeddings_norm = self._prepare(query_embeddings, normalized)
+        distances, indices = self.index.search(query_embeddings_norm, k,
+                                               params=self._search_parameters(ef_search, nprobe, k_factor))
         return distances, indices
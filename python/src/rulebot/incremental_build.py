@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import pickle
+
+import numpy as np
+
+from .atomic_file import write_atomically
+from .chunk_mapping import ChunkMapping
+from .faiss_index_manager import FaissIndexManager
+
+
+class IncrementalIndexBuild:
+    def __init__(self, faiss_manager: FaissIndexManager, index_path: str, mapping_path: str, settings: dict,
+                 encode, incremental: bool = True, batch_size: int = 1024):
+        """
+        Incremental build of a FAISS index and its chunk mapping from a corpus of items (rules, situations).
+        A manifest next to the index stores the content hash and the vector IDs of every item, so a rebuild only
+        chunks and embeds new or changed items, removes the vectors of changed and deleted items and patches the
+        mapping. Vector IDs are never reused: a worker that loads the index and mapping of different builds
+        never maps a vector to the wrong chunk.
+        The texts stream through the encoder in batches and are added to the index batch by batch, so the
+        embeddings held in memory are bounded by the batch size (and the training sample of an empty IVF index)
+        instead of the corpus size.
+
+        Usage: call keep() or add() for every item of the corpus, then finish() and publish().
+
+        :param faiss_manager: Index manager created with id_map=True, the existing index is loaded into it.
+        :param index_path: Path of the FAISS index, the manifest is saved next to it (see manifest_path).
+        :param mapping_path: Path of the pickled mapping, the columnar mapping is saved next to it.
+        :param settings: Build settings (models, chunking, index type), all items are rebuilt if they changed.
+        :param encode: Function that embeds a list of texts, e.g. Embedder.embed.
+        :param incremental: False = full rebuild, the existing index and mapping are ignored.
+        :param batch_size: Number of texts encoded and added to the index at once.
+        """
+        self._faiss_manager = faiss_manager
+        self._index_path = index_path
+        self._mapping_path = mapping_path
+        self._encode = encode
+        self._batch_size = batch_size
+        self._settings = json.loads(json.dumps(settings))  # as stored in the manifest (tuples -> lists)
+
+        manifest = self._read_manifest()
+        # a full rebuild numbers on as well, so the IDs of previous builds are never reused
+        self._next_id = manifest["next_id"] if manifest else 0
+        if not incremental or not self._is_reusable(manifest):
+            manifest = None
+
+        self._stale_ids = set()
+        if manifest is None:
+            self._items = {}
+            self.mapping = {}
+            stored_ids = set()
+        else:
+            self._items = manifest["items"]
+            self._faiss_manager.load_index(index_path)
+            with open(mapping_path, "rb") as f:
+                self.mapping = pickle.load(f)
+            stored_ids = set(faiss_manager.ids.tolist())
+            # vectors of an interrupted update (saved index, but no manifest) are removed again
+            known_ids = {vector_id for item in self._items.values() for vector_id in item["ids"]}
+            self._stale_ids = stored_ids - known_ids
+            # new vectors are numbered past them, they are removed after the new vectors are added
+            self._next_id = max(self._next_id, max(stored_ids, default=-1) + 1)
+
+        self._stored_ids = stored_ids
+        self._new_items = {}
+        self._kept_keys = set()
+        # texts waiting for the encoder, with their vector IDs and mapping entries
+        self._pending_texts = []
+        self._pending_ids = []
+        self._pending_entries = []
+        # encoded batches kept until an empty IVF index has enough vectors for its training
+        self._training_batches = []
+        self.num_added = 0
+
+    @staticmethod
+    def manifest_path(index_path: str) -> str:
+        return index_path + ".manifest.json"
+
+    @staticmethod
+    def content_hash(item) -> str:
+        """
+        :param item: JSON serializable item of the corpus (e.g. the rule dictionary of the rulebook file).
+        :return: SHA-256 hash of the item, independent of the key order.
+        """
+        return hashlib.sha256(json.dumps(item, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def _read_manifest(self):
+        manifest_path = self.manifest_path(self._index_path)
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _is_reusable(self, manifest) -> bool:
+        if manifest is None or not os.path.exists(self._index_path) or not os.path.exists(self._mapping_path):
+            print("No previous build found, the index is built from scratch.")
+            return False
+        if manifest.get("settings") != self._settings:
+            print("The build settings have changed, the index is built from scratch.")
+            return False
+        return True
+
+    def keep(self, key: str, item) -> bool:
+        """
+        Keeps an item whose content has not changed since the previous build.
+        :param key: Unique key of the item (e.g. rule ID).
+        :param item: The item as stored in the corpus file, see content_hash.
+        :return: True if the item is unchanged and kept, False if it has to be chunked and passed to add().
+        """
+        previous = self._items.get(key)
+        if previous is None or previous["hash"] != self.content_hash(item) \
+                or not all(vector_id in self._stored_ids for vector_id in previous["ids"]):
+            return False
+        self._new_items[key] = previous
+        self._kept_keys.add(key)
+        return True
+
+    def add(self, key: str, item, texts: list, entries: list):
+        """
+        Adds a new or changed item.
+        :param key: Unique key of the item (e.g. rule ID).
+        :param item: The item as stored in the corpus file, see content_hash.
+        :param texts: Texts of the item to embed (e.g. its chunks).
+        :param entries: Mapping entry of every text.
+        """
+        ids = list(range(self._next_id, self._next_id + len(texts)))
+        self._next_id += len(texts)
+        self._new_items[key] = {"hash": self.content_hash(item), "ids": ids}
+        self._pending_texts.extend(texts)
+        self._pending_ids.extend(ids)
+        self._pending_entries.extend(entries)
+        if len(self._pending_texts) >= self._batch_size:
+            self._flush()
+
+    def _flush(self):
+        """Encodes the pending texts and adds them to the index and the mapping."""
+        if not self._pending_texts:
+            return
+        # normalized in place, the model output is not needed unnormalized
+        embeddings = FaissIndexManager.normalize(self._encode(self._pending_texts), inplace=True)
+        ids = np.array(self._pending_ids, dtype=np.int64)
+        self.mapping.update(zip(self._pending_ids, self._pending_entries))
+        self.num_added += len(ids)
+        self._pending_texts, self._pending_ids, self._pending_entries = [], [], []
+
+        if self._faiss_manager.is_trained:
+            self._faiss_manager.add_embeddings(embeddings, normalized=True, ids=ids)
+            return
+        self._training_batches.append((embeddings, ids))
+        if sum(len(batch_ids) for _, batch_ids in self._training_batches) >= self._faiss_manager.training_size:
+            self._train()
+
+    def _train(self):
+        """Trains an empty index on the collected batches and adds them."""
+        if not self._training_batches:
+            return
+        self._faiss_manager.train(np.concatenate([embeddings for embeddings, _ in self._training_batches]),
+                                  normalized=True)
+        for embeddings, ids in self._training_batches:
+            self._faiss_manager.add_embeddings(embeddings, normalized=True, ids=ids)
+        self._training_batches = []
+
+    def finish(self):
+        """
+        Adds the last batch (and trains an empty index that has not seen enough vectors yet) and removes
+        the vectors of changed and deleted items from the index and the mapping.
+        """
+        self._flush()
+        self._train()
+
+        removed_ids = sorted(vector_id for key, item in self._items.items() if key not in self._kept_keys
+                             for vector_id in item["ids"])
+        removed_ids.extend(sorted(self._stale_ids))
+        if removed_ids:
+            self._faiss_manager.remove_ids(removed_ids)
+        for vector_id in removed_ids:
+            self.mapping.pop(vector_id, None)
+
+        added = sum(1 for key in self._new_items if key not in self._items)
+        deleted = sum(1 for key in self._items if key not in self._new_items)
+        print(f"Build: {len(self._kept_keys)} items unchanged, {len(self._new_items) - len(self._kept_keys) - added} "
+              f"changed, {added} new, {deleted} deleted ({len(removed_ids)} vectors removed, "
+              f"{self.num_added} vectors added).")
+
+    def publish(self):
+        """
+        Saves the index, the mapping (pickle and columnar) and the manifest. Every file is written to a temporary
+        file and replaced atomically, the manifest last: an interrupted update is completed by the next build.
+        """
+        self._faiss_manager.save_index(self._index_path)
+
+        def write_mapping(path: str):
+            with open(path, "wb") as f:
+                pickle.dump(self.mapping, f)
+
+        def write_manifest(path: str):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"settings": self._settings, "next_id": self._next_id, "items": self._new_items}, f)
+
+        write_atomically(self._mapping_path, write_mapping)
+        print(f"Mapping saved to '{self._mapping_path}'.")
+        # columnar mapping loaded by the Retriever, saved after the pickle so it is not converted again
+        ChunkMapping.from_dict(self.mapping).save(self._mapping_path)
+
+        manifest_path = self.manifest_path(self._index_path)
+        write_atomically(manifest_path, write_manifest)
+        print(f"Build manifest saved to '{manifest_path}'.")
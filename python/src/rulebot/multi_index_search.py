@@ -0,0 +1,67 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .faiss_index_manager import FaissIndexManager
+
+
+class MultiIndexSearch:
+    def __init__(self, indexes: dict, max_workers: int = 0):
+        """
+        Searches several FAISS indexes (e.g. rulebook and casebook) with the same query embeddings.
+        The query embeddings are normalized once for all indexes. Optionally the indexes are searched in parallel
+        threads (FAISS releases the GIL while searching); for the small rulebook and casebook indexes the thread
+        hand-off costs more than it saves (test/multi_index_search_benchmark.py), so they are searched one after
+        the other by default. Further corpora are added as further indexes.
+
+        :param indexes: Mapping from corpus name to loaded FaissIndexManager, None entries are skipped.
+        :param max_workers: Threads for parallel searches, 0 (default) searches the indexes one after the other.
+                            None = one per index beyond the first (the first index is searched in the calling
+                            thread), limited by the CPU cores.
+        """
+        self._indexes = {name: index for name, index in indexes.items() if index is not None}
+        if max_workers is None:
+            max_workers = min(len(self._indexes) - 1, (os.cpu_count() or 1) - 1)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="index-search") \
+            if max_workers > 0 else None
+
+    @property
+    def names(self) -> list:
+        return list(self._indexes)
+
+    def search(self, query_embeddings: np.ndarray, k: dict, normalized: bool = False) -> dict:
+        """
+        Searches the given indexes with the same query embeddings.
+        :param query_embeddings: NumPy array [of shape: (num_queries, embedding_dim)].
+        :param k: Number of nearest neighbors per corpus name, e.g. {"rulebook": 10, "casebook": 2}.
+                  Only the named indexes are searched.
+        :param normalized: The query embeddings are already normalized (e.g. by QueryEmbedder), no copy is made.
+        :return: Dictionary from corpus name to the tuple (distances, indices) of FaissIndexManager.search.
+        """
+        unknown = set(k) - set(self._indexes)
+        if unknown:
+            raise ValueError(f"Unknown index names {sorted(unknown)}, expected some of {self.names}.")
+
+        query_embeddings_norm = np.ascontiguousarray(query_embeddings, dtype=np.float32) if normalized \
+            else FaissIndexManager.normalize(query_embeddings)
+        names = list(k)
+
+        futures = {}
+        if self._executor is not None:
+            futures = {name: self._executor.submit(self._indexes[name].search, query_embeddings_norm,
+                                                   k=k[name], normalized=True)
+                       for name in names[1:]}
+
+        results = {}
+        for name in names:
+            if name in futures:
+                results[name] = futures[name].result()
+            else:
+                results[name] = self._indexes[name].search(query_embeddings_norm, k=k[name], normalized=True)
+        return results
+
+    def close(self):
+        """Shuts down the search threads."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
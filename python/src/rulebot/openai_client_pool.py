@@ -0,0 +1,152 @@
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterator
+
+import openai
+
+from .config import ApiConfig
+
+
+class OpenAIClientPool:
+    def __init__(self, max_size: int = 64, timeout: float = None, max_retries: int = openai.DEFAULT_MAX_RETRIES,
+                 base_url: str = None):
+        """
+        Keeps one long-lived sync and async OpenAI client per API key. The clients hold their own
+        HTTP connection pool, so reusing them keeps the connections to OpenAI alive between requests
+        instead of paying TCP and TLS handshakes (and the client construction) for every call.
+        Keys are only stored as SHA-256 hashes, the least recently used clients are evicted first and closed
+        once the calls still using them have finished (see client and async_client).
+
+        :param max_size: Maximum number of API keys with open clients.
+        :param timeout: Request timeout of the clients in seconds, the SDK default (600 s read timeout) if None.
+                        Completions of up to 4096 tokens can take minutes, a timed out completion is retried
+                        and paid again.
+        :param max_retries: Retries of the clients on transient errors (SDK default 2).
+        :param base_url: Alternative OpenAI compatible endpoint, the official API is used if None.
+        """
+        self._max_size = max_size
+        self._timeout = timeout if timeout is not None else openai.DEFAULT_TIMEOUT
+        self._max_retries = max_retries
+        self._base_url = base_url
+        # key hash -> {"sync": OpenAI, "async": AsyncOpenAI, "in_use": calls using the clients, "evicted": bool}
+        self._clients = OrderedDict()
+        self._closing = set()  # tasks closing evicted async clients
+        self._lock = threading.Lock()
+        self._created = 0
+        self._reused = 0
+
+    @staticmethod
+    def _hash_key(api_key: str) -> str:
+        return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+
+    def _acquire(self, api_key: str, kind: str) -> tuple:
+        """
+        Takes the client of the key out for one call, evicted clients stay open until all their calls are released.
+        :return: Tuple (clients, client), the clients entry is passed to _release after the call.
+        """
+        key_hash = self._hash_key(api_key)
+        evicted = []
+        with self._lock:
+            clients = self._clients.setdefault(key_hash, {"in_use": 0, "evicted": False})
+            self._clients.move_to_end(key_hash)
+
+            client = clients.get(kind)
+            if client is None:
+                client_class = openai.OpenAI if kind == "sync" else openai.AsyncOpenAI
+                client = client_class(api_key=api_key, base_url=self._base_url,
+                                      timeout=self._timeout, max_retries=self._max_retries)
+                clients[kind] = client
+                self._created += 1
+            else:
+                self._reused += 1
+            clients["in_use"] += 1
+
+            while len(self._clients) > self._max_size:
+                old_clients = self._clients.popitem(last=False)[1]
+                old_clients["evicted"] = True
+                # clients still used by other calls are closed by the last _release
+                if old_clients["in_use"] == 0:
+                    evicted.append(old_clients)
+
+        for old_clients in evicted:
+            self._close_clients(old_clients)
+
+        return clients, client
+
+    def _release(self, clients: dict) -> bool:
+        """
+        Ends one call of _acquire.
+        :return: True if the clients were evicted meanwhile and this was their last call, the caller closes them.
+        """
+        with self._lock:
+            clients["in_use"] -= 1
+            return clients["evicted"] and clients["in_use"] == 0
+
+    @contextmanager
+    def client(self, api_key: str) -> Iterator[openai.OpenAI]:
+        """
+        The pooled synchronous client for the key, kept open until the with block ends even if it is evicted meanwhile.
+        :param api_key: The OpenAI API key.
+        """
+        clients, client = self._acquire(api_key, "sync")
+        try:
+            yield client
+        finally:
+            if self._release(clients):
+                self._close_clients(clients)
+
+    @asynccontextmanager
+    async def async_client(self, api_key: str) -> AsyncIterator[openai.AsyncOpenAI]:
+        """
+        The pooled async client for the key, kept open until the async with block ends even if it is evicted meanwhile.
+        :param api_key: The OpenAI API key.
+        """
+        clients, client = self._acquire(api_key, "async")
+        try:
+            yield client
+        finally:
+            if self._release(clients):
+                if "sync" in clients:
+                    clients["sync"].close()
+                await clients["async"].close()
+
+    def _close_clients(self, clients: dict):
+        if "sync" in clients:
+            clients["sync"].close()
+        if "async" in clients:
+            # the async client can only be closed inside an event loop, otherwise it is left to the garbage collector
+            try:
+                task = asyncio.get_running_loop().create_task(clients["async"].close())
+            except RuntimeError:
+                return
+            # the event loop only keeps weak references to its tasks
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    async def aclose(self):
+        """Closes all pooled clients and their connections, and waits for the closing of evicted clients."""
+        with self._lock:
+            all_clients = list(self._clients.values())
+            self._clients.clear()
+
+        for clients in all_clients:
+            if "sync" in clients:
+                clients["sync"].close()
+            if "async" in clients:
+                await clients["async"].close()
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
+
+    def stats(self) -> dict:
+        """
+        :return: Number of pooled keys, created clients and reused clients.
+        """
+        return {"size": len(self._clients), "max_size": self._max_size, "created": self._created, "reused": self._reused}
+
+
+# shared by the answer generation of all requests, only validated keys reach it (see auth.check_openai_api_key)
+client_pool = OpenAIClientPool(max_size=ApiConfig["openai_client_pool_size"],
+                               timeout=ApiConfig["openai_timeout"])
@@ -0,0 +1,66 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from transformers import AutoTokenizer
+
+from .text_chunker import TextChunker
+
+# chunker of a worker process, created once per process by _init_worker
+_worker_chunker = None
+
+
+def _init_worker(tokenizer_name: str, max_tokens: int, overlap: int, segmenter: str):
+    global _worker_chunker
+    _worker_chunker = TextChunker(AutoTokenizer.from_pretrained(tokenizer_name), max_tokens=max_tokens,
+                                  overlap=overlap, segmenter=segmenter)
+
+
+def _chunk_text(text: str) -> list:
+    return _worker_chunker.chunk_text(text)
+
+
+class ParallelTextChunker:
+    def __init__(self, tokenizer_name: str, max_tokens: int = 256, overlap: int = 0, segmenter: str = "parser",
+                 processes: int = 1, texts_per_task: int = 8):
+        """
+        Chunks many texts (e.g. the rules of an index build) with a pool of worker processes, each with its own
+        tokenizer and spaCy pipeline. The chunks are returned in the order of the texts, and a text is chunked
+        the same way in every process, so the chunks (and the vector IDs of a build) do not depend on the
+        number of processes.
+
+        :param tokenizer_name: Name of the Hugging Face tokenizer, loaded in every worker process.
+        :param max_tokens: Maximum number of tokens per chunk.
+        :param overlap: Number of overlapping sentences between consecutive chunks.
+        :param segmenter: Sentence segmentation backend ("parser", "senter" or "rules"), see TextChunker.
+        :param processes: Number of worker processes, 1 = chunking in the calling process without a pool.
+                          Limited to the CPU cores: on a single core the pool only adds the start of the workers.
+        :param texts_per_task: Texts sent to a worker at once (fewer round trips between the processes).
+        """
+        self.tokenizer_name = tokenizer_name
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+        self.segmenter = segmenter
+        self.processes = max(1, min(processes, os.cpu_count() or 1))
+        self.texts_per_task = texts_per_task
+        self._chunker = None
+
+    def chunk_texts(self, texts: list):
+        """
+        Splits the texts into chunks, see TextChunker.chunk_text.
+        :param texts: List of texts.
+        :return: Iterator over the list of chunks of every text, in the order of the texts.
+        """
+        processes = min(self.processes, len(texts))
+        if processes <= 1:
+            if self._chunker is None:
+                self._chunker = TextChunker(AutoTokenizer.from_pretrained(self.tokenizer_name), max_tokens=self.max_tokens,
+                                            overlap=self.overlap, segmenter=self.segmenter)
+            yield from (self._chunker.chunk_text(text) for text in texts)
+            return
+
+        # spawned, not forked: the build process already runs the threads of the embedding model
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker,
+                                 initargs=(self.tokenizer_name, self.max_tokens, self.overlap, self.segmenter)) as pool:
+            yield from pool.map(_chunk_text, texts, chunksize=self.texts_per_task)
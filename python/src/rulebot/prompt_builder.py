@@ -1,4 +1,5 @@
 ﻿from .rule_book_retriever import RuleBookRetriever
+from .rule_references import expand_rule_references, format_referenced_rules
 
 class PromptBuilder:
     def __init__(self, rulebook_retriever: RuleBookRetriever):
@@ -57,21 +58,12 @@ class PromptBuilder:
             answer = situation.get("answer")
             rule_reference = situation.get("rule_reference")
 
-            if rule_reference is None:
-                referenced_rules = "None"
-            else:
-                referenced_rules = ""
-                for reference in rule_reference:
-                    rule = self._rule_book_retriever.get_rule_by_id(reference)
-                    if rule:
-                        if rule['subrule_title'] and rule['subrule_title'] != rule['rule_title']:
-                            referenced_rules += f"{rule['rule_id']}: {rule['rule_title']} - {rule['subrule_title']}, "
-                        else:
-                            referenced_rules += f"{rule['rule_id']}: {rule['rule_title']}, "
-                    else:
-                        referenced_rules += f"{reference}, "
-
-            referenced_rules = referenced_rules.rstrip(", ")
+            referenced_rules = situation.get("referenced_rules_text")
+            if referenced_rules is None:
+                # casebook mapping without the references resolved at build time
+                referenced_rules = format_referenced_rules(
+                    expand_rule_references(self._rule_book_retriever, rule_reference)
+                    if rule_reference is not None else None)
 
             prompt += f"- RULE {rule_id} (Situation {situation_id}):\nSituation-Question: {question}\nSituation-Answer: {answer}\n(Referenced Rules: {referenced_rules})\n"
 
@@ -1,14 +1,20 @@
-﻿import numpy as np
+﻿import hashlib
+import numpy as np
 from sentence_transformers import SentenceTransformer
 from transformers import AutoTokenizer
 from .text_chunker import TextChunker
+from .cache import LRUCache, SqliteCache
 
 
 class QueryEmbedder:
     def __init__(self,
                  tokenizer_name: str = "sentence-transformers/all-MiniLM-L6-v2",
                  embedder_model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
-                 overlap: int = 1):
+                 overlap: int = 1,
+                 segmenter: str = "parser",
+                 cache_size: int = 1024,
+                 cache_path: str = None,
+                 disk_cache_size: int = 50000):
         """
         Initializes the query embedder with a SentenceTransformer model and a compatible Hugging Face tokenizer.
         A TextChunker is configured to automatically split long input queries into manageable chunks
@@ -17,16 +23,134 @@ class QueryEmbedder:
         :param tokenizer_name: Name of the Hugging Face tokenizer to use.
         :param embedder_model_name: Name of the SentenceTransformer model.
         :param overlap: Number of overlapping sentences between consecutive chunks.
+        :param segmenter: Sentence segmentation backend of the TextChunker ("parser", "senter" or "rules").
+        :param cache_size: Maximum number of query embeddings kept in memory (0 disables the cache).
+        :param cache_path: Optional SQLite file for a second, persistent cache level shared by all workers.
+        :param disk_cache_size: Maximum number of query embeddings kept in the persistent cache.
         """
+        self.embedder_model_name = embedder_model_name
         self.model = SentenceTransformer(embedder_model_name)
         self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
-        self.chunker = TextChunker(tokenizer=self.tokenizer, max_tokens=self.model.get_max_seq_length(), overlap=overlap)
+        self.chunker = TextChunker(tokenizer=self.tokenizer, max_tokens=self.model.get_max_seq_length(), overlap=overlap, segmenter=segmenter)
+
+        # the embedding depends on the model and on how long queries are chunked
+        self._cache_namespace = f"{embedder_model_name}|{self.chunker.max_tokens}|{overlap}|{segmenter}"
+        self._cache = LRUCache(max_size=cache_size) if cache_size > 0 else None
+        self._disk_cache = SqliteCache(cache_path, max_size=disk_cache_size, table="query_embeddings") if cache_path else None
+
+    @staticmethod
+    def normalize_query(query_text: str) -> str:
+        """
+        Normalizes a query for caching: surrounding whitespace is removed and inner whitespace collapsed.
+        :param query_text: The input user query string.
+        :return: The normalized query.
+        """
+        return " ".join(query_text.split())
+
+    def _cache_key(self, normalized_query: str) -> str:
+        # hashed, so long queries do not blow up the memory of the cache keys
+        return hashlib.sha256(f"{self._cache_namespace}|{normalized_query}".encode("utf-8")).hexdigest()
+
+    def cache_stats(self) -> dict:
+        """
+        :return: Hit/miss counters and sizes of the memory and disk cache (None if disabled).
+        """
+        return {
+            "memory": self._cache.stats() if self._cache is not None else None,
+            "disk": self._disk_cache.stats() if self._disk_cache is not None else None,
+        }
 
     def embed_query(self, query_text: str) -> np.ndarray:
         """
         Embeds the input query. If the query exceeds the token limit, it is chunked.
         The final embedding is the mean of all chunk embeddings.
+        Embeddings are cached by normalized query text, first in memory, then in the optional disk cache.
+
+        :param query_text: The input user query string.
+        :return: A normalized embedding vector of shape (1, embedding_dim).
+        """
+        query_text = self.normalize_query(query_text)
+        key = self._cache_key(query_text)
+
+        embedding = self._cache.get(key) if self._cache is not None else None
+        if embedding is None and self._disk_cache is not None:
+            embedding = self._disk_cache.get(key)
+            if embedding is not None and self._cache is not None:
+                self._cache.set(key, embedding)
+
+        if embedding is None:
+            embedding = self._encode_query(query_text)
+            if self._cache is not None:
+                self._cache.set(key, embedding)
+            if self._disk_cache is not None:
+                self._disk_cache.set(key, embedding)
+
+        # copy, so callers cannot modify the cached vector
+        return embedding.copy()
 
+    def embed_queries(self, query_texts: list) -> np.ndarray:
+        """
+        Embeds several queries at once. Cached queries are taken from the cache, the chunks of all
+        other queries are encoded in a single batched call of the SentenceTransformer model.
+
+        :param query_texts: List of input user query strings.
+        :return: Normalized embedding vectors of shape (len(query_texts), embedding_dim), in the order of the input.
+        """
+        query_texts = [self.normalize_query(query_text) for query_text in query_texts]
+        keys = [self._cache_key(query_text) for query_text in query_texts]
+
+        embeddings = {}
+        for key in set(keys):
+            embedding = self._cache.get(key) if self._cache is not None else None
+            if embedding is None and self._disk_cache is not None:
+                embedding = self._disk_cache.get(key)
+                if embedding is not None and self._cache is not None:
+                    self._cache.set(key, embedding)
+            if embedding is not None:
+                embeddings[key] = embedding
+
+        # duplicates are encoded only once
+        missing = {}
+        for key, query_text in zip(keys, query_texts):
+            if key not in embeddings:
+                missing.setdefault(key, query_text)
+
+        if missing:
+            for key, embedding in zip(missing, self._encode_queries(list(missing.values()))):
+                embedding = embedding.reshape(1, -1)
+                embeddings[key] = embedding
+                if self._cache is not None:
+                    self._cache.set(key, embedding)
+                if self._disk_cache is not None:
+                    self._disk_cache.set(key, embedding)
+
+        # new array, so callers cannot modify the cached vectors
+        return np.concatenate([embeddings[key] for key in keys], axis=0)
+
+    def _encode_queries(self, query_texts: list) -> np.ndarray:
+        """
+        Chunks all queries and encodes the chunks in one call of the SentenceTransformer model.
+        :param query_texts: List of input user query strings.
+        :return: Normalized embedding vectors of shape (len(query_texts), embedding_dim).
+        """
+        # an empty query still needs one (empty) chunk to keep the rows aligned
+        chunks_per_query = [self.chunker.chunk_text(query_text) or [query_text] for query_text in query_texts]
+        print(f"Anzahl erzeugter Chunks aus {len(query_texts)} Nutzereingaben (Fragen): {sum(map(len, chunks_per_query))}")
+
+        chunk_embeddings = self.model.encode([chunk for chunks in chunks_per_query for chunk in chunks],
+                                             show_progress_bar=False)
+
+        # average the chunk embeddings of each query
+        offsets = np.cumsum([0] + [len(chunks) for chunks in chunks_per_query[:-1]])
+        counts = np.array([len(chunks) for chunks in chunks_per_query])
+        mean_embeddings = np.add.reduceat(chunk_embeddings, offsets, axis=0) / counts[:, None]
+
+        norms = np.linalg.norm(mean_embeddings, axis=1, keepdims=True)
+        return (mean_embeddings / norms).astype("float32")
+
+    def _encode_query(self, query_text: str) -> np.ndarray:
+        """
+        Chunks and encodes the query with the SentenceTransformer model.
         :param query_text: The input user query string.
         :return: A normalized embedding vector of shape (1, embedding_dim).
         """
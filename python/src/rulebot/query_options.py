@@ -0,0 +1,41 @@
+from dataclasses import dataclass, replace
+
+from .config import ApiConfig
+
+
+@dataclass(frozen=True)
+class QueryOptions:
+    """
+    Immutable per-request settings for a single pipeline run.
+
+    The RagPipeline only keeps read-only shared state (indexes, mappings, embedder);
+    everything that may differ between two requests lives in this object and is passed
+    into RagPipeline.process_query, so parallel requests never see each other's settings.
+
+    :param openai_api_key: API key used for the answer generation of this request.
+    :param model: Name of the GPT model (e.g. "gpt-4o-mini").
+    :param top_k_chunks: Number of top rulebook chunks to retrieve.
+    :param top_k_rules: Number of top (complete) rules to use for the prompt.
+    :param top_k_situations: Number of top similar casebook situations to retrieve.
+    :param threshold: Similarity threshold for including rules in the top results.
+    :param situation_threshold: Similarity threshold for including casebook situations.
+    :param temperature: Sampling temperature for the OpenAI model.
+    :param max_length: Maximum number of tokens in the generated response.
+    """
+    openai_api_key: str
+    model: str = ApiConfig["model"]
+    top_k_chunks: int = ApiConfig["top_k_chunks"]
+    top_k_rules: int = ApiConfig["top_k_rules"]
+    top_k_situations: int = ApiConfig["top_k_situations"]
+    threshold: float = ApiConfig["threshold"]
+    situation_threshold: float = ApiConfig["situation_threshold"]
+    temperature: float = ApiConfig["temperature"]
+    max_length: int = ApiConfig["max_length"]
+
+    def with_changes(self, **changes) -> "QueryOptions":
+        """
+        Returns a copy of the options with the given fields replaced.
+        :param changes: Field names and their new values.
+        :return: New QueryOptions instance.
+        """
+        return replace(self, **changes)
@@ -1,10 +1,19 @@
-﻿from .config import EmbeddingConfig
+﻿import asyncio
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import EmbeddingConfig
 from .query_embedder import QueryEmbedder
 from .rule_book_retriever import RuleBookRetriever
+from .rule_references import ReferenceRouter
 from .faiss_index_manager import FaissIndexManager
 from .retriever import Retriever
 from .prompt_builder import PromptBuilder
 from .answer_generator import AnswerGenerator
+from .openai_client_pool import OpenAIClientPool
+from .query_options import QueryOptions
+from .cache import create_cache
 
 class RagPipeline:
     def __init__(self,
@@ -23,9 +32,31 @@ class RagPipeline:
                  mapping_path: str = EmbeddingConfig["chunk_mapping_path"],
                  casebook_index_path: str = EmbeddingConfig["casebook_index_output_path"],
                  casebook_mapping_path: str = EmbeddingConfig["casebook_chunk_mapping_path"],
+                 retrieval_workers: int = 4,
+                 segmenter: str = EmbeddingConfig["segmenter"],
+                 query_cache_size: int = 1024,
+                 query_cache_path: str = None,
+                 answer_cache_size: int = 1024,
+                 answer_cache_ttl: float = 86400,
+                 answer_cache_path: str = None,
+                 client_pool: OpenAIClientPool = None,
+                 batch_max_concurrency: int = 8,
+                 mapping_mmap: bool = True,
+                 rule_aggregation: str = "sum",
+                 index_search_params: dict = None,
+                 index_mmap: bool = False,
+                 index_search_threads: int = 0,
+                 hybrid_retrieval: bool = False,
+                 bm25_top_k: int = 10,
+                 rrf_k: int = 60,
+                 bm25_min_score: float = 8.0,
+                 reference_routing: bool = False,
+                 reference_max_rules: int = 10,
                  ):
         """
         Initializes the RAG pipeline with retrieval, embedding, prompt building, and answer generation components.
+        Loaded indexes, mappings and the embedder are shared read-only state. The query related parameters only
+        form the default QueryOptions, a request can pass its own options to process_query.
 
         :param openai_api_key: API key for accessing the OpenAI GPT model.
         :param embedder_model_name: Name of the SentenceTransformer model used for embeddings (e.g., "sentence-transformers/all-MiniLM-L6-v2").
@@ -42,85 +73,317 @@ class RagPipeline:
         :param mapping_path: Path to the pickle file storing the mapping of rulebook chunks.
         :param casebook_index_path: Path to the FAISS index for situation handbook situations.
         :param casebook_mapping_path: Path to the pickle file storing the mapping of situation handbook situations.
+        :param retrieval_workers: Size of the thread pool used by process_query_async for embedding and search.
+        :param segmenter: Sentence segmentation backend used to chunk long queries ("parser", "senter" or "rules").
+        :param query_cache_size: Number of query embeddings cached in memory (0 disables the cache).
+        :param query_cache_path: Optional SQLite file for persistent query embeddings shared by all workers.
+        :param answer_cache_size: Number of complete answers cached (0 disables the cache). Only requests with
+                                  temperature 0 are cached, since only those give reproducible answers.
+        :param answer_cache_ttl: Time in seconds a cached answer is reused.
+        :param answer_cache_path: Optional SQLite file to keep cached answers across restarts and share them
+                                  between workers, answers are cached in memory if None.
+        :param client_pool: Pool of long-lived OpenAI clients per API key, the shared pool is used if None.
+        :param batch_max_concurrency: Maximum number of parallel OpenAI requests of process_queries.
+        :param mapping_mmap: Memory-map the columnar chunk mappings, so all workers share the same pages.
+        :param rule_aggregation: How the chunk similarities of a rule are combined ("sum", "max" or "mean").
+        :param index_search_params: Search parameters of approximate indices ("ef_search", "nprobe", "k_factor"),
+                                    the index type itself is read from the index files.
+        :param index_mmap: Memory-map the FAISS indexes read-only, so all workers share the same pages.
+        :param index_search_threads: Threads searching the casebook index in parallel to the rulebook index,
+                                     0 (default) searches them one after the other, None = chosen by the CPU cores.
+        :param hybrid_retrieval: Fuse the FAISS results with BM25 keyword hits over the rules and situations.
+        :param bm25_top_k: Number of BM25 rule hits taken into the fusion.
+        :param rrf_k: Rank constant of the reciprocal rank fusion.
+        :param bm25_min_score: Minimum BM25 score of rules and situations found only by the keyword search.
+        :param reference_routing: Lookup questions naming rules or situations outright ("Rule 4.1", "Situation 5.1")
+                                  get the referenced rules and situations directly, without embedding and vector
+                                  search. Other questions naming rules or situations get them in front of the
+                                  retrieved ones.
+        :param reference_max_rules: Questions whose references resolve to more rules use the normal retrieval.
         """
-        self._openai_api_key = openai_api_key
         self._embedder_model_name = embedder_model_name
         self._embedding_dim = embedding_dim
-        self._top_k_chunks = top_k_chunks
-        self._top_k_rules = top_k_rules
-        self._top_k_situations = top_k_situations
-        self._threshold = threshold
-        self._situation_threshold = situation_threshold
-        self._model = model
-        self._temperature = temperature
-        self._max_length = max_length
+        self._default_options = QueryOptions(
+            openai_api_key=openai_api_key,
+            model=model,
+            top_k_chunks=top_k_chunks,
+            top_k_rules=top_k_rules,
+            top_k_situations=top_k_situations,
+            threshold=threshold,
+            situation_threshold=situation_threshold,
+            temperature=temperature,
+            max_length=max_length)
         self._index_path = index_path
         self._mapping_path = mapping_path
         self._casebook_index_path = casebook_index_path
         self._casebook_mapping_path = casebook_mapping_path
 
-        self._faiss_manager = FaissIndexManager(embedding_dim)
-        self._faiss_manager.load_index(index_path)
+        self._faiss_manager = FaissIndexManager(embedding_dim, index_params=index_search_params)
+        self._faiss_manager.load_index(index_path, mmap=index_mmap)
 
-        self._mapping_rulebook = Retriever.load_mapping(mapping_path)
+        self._mapping_rulebook = Retriever.load_mapping(mapping_path, mmap=mapping_mmap)
 
-        self._faiss_manager_casebook = FaissIndexManager(embedding_dim)
-        self._faiss_manager_casebook.load_index(casebook_index_path)
+        self._faiss_manager_casebook = FaissIndexManager(embedding_dim, index_params=index_search_params)
+        self._faiss_manager_casebook.load_index(casebook_index_path, mmap=index_mmap)
 
-        self._mapping_casebook = Retriever.load_mapping(casebook_mapping_path)
+        self._mapping_casebook = Retriever.load_mapping(casebook_mapping_path, mmap=mapping_mmap)
 
         self._query_embedder = QueryEmbedder(tokenizer_name=EmbeddingConfig["tokenizer_model_name"],
                                              embedder_model_name=self._embedder_model_name,
-                                             overlap=EmbeddingConfig["overlap"])
+                                             overlap=EmbeddingConfig["overlap"],
+                                             segmenter=segmenter,
+                                             cache_size=query_cache_size,
+                                             cache_path=query_cache_path)
 
         self._rulebook_retriever = RuleBookRetriever(EmbeddingConfig["rulebook_path"])
         self._prompt_builder = PromptBuilder(rulebook_retriever=self._rulebook_retriever)
 
-    def process_query(self, query_text: str):
+        # created once, the hot path of a request only passes its options
+        self._retriever = Retriever(
+            embedding_dim=self._embedding_dim,
+            rulebook_index=self._faiss_manager,
+            casebook_index=self._faiss_manager_casebook,
+            rulebook_mapping=self._mapping_rulebook,
+            casebook_mapping=self._mapping_casebook,
+            rulebook_retriever=self._rulebook_retriever,
+            search_threads=index_search_threads,
+            lexical_search=hybrid_retrieval
+        )
+        self._answer_generator = AnswerGenerator(client_pool=client_pool)
+        self._reference_router = ReferenceRouter(self._rulebook_retriever, self._mapping_casebook,
+                                                 max_rules=reference_max_rules) if reference_routing else None
+
+        # cached answers are only valid for the loaded indexes, mappings, rulebook and system prompt
+        self._index_version = self._fingerprint([index_path, mapping_path, casebook_index_path, casebook_mapping_path,
+                                                 EmbeddingConfig["rulebook_path"]],
+                                                extra=AnswerGenerator.SYSTEM_PROMPT + embedder_model_name + rule_aggregation
+                                                      + json.dumps(index_search_params, sort_keys=True)
+                                                      + json.dumps([hybrid_retrieval, bm25_top_k, rrf_k, bm25_min_score,
+                                                                    reference_routing, reference_max_rules]))
+        self._answer_cache = create_cache(max_size=answer_cache_size, ttl=answer_cache_ttl, path=answer_cache_path,
+                                          table="answers") if answer_cache_size > 0 else None
+
+        self._batch_max_concurrency = batch_max_concurrency
+        self._rule_aggregation = rule_aggregation
+        self._hybrid_retrieval = hybrid_retrieval
+        self._bm25_top_k = bm25_top_k
+        self._rrf_k = rrf_k
+        self._bm25_min_score = bm25_min_score
+
+        # bounded pool for the CPU bound part (chunking, embedding, FAISS search) of async requests
+        self._retrieval_executor = ThreadPoolExecutor(max_workers=retrieval_workers, thread_name_prefix="retrieval")
+
+    @property
+    def embedder_model_name(self) -> str:
+        return self._embedder_model_name
+
+    @property
+    def embedding_dim(self) -> int:
+        return self._embedding_dim
+
+    @property
+    def default_options(self) -> QueryOptions:
+        return self._default_options
+
+    def cache_stats(self) -> dict:
         """
-        Executes the pipeline steps: retrieval, prompt creation, and generation.
-        :param query_text: The user's question.
-        :return: Tuple (generated_answer, prompt, retrieved_all_rules, retrieved_top_rules, retrieved_situations)
+        :return: Hit/miss counters of the pipeline caches.
+        """
+        return {
+            "query_embeddings": self._query_embedder.cache_stats(),
+            "answers": self._answer_cache.stats() if self._answer_cache is not None else None,
+        }
+
+    @staticmethod
+    def _fingerprint(paths: list, extra: str = "") -> str:
+        """
+        Hashes the content of the given files.
+        :return: Hex digest that changes as soon as one of the files changes.
+        """
+        digest = hashlib.sha256(extra.encode("utf-8"))
+        for path in paths:
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+        return digest.hexdigest()
+
+    def _answer_cache_key(self, query_text: str, options: QueryOptions):
+        """
+        Builds the answer cache key from the normalized question, everything that influences retrieval and
+        generation, and the index version.
+        :return: The key or None if the answer must not be cached (cache disabled or temperature above zero).
         """
+        if self._answer_cache is None or options.temperature > 0:
+            return None
+
+        key = json.dumps([
+            QueryEmbedder.normalize_query(query_text),
+            options.model,
+            options.top_k_chunks,
+            options.top_k_rules,
+            options.top_k_situations,
+            options.threshold,
+            options.situation_threshold,
+            options.max_length,
+            self._index_version,
+        ])
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _get_cached_answer(self, cache_key):
+        return self._answer_cache.get(cache_key) if cache_key is not None else None
+
+    def _cache_answer(self, cache_key, response: dict, answer: str, prompt: str,
+                      retrieved_all_rules: list, retrieved_top_rules: list, retrieved_situations: list):
+        # failed generations are not cached, the next request should try again
+        if cache_key is None or not response["success"]:
+            return
+
+        self._answer_cache.set(cache_key, {
+            "generated_answer": response["answer"],
+            "answer": answer,
+            "prompt": prompt,
+            "retrieved_all_rules": retrieved_all_rules,
+            "retrieved_top_rules": retrieved_top_rules,
+            "retrieved_situations": retrieved_situations,
+        })
+
+    @staticmethod
+    def _cached_result(cached: dict) -> tuple:
+        return (cached["answer"], cached["prompt"], cached["retrieved_all_rules"],
+                cached["retrieved_top_rules"], cached["retrieved_situations"])
+
+    def close(self):
+        """Shuts down the retrieval thread pools."""
+        self._retrieval_executor.shutdown(wait=False)
+        self._retriever.close()
+
+    @staticmethod
+    def _print_options(options: QueryOptions):
         print("------ used configuration ------")
-        print("Model:", self._model)
-        print("Top k Chunks:", self._top_k_chunks)
-        print("Top k Rules:", self._top_k_rules)
-        print("Top k Situations:", self._top_k_situations)
-        print("Threshold:", self._threshold)
-        print("Situation Threshold:", self._situation_threshold)
-        print("Temperature:", self._temperature)
-        print("Max GPT Output-Length:", self._max_length)
+        print("Model:", options.model)
+        print("Top k Chunks:", options.top_k_chunks)
+        print("Top k Rules:", options.top_k_rules)
+        print("Top k Situations:", options.top_k_situations)
+        print("Threshold:", options.threshold)
+        print("Situation Threshold:", options.situation_threshold)
+        print("Temperature:", options.temperature)
+        print("Max GPT Output-Length:", options.max_length)
         print("--------------------------------")
 
+    def _retrieve(self, query_text: str, options: QueryOptions):
+        """
+        CPU bound part of the pipeline: query embedding, FAISS search and prompt creation.
+        :param query_text: The user's question.
+        :param options: Per-request settings.
+        :return: Tuple (prompt, retrieved_all_rules, retrieved_top_rules, retrieved_situations)
+        """
+        routed = self._route(query_text)
+        if routed is not None:
+            return routed
+
         query_embedding = self._query_embedder.embed_query(query_text)
 
-        retriever = Retriever(
-            embedding_dim=self._embedding_dim,
-            top_k_chunks=self._top_k_chunks,
-            top_k_rules=self._top_k_rules,
-            top_k_situations=self._top_k_situations,
-            threshold=self._threshold,
-            situation_threshold=self._situation_threshold,
-            rulebook_index=self._faiss_manager,
-            casebook_index=self._faiss_manager_casebook,
-            rulebook_mapping=self._mapping_rulebook,
-            casebook_mapping=self._mapping_casebook,
-            rulebook_retriever=self._rulebook_retriever
-        )
-        retrieved_chunks = retriever.retrieve_chunks(query_embedding)
-        retrieved_all_rules, retrieved_top_rules = retriever.retrieve_rules_from_chunks(retrieved_chunks)
-        retrieved_situations = retriever.retrieve_situations(query_embedding)
+        # QueryEmbedder returns normalized embeddings, the search does not normalize them again
+        similarities, rule_codes, situations_per_query = self._retriever.retrieve_batch(
+            query_embedding, options.top_k_chunks, options.top_k_situations, options.situation_threshold,
+            normalized=True)
+        retrieved_all_rules, retrieved_top_rules = self._retriever.retrieve_rules_from_hits(
+            similarities[0], rule_codes[0], options.top_k_rules, options.threshold, self._rule_aggregation)
+        retrieved_situations = situations_per_query[0]
+        if self._hybrid_retrieval:
+            retrieved_all_rules, retrieved_top_rules, retrieved_situations = self._fuse_lexical(
+                query_text, retrieved_all_rules, retrieved_situations, options)
+        retrieved_all_rules, retrieved_top_rules, retrieved_situations = self._add_references(
+            query_text, retrieved_all_rules, retrieved_top_rules, retrieved_situations)
+
+        prompt = self._prompt_builder.build_prompt(query_text, retrieved_top_rules, retrieved_situations)
 
+        return prompt, retrieved_all_rules, retrieved_top_rules, retrieved_situations
+
+    def _retrieve_batch(self, query_texts: list, options: QueryOptions) -> list:
+        """
+        Same as _retrieve for several questions: lookup questions with explicit references are routed (see _route),
+        all other questions are embedded in one batch and each index is searched once for all of them.
+        :param query_texts: The user's questions.
+        :param options: Settings shared by all questions.
+        :return: One tuple (prompt, retrieved_all_rules, retrieved_top_rules, retrieved_situations) per question.
+        """
+        results = [self._route(query_text) for query_text in query_texts]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if not missing:
+            return results
+
+        query_embeddings = self._query_embedder.embed_queries([query_texts[i] for i in missing])
+
+        similarities, rule_codes, situations_per_query = self._retriever.retrieve_batch(
+            query_embeddings, options.top_k_chunks, options.top_k_situations, options.situation_threshold,
+            normalized=True)
+
+        for i, query_similarities, query_rule_codes, retrieved_situations in zip(
+                missing, similarities, rule_codes, situations_per_query):
+            query_text = query_texts[i]
+            retrieved_all_rules, retrieved_top_rules = self._retriever.retrieve_rules_from_hits(
+                query_similarities, query_rule_codes, options.top_k_rules, options.threshold, self._rule_aggregation)
+            if self._hybrid_retrieval:
+                retrieved_all_rules, retrieved_top_rules, retrieved_situations = self._fuse_lexical(
+                    query_text, retrieved_all_rules, retrieved_situations, options)
+            retrieved_all_rules, retrieved_top_rules, retrieved_situations = self._add_references(
+                query_text, retrieved_all_rules, retrieved_top_rules, retrieved_situations)
+            prompt = self._prompt_builder.build_prompt(query_text, retrieved_top_rules, retrieved_situations)
+            results[i] = (prompt, retrieved_all_rules, retrieved_top_rules, retrieved_situations)
+
+        return results
+
+    def _route(self, query_text: str):
+        """
+        Fast path for lookup questions with explicit rule or situation references, see ReferenceRouter.route.
+        :return: Tuple (prompt, retrieved_all_rules, retrieved_top_rules, retrieved_situations) or None.
+        """
+        if self._reference_router is None:
+            return None
+        routed = self._reference_router.route(query_text)
+        if routed is None:
+            return None
+        retrieved_top_rules, retrieved_situations = routed
+        print(f"Explicit references, embedding and vector search skipped: "
+              f"{[rule['rule_id'] for rule in retrieved_top_rules] + [s['situation_id'] for s in retrieved_situations]}")
         prompt = self._prompt_builder.build_prompt(query_text, retrieved_top_rules, retrieved_situations)
+        return prompt, retrieved_top_rules, retrieved_top_rules, retrieved_situations
 
-        answer_generator = AnswerGenerator(
-            openai_api_key=self._openai_api_key,
-            model=self._model,
-            temperature=self._temperature,
-            max_length=self._max_length)
-        response = answer_generator.generate_answer(prompt)
+    def _add_references(self, query_text: str, retrieved_all_rules: list, retrieved_top_rules: list,
+                        retrieved_situations: list) -> tuple:
+        """
+        Puts the rules and situations a question names explicitly (see ReferenceRouter.resolve) in front of
+        the retrieved ones, for questions that are not routed as a pure lookup.
+        :return: Tuple (retrieved_all_rules, retrieved_top_rules, retrieved_situations).
+        """
+        resolved = self._reference_router.resolve(query_text) if self._reference_router is not None else None
+        if resolved is None:
+            return retrieved_all_rules, retrieved_top_rules, retrieved_situations
+        referenced_rules, referenced_situations = resolved
+        keys = {RuleBookRetriever.normalize_rule_id(rule["rule_id"]) for rule in referenced_rules}
+        situation_ids = {situation["situation_id"] for situation in referenced_situations}
+        return (referenced_rules + [rule for rule in retrieved_all_rules
+                                    if RuleBookRetriever.normalize_rule_id(rule["rule_id"]) not in keys],
+                referenced_rules + [rule for rule in retrieved_top_rules
+                                    if RuleBookRetriever.normalize_rule_id(rule["rule_id"]) not in keys],
+                referenced_situations + [situation for situation in retrieved_situations
+                                         if situation["situation_id"] not in situation_ids])
+
+    def _fuse_lexical(self, query_text: str, retrieved_all_rules: list, retrieved_situations: list,
+                      options: QueryOptions) -> tuple:
+        return self._retriever.fuse_lexical(query_text, retrieved_all_rules, retrieved_situations,
+                                            options.top_k_rules, options.threshold, options.top_k_situations,
+                                            lexical_top_k=self._bm25_top_k, rrf_k=self._rrf_k,
+                                            min_bm25_score=self._bm25_min_score)
 
+    @staticmethod
+    def _build_answer(response: dict, retrieved_all_rules: list, retrieved_top_rules: list, retrieved_situations: list) -> str:
+        """
+        Creates the final answer text from the response of the answer generator.
+        :param response: Dictionary with the keys "success" and "answer".
+        :return: The answer shown to the user.
+        """
         if response["success"]:
             answer = response["answer"]
 
@@ -142,8 +405,203 @@ class RagPipeline:
         else:
             answer = "Fehler aufgetreten: " + response["answer"]
 
+        return answer
+
+    def process_query(self, query_text: str, options: QueryOptions = None):
+        """
+        Executes the pipeline steps: retrieval, prompt creation, and generation.
+        The pipeline itself is not modified, so it is safe to call this method from parallel requests.
+        :param query_text: The user's question.
+        :param options: Per-request settings, the pipeline defaults are used if None.
+        :return: Tuple (generated_answer, prompt, retrieved_all_rules, retrieved_top_rules, retrieved_situations)
+        """
+        if options is None:
+            options = self._default_options
+        self._print_options(options)
+
+        cache_key = self._answer_cache_key(query_text, options)
+        cached = self._get_cached_answer(cache_key)
+        if cached is not None:
+            return self._cached_result(cached)
+
+        prompt, retrieved_all_rules, retrieved_top_rules, retrieved_situations = self._retrieve(query_text, options)
+
+        response = self._answer_generator.generate_answer(prompt, options)
+        answer = self._build_answer(response, retrieved_all_rules, retrieved_top_rules, retrieved_situations)
+        self._cache_answer(cache_key, response, answer, prompt, retrieved_all_rules, retrieved_top_rules, retrieved_situations)
+
+        return answer, prompt, retrieved_all_rules, retrieved_top_rules, retrieved_situations
+
+    async def process_query_async(self, query_text: str, options: QueryOptions = None):
+        """
+        Non-blocking variant of process_query for the API.
+        Embedding and search run in the bounded retrieval thread pool, the answer is generated
+        with the async OpenAI client, so the event loop keeps serving other requests meanwhile.
+        :param query_text: The user's question.
+        :param options: Per-request settings, the pipeline defaults are used if None.
+        :return: Tuple (generated_answer, prompt, retrieved_all_rules, retrieved_top_rules, retrieved_situations)
+        """
+        if options is None:
+            options = self._default_options
+        self._print_options(options)
+
+        cache_key = self._answer_cache_key(query_text, options)
+        cached = self._get_cached_answer(cache_key)
+        if cached is not None:
+            return self._cached_result(cached)
+
+        loop = asyncio.get_running_loop()
+        prompt, retrieved_all_rules, retrieved_top_rules, retrieved_situations = await loop.run_in_executor(
+            self._retrieval_executor, self._retrieve, query_text, options)
+
+        response = await self._answer_generator.generate_answer_async(prompt, options)
+        answer = self._build_answer(response, retrieved_all_rules, retrieved_top_rules, retrieved_situations)
+        self._cache_answer(cache_key, response, answer, prompt, retrieved_all_rules, retrieved_top_rules, retrieved_situations)
+
+        return answer, prompt, retrieved_all_rules, retrieved_top_rules, retrieved_situations
+
+    def process_queries(self, query_texts: list, options: QueryOptions = None) -> list:
+        """
+        Answers several questions with the same settings. Retrieval is done in one batch
+        (see _retrieve_batch), the answers are generated in parallel with at most
+        batch_max_concurrency simultaneous OpenAI requests.
+        :param query_texts: The user's questions.
+        :param options: Settings for all questions, the pipeline defaults are used if None.
+        :return: One tuple (generated_answer, prompt, retrieved_all_rules, retrieved_top_rules, retrieved_situations)
+                 per question, in the order of the questions.
+        """
+        if options is None:
+            options = self._default_options
+        self._print_options(options)
+
+        results, missing, cache_keys = self._cached_batch_results(query_texts, options)
+        if not missing:
+            return results
+
+        retrieved = self._retrieve_batch([query_texts[i] for i in missing], options)
+
+        with ThreadPoolExecutor(max_workers=self._batch_max_concurrency, thread_name_prefix="generation") as executor:
+            responses = list(executor.map(lambda context: self._answer_generator.generate_answer(context[0], options),
+                                          retrieved))
+
+        for i, context, response in zip(missing, retrieved, responses):
+            results[i] = self._finish_answer(cache_keys[i], response, *context)
+
+        return results
+
+    async def process_queries_async(self, query_texts: list, options: QueryOptions = None) -> list:
+        """
+        Non-blocking variant of process_queries for the API. The batched retrieval runs in the retrieval
+        thread pool, the answers are generated with the async OpenAI client and at most
+        batch_max_concurrency simultaneous requests.
+        :param query_texts: The user's questions.
+        :param options: Settings for all questions, the pipeline defaults are used if None.
+        :return: One tuple (generated_answer, prompt, retrieved_all_rules, retrieved_top_rules, retrieved_situations)
+                 per question, in the order of the questions.
+        """
+        if options is None:
+            options = self._default_options
+        self._print_options(options)
+
+        results, missing, cache_keys = self._cached_batch_results(query_texts, options)
+        if not missing:
+            return results
+
+        loop = asyncio.get_running_loop()
+        retrieved = await loop.run_in_executor(
+            self._retrieval_executor, self._retrieve_batch, [query_texts[i] for i in missing], options)
+
+        semaphore = asyncio.Semaphore(self._batch_max_concurrency)
+
+        async def generate(prompt: str) -> dict:
+            async with semaphore:
+                return await self._answer_generator.generate_answer_async(prompt, options)
+
+        responses = await asyncio.gather(*(generate(context[0]) for context in retrieved))
+
+        for i, context, response in zip(missing, retrieved, responses):
+            results[i] = self._finish_answer(cache_keys[i], response, *context)
+
+        return results
+
+    def _cached_batch_results(self, query_texts: list, options: QueryOptions) -> tuple:
+        """
+        Looks up the questions of a batch in the answer cache.
+        :return: Tuple (results, missing, cache_keys) with the cached result or None per question
+                 and the positions of the questions that have to be answered.
+        """
+        cache_keys = [self._answer_cache_key(query_text, options) for query_text in query_texts]
+        results = []
+        for cache_key in cache_keys:
+            cached = self._get_cached_answer(cache_key)
+            results.append(self._cached_result(cached) if cached is not None else None)
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        return results, missing, cache_keys
+
+    def _finish_answer(self, cache_key, response: dict, prompt: str,
+                       retrieved_all_rules: list, retrieved_top_rules: list, retrieved_situations: list) -> tuple:
+        answer = self._build_answer(response, retrieved_all_rules, retrieved_top_rules, retrieved_situations)
+        self._cache_answer(cache_key, response, answer, prompt, retrieved_all_rules, retrieved_top_rules, retrieved_situations)
         return answer, prompt, retrieved_all_rules, retrieved_top_rules, retrieved_situations
 
+    async def stream_query_async(self, query_text: str, options: QueryOptions = None):
+        """
+        Streaming variant of process_query_async. The retrieved context is emitted as soon as retrieval is done,
+        followed by the answer tokens as they arrive from the OpenAI API and a final sources event.
+        :param query_text: The user's question.
+        :param options: Per-request settings, the pipeline defaults are used if None.
+        :return: Async generator of (event, data) tuples:
+            - ("context", {"prompt", "retrieved_all_rules", "retrieved_top_rules", "retrieved_situations"})
+            - ("token", {"text"}) for each part of the answer
+            - ("error", {"answer"}) if the answer generation failed, this ends the stream
+            - ("sources", {"text", "answer"}) with the appended list of potentially relevant rules
+              (empty if context was found) and the complete answer, this ends the stream
+        """
+        if options is None:
+            options = self._default_options
+        self._print_options(options)
+
+        cache_key = self._answer_cache_key(query_text, options)
+        cached = self._get_cached_answer(cache_key)
+        if cached is not None:
+            yield "context", {
+                "prompt": cached["prompt"],
+                "retrieved_all_rules": cached["retrieved_all_rules"],
+                "retrieved_top_rules": cached["retrieved_top_rules"],
+                "retrieved_situations": cached["retrieved_situations"],
+            }
+            yield "token", {"text": cached["generated_answer"]}
+            yield "sources", {"text": cached["answer"][len(cached["generated_answer"]):], "answer": cached["answer"]}
+            return
+
+        loop = asyncio.get_running_loop()
+        prompt, retrieved_all_rules, retrieved_top_rules, retrieved_situations = await loop.run_in_executor(
+            self._retrieval_executor, self._retrieve, query_text, options)
+
+        yield "context", {
+            "prompt": prompt,
+            "retrieved_all_rules": retrieved_all_rules,
+            "retrieved_top_rules": retrieved_top_rules,
+            "retrieved_situations": retrieved_situations,
+        }
+
+        tokens = []
+        async for response in self._answer_generator.stream_answer_async(prompt, options):
+            if not response["success"]:
+                yield "error", {"answer": self._build_answer(response, retrieved_all_rules, retrieved_top_rules, retrieved_situations)}
+                return
+
+            tokens.append(response["token"])
+            yield "token", {"text": response["token"]}
+
+        response = {"success": True, "answer": "".join(tokens).strip()}
+        generated_answer = response["answer"]
+        answer = self._build_answer(response, retrieved_all_rules, retrieved_top_rules, retrieved_situations)
+        self._cache_answer(cache_key, response, answer, prompt, retrieved_all_rules, retrieved_top_rules, retrieved_situations)
+
+        yield "sources", {"text": answer[len(generated_answer):], "answer": answer}
+
 # example queries
 # "During the overtime, Team A is serving a minor penalty. The clock stops with 1:58 remaining in the period. Suddenly the Zamboni gate opens, and the ice crew comes onto the ice to shovel the excess snow. Is this permitted? Where do you find this in the rule book?"
 # "Are commercial breaks allowed during overtime?"
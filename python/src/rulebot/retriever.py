@@ -1,47 +1,45 @@
 ﻿import faiss
+import numpy as np
 from numpy import ndarray
-import pickle
 
+from .bm25_index import BM25Index, reciprocal_rank_fusion
+from .chunk_mapping import ChunkMapping
 from .faiss_index_manager import FaissIndexManager
+from .multi_index_search import MultiIndexSearch
 from .rule_book_retriever import RuleBookRetriever
-from typing import Dict, Optional
 
-MappingType = Dict[int, Dict[str, Optional[str]]]
+# aggregation of the chunk similarities of a rule, see Retriever.retrieve_rules_from_hits
+AGGREGATIONS = ("sum", "max", "mean")
+# from this number of hits the NumPy group by of retrieve_rules_from_hits is faster than a dictionary loop,
+# below it (e.g. top_k_chunks=10) the fixed costs of the array operations dominate (test/rule_aggregation_benchmark.py)
+VECTORIZED_MIN_HITS = 1000
 
 class Retriever:
     def __init__(self,
                  embedding_dim: int,
-                 top_k_chunks: int,
-                 top_k_rules: int,
-                 top_k_situations: int,
-                 threshold: float,
-                 situation_threshold: float,
                  rulebook_index: FaissIndexManager,
                  casebook_index: FaissIndexManager,
-                 rulebook_mapping: MappingType,
-                 casebook_mapping: MappingType,
-                 rulebook_retriever: RuleBookRetriever):
+                 rulebook_mapping: ChunkMapping,
+                 casebook_mapping: ChunkMapping,
+                 rulebook_retriever: RuleBookRetriever,
+                 search_threads: int = 0,
+                 lexical_search: bool = False):
         """
-        Initializes the retrieval module with configuration values, FAISS indices, and preloaded mappings.
+        Initializes the retrieval module with the FAISS indices and preloaded mappings.
+        The retriever only reads the shared indices and mappings, so a single instance serves all requests,
+        the per-request limits and thresholds are passed to the retrieval methods.
 
         :param embedding_dim: Dimension of the embeddings.
-        :param top_k_chunks: Number of top chunks to retrieve from the rulebook index.
-        :param top_k_rules: Number of top rules to consider after chunk grouping.
-        :param top_k_situations: Number of top situations to retrieve from the casebook index.
-        :param threshold: Similarity threshold for rule retrieval.
-        :param situation_threshold: Similarity threshold for situation retrieval.
         :param rulebook_index: Loaded FAISS index manager for the rulebook.
         :param casebook_index: Loaded FAISS index manager for the casebook.
         :param rulebook_mapping: Mapping from chunk indices to rule metadata for the rulebook.
         :param casebook_mapping: Mapping from chunk indices to situation metadata for the casebook.
         :param rulebook_retriever: Component for retrieving rules from the rulebook.
+        :param search_threads: Threads searching the casebook while the rulebook is searched (see MultiIndexSearch),
+                               0 (default) searches one index after the other, None = chosen by the CPU cores.
+        :param lexical_search: Builds BM25 indexes over the rules and the casebook situations for fuse_lexical.
         """
         self._embedding_dim = embedding_dim
-        self._top_k_chunks = top_k_chunks
-        self._top_k_rules = top_k_rules
-        self._top_k_situations = top_k_situations
-        self._threshold = threshold
-        self._situation_threshold = situation_threshold
 
         self._faiss_manager = rulebook_index
         self._faiss_manager_casebook = casebook_index
@@ -51,33 +49,76 @@ class Retriever:
 
         self._rulebook_retriever = rulebook_retriever
 
+        # both corpora are searched together by retrieve_batch
+        self._index_search = MultiIndexSearch({"rulebook": rulebook_index, "casebook": casebook_index},
+                                              max_workers=search_threads)
+
+        # keyword indexes of the hybrid retrieval: one document per rule (ID, titles and text)
+        # and one per casebook entry (question and answer, which names the rules)
+        self._rule_bm25 = None
+        self._situation_bm25 = None
+        if lexical_search:
+            rules = rulebook_retriever.rules
+            self._bm25_rule_keys = [RuleBookRetriever.normalize_rule_id(rule.get("id")) for rule in rules]
+            self._rule_bm25 = BM25Index([
+                " ".join(str(rule.get(field)) for field in ("id", "rule_title", "subrule_title", "text") if rule.get(field))
+                for rule in rules])
+            if casebook_mapping is not None:
+                self._situation_bm25 = BM25Index([f"{entry.get('question') or ''} {entry.get('answer') or ''}"
+                                                  for entry in casebook_mapping.entries])
+
+    def close(self):
+        """Shuts down the threads of the combined index search."""
+        self._index_search.close()
+
     @staticmethod
-    def load_mapping(path: str):
-        with open(path, "rb") as f:
-            return pickle.load(f)
+    def load_mapping(path: str, mmap: bool = True) -> ChunkMapping:
+        """
+        Loads the columnar chunk mapping belonging to the pickled mapping at path (converted on first use).
+        :param path: Path of the pickled mapping.
+        :param mmap: Memory-map the row array instead of reading it into memory.
+        """
+        return ChunkMapping.load(path, mmap=mmap)
 
-    def retrieve_chunks(self, query_embedding: ndarray):
+    def retrieve_chunks(self, query_embedding: ndarray, top_k_chunks: int):
         """
         Performs a search in the FAISS index (rulebook) using the given user query embedding.
         :param query_embedding: The embeddings of the input question.
+        :param top_k_chunks: Number of top chunks to retrieve from the rulebook index.
         :return: A list of tuples (chunk_info, similarity), each from the mapping.
         """
-        distances, indices = self._faiss_manager.search(query_embedding, k=self._top_k_chunks)
+        return self.retrieve_chunks_batch(query_embedding, top_k_chunks)[0]
 
-        retrieved = []
-        for sim, idx in zip(distances[0], indices[0]):
-            chunk_info = self._mapping.get(idx, None)
-            if chunk_info:
-                retrieved.append({"rule_id": chunk_info["rule_id"], "similarity": sim})
-        return retrieved
+    def retrieve_chunks_batch(self, query_embeddings: ndarray, top_k_chunks: int) -> list:
+        """
+        Same as retrieve_chunks for several questions with a single search in the FAISS index (rulebook).
+        :param query_embeddings: The embeddings of the input questions [of shape: (num_queries, embedding_dim)].
+        :param top_k_chunks: Number of top chunks to retrieve per question.
+        :return: One list of retrieved chunks per question, in the order of the embeddings.
+        """
+        distances, indices = self._faiss_manager.search(query_embeddings, k=top_k_chunks)
+        entry_positions = self._mapping.lookup(indices)
+        found = entry_positions >= 0
+        # one vectorized lookup for all hits of all questions, rows without entry are filtered below
+        rule_ids = self._mapping.column("rule_id")[np.where(found, entry_positions, 0)]
+
+        retrieved_per_query = []
+        for query_distances, query_rule_ids, query_found in zip(distances, rule_ids.tolist(), found.tolist()):
+            retrieved_per_query.append([
+                {"rule_id": rule_id, "similarity": sim}
+                for rule_id, sim, is_found in zip(query_rule_ids, query_distances, query_found) if is_found
+            ])
+        return retrieved_per_query
 
-    def retrieve_rules_from_chunks(self, chunks: list) -> tuple:
+    def retrieve_rules_from_chunks(self, chunks: list, top_k_rules: int, threshold: float) -> tuple:
         """
         Finds the individual rules corresponding to the provided rule chunks.
 
         :param chunks: List of chunk dictionaries. Each chunk contains the keys:
                        - "rule_id": the rule ID.
                        - "similarity": the similarity score of the chunk.
+        :param top_k_rules: Number of top rules to consider after chunk grouping.
+        :param threshold: Similarity threshold for rule retrieval.
         :return: A list of dictionaries, each containing the following keys:
                  - "rule_id": The rule ID.
                  - "score_sum": Sum of the similarities of all associated chunks.
@@ -99,9 +140,10 @@ class Retriever:
         # Sort rules by similarity sum (descending)
         sorted_rules = sorted(rules_dict.items(), key=lambda item: item[1]["score_sum"], reverse=True)
 
+        rules = self._rulebook_retriever.get_rules_by_ids([rule_id for rule_id, _ in sorted_rules])
+
         all_rules = []
-        for rule_id, data in sorted_rules:
-            rule = self._rulebook_retriever.get_rule_by_id(rule_id)
+        for (rule_id, data), rule in zip(sorted_rules, rules):
             all_rules.append({
                 "rule_id": rule_id,
                 "score_sum": data["score_sum"],
@@ -112,31 +154,331 @@ class Retriever:
             })
 
         # Filter rules exceeding the threshold and select the top-k
-        top_rules_candidates = [rule for rule in all_rules if rule["score_sum"] > self._threshold]
-        top_rules = top_rules_candidates[:self._top_k_rules]
+        top_rules_candidates = [rule for rule in all_rules if rule["score_sum"] > threshold]
+        top_rules = top_rules_candidates[:top_k_rules]
+
+        return all_rules, top_rules
+
+    def retrieve_rule_hits_batch(self, query_embeddings: ndarray, top_k_chunks: int) -> tuple:
+        """
+        Searches the FAISS index (rulebook) for several questions and returns the hits as arrays
+        for retrieve_rules_from_hits instead of one dictionary per chunk.
+        :param query_embeddings: The embeddings of the input questions [of shape: (num_queries, embedding_dim)].
+        :param top_k_chunks: Number of top chunks to retrieve per question.
+        :return: Tuple (similarities, rule_codes), both of shape (num_queries, top_k_chunks).
+                 rule_codes are integer rule codes of the mapping, -1 if a hit has no rule.
+        """
+        distances, indices = self._faiss_manager.search(query_embeddings, k=top_k_chunks)
+        return self._rule_hits(distances, indices)
+
+    def _rule_hits(self, distances: ndarray, indices: ndarray) -> tuple:
+        entry_positions = self._mapping.lookup(indices)
+        entry_codes, _ = self._mapping.codes("rule_id")
+
+        found = entry_positions >= 0
+        rule_codes = np.where(found, entry_codes[np.where(found, entry_positions, 0)], -1)
+        return distances, rule_codes
+
+    def retrieve_batch(self, query_embeddings: ndarray, top_k_chunks: int, top_k_situations: int,
+                       situation_threshold: float, normalized: bool = False) -> tuple:
+        """
+        Searches the rulebook and the casebook index together (see MultiIndexSearch): the query embeddings
+        are normalized once and both indexes are searched in parallel.
+        :param query_embeddings: The embeddings of the input questions [of shape: (num_queries, embedding_dim)].
+        :param top_k_chunks: Number of top chunks to retrieve per question from the rulebook index.
+        :param top_k_situations: Number of top situations to retrieve per question from the casebook index.
+        :param situation_threshold: Similarity threshold for situation retrieval.
+        :param normalized: The query embeddings are already normalized (as returned by QueryEmbedder).
+        :return: Tuple (similarities, rule_codes, situations_per_query), the first two as returned by
+                 retrieve_rule_hits_batch, the last one as returned by retrieve_situations_batch.
+        """
+        results = self._index_search.search(query_embeddings, k={"rulebook": top_k_chunks, "casebook": top_k_situations},
+                                            normalized=normalized)
+        similarities, rule_codes = self._rule_hits(*results["rulebook"])
+        situations_per_query = self._situations(*results["casebook"], situation_threshold)
+        return similarities, rule_codes, situations_per_query
+
+    def retrieve_rules_from_hits(self, similarities: ndarray, rule_codes: ndarray, top_k_rules: int,
+                                 threshold: float, aggregation: str = "sum") -> tuple:
+        """
+        Variant of retrieve_rules_from_chunks for the hits of one question as arrays: from VECTORIZED_MIN_HITS
+        hits the similarities are grouped by rule with NumPy, fewer hits are grouped in a Python dictionary.
+        With aggregation "sum" the result is the same as the one of retrieve_rules_from_chunks,
+        including the order of rules with equal scores.
+
+        :param similarities: Similarities of the hits [of shape: (top_k_chunks,)].
+        :param rule_codes: Rule codes of the hits (see retrieve_rule_hits_batch), -1 hits are ignored.
+        :param top_k_rules: Number of top rules to consider after chunk grouping.
+        :param threshold: Similarity threshold for rule retrieval, compared with the aggregated score.
+        :param aggregation: How the chunk similarities of a rule are combined for ranking and threshold:
+                            "sum" (default), "max" or "mean".
+        :return: Tuple (all_rules, top_rules) with the same dictionaries as retrieve_rules_from_chunks.
+                 For "max" and "mean" the dictionaries also contain the aggregated "score".
+        """
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"Unknown aggregation '{aggregation}', expected one of {AGGREGATIONS}.")
+
+        found = rule_codes >= 0
+        similarities = similarities[found]
+        hit_codes = rule_codes[found]
+        _, rule_ids = self._mapping.codes("rule_id")
+        if len(hit_codes) < VECTORIZED_MIN_HITS:
+            return self._rules_from_few_hits(similarities, hit_codes, rule_ids, top_k_rules, threshold, aggregation)
+
+        # group by over the (small, dense) code range of the mapping, no sorting needed
+        score_count = np.bincount(hit_codes, minlength=len(rule_ids))
+        codes = np.flatnonzero(score_count)
+        score_count = score_count[codes]
+
+        # np.add.at adds in the order of the hits, so the float32 sums are the same as in the dictionary loop
+        score_sum = np.zeros(len(rule_ids), dtype=similarities.dtype)
+        np.add.at(score_sum, hit_codes, similarities)
+        score_sum = score_sum[codes]
+
+        first_seen = np.full(len(rule_ids), len(hit_codes))
+        np.minimum.at(first_seen, hit_codes, np.arange(len(hit_codes)))
+        first_seen = first_seen[codes]
+
+        if aggregation == "sum":
+            scores = score_sum
+        elif aggregation == "max":
+            scores = np.full(len(rule_ids), -np.inf, dtype=similarities.dtype)
+            np.maximum.at(scores, hit_codes, similarities)
+            scores = scores[codes]
+        else:
+            scores = score_sum / score_count.astype(similarities.dtype)
+
+        order = self._rank(scores, first_seen)
+        ranked_rule_ids = [rule_ids[code] for code in codes[order].tolist()]
+        rules = self._rulebook_retriever.get_rules_by_ids(ranked_rule_ids)
+
+        # bulk conversion, the sums stay NumPy scalars like the similarities summed in the dictionary path
+        ranked_sums = list(score_sum[order])
+        ranked_counts = score_count[order].tolist()
+        ranked_scores = list(scores[order]) if aggregation != "sum" else None
+        all_rules = self._rule_results(ranked_rule_ids, rules, ranked_sums, ranked_counts, ranked_scores)
+        rules_by_group = dict(zip(order.tolist(), all_rules))
+
+        # Filter rules exceeding the threshold and select the top-k
+        top_groups = self._rank(scores, first_seen, candidates=np.flatnonzero(scores > threshold), k=top_k_rules)
+        top_rules = [rules_by_group[group] for group in top_groups.tolist()]
 
         return all_rules, top_rules
 
-    def retrieve_situations(self, query_embedding: ndarray):
+    def _rules_from_few_hits(self, similarities: ndarray, hit_codes: ndarray, rule_ids: list, top_k_rules: int,
+                             threshold: float, aggregation: str) -> tuple:
+        """
+        Dictionary path of retrieve_rules_from_hits for fewer than VECTORIZED_MIN_HITS hits, same results.
+        :param similarities: Similarities of the hits with a rule.
+        :param hit_codes: Rule codes of these hits.
+        :param rule_ids: Rule IDs by rule code.
+        """
+        # [score_sum, score_count, max similarity] per rule code, in the order of the first hit
+        groups = {}
+        for code, similarity in zip(hit_codes.tolist(), similarities):
+            group = groups.get(code)
+            if group is None:
+                groups[code] = [similarity, 1, similarity]
+            else:
+                group[0] += similarity
+                group[1] += 1
+                group[2] = max(group[2], similarity)
+
+        if aggregation == "sum":
+            scores = {code: group[0] for code, group in groups.items()}
+        elif aggregation == "max":
+            scores = {code: group[2] for code, group in groups.items()}
+        else:
+            scores = {code: group[0] / similarities.dtype.type(group[1]) for code, group in groups.items()}
+
+        # the sort is stable, rules with equal scores keep the order of their first hit
+        ranked_codes = sorted(groups, key=scores.__getitem__, reverse=True)
+        ranked_rule_ids = [rule_ids[code] for code in ranked_codes]
+        rules = self._rulebook_retriever.get_rules_by_ids(ranked_rule_ids)
+        all_rules = self._rule_results(ranked_rule_ids, rules,
+                                       [groups[code][0] for code in ranked_codes],
+                                       [groups[code][1] for code in ranked_codes],
+                                       [scores[code] for code in ranked_codes] if aggregation != "sum" else None)
+
+        # Filter rules exceeding the threshold and select the top-k
+        top_rules = [rule for rule, code in zip(all_rules, ranked_codes) if scores[code] > threshold][:top_k_rules]
+
+        return all_rules, top_rules
+
+    @staticmethod
+    def _rule_results(ranked_rule_ids: list, rules: list, ranked_sums: list, ranked_counts: list,
+                      ranked_scores: list = None) -> list:
+        """The rule dictionaries of retrieve_rules_from_hits in ranked order, with "score" if ranked_scores are given."""
+        all_rules = []
+        for rank, (rule_id, rule) in enumerate(zip(ranked_rule_ids, rules)):
+            result = {
+                "rule_id": rule_id,
+                "score_sum": ranked_sums[rank],
+                "score_count": ranked_counts[rank],
+                "rule_title": rule["rule_title"],
+                "subrule_title": rule["subrule_title"],
+                "text": rule["text"],
+            }
+            if ranked_scores is not None:
+                result["score"] = ranked_scores[rank]
+            all_rules.append(result)
+        return all_rules
+
+    @staticmethod
+    def _rank(scores: ndarray, first_seen: ndarray, candidates: ndarray = None, k: int = None) -> ndarray:
+        """
+        Orders groups by score (descending), groups with equal scores by their first hit,
+        like the stable sort of the dictionary path.
+        :param scores: Aggregated score per group.
+        :param first_seen: Position of the first hit per group.
+        :param candidates: Groups to rank, all groups if None.
+        :param k: Only the top k groups are selected (with argpartition) and sorted, all groups if None.
+        :return: The ranked group positions.
+        """
+        if candidates is None:
+            candidates = np.arange(len(scores))
+        if k is not None and k <= 0:
+            return candidates[:0]
+
+        if k is not None and k < len(candidates):
+            # keep every candidate that ties with the k-th score, the tie-break below decides between them
+            kth = np.argpartition(-scores[candidates], k - 1)[k - 1]
+            candidates = candidates[scores[candidates] >= scores[candidates[kth]]]
+
+        order = candidates[np.lexsort((first_seen[candidates], -scores[candidates]))]
+        return order[:k] if k is not None else order
+
+    def retrieve_situations(self, query_embedding: ndarray, top_k_situations: int, situation_threshold: float):
         """
         Performs a search in the FAISS index (situation handbook) using the given user query embedding.
         :param query_embedding: The embeddings of the input question.
+        :param top_k_situations: Number of top situations to retrieve from the casebook index.
+        :param situation_threshold: Similarity threshold for situation retrieval.
         :return: A list of tuples (chunk_info, similarity), each from the mapping.
         """
-        distances, indices = self._faiss_manager_casebook.search(query_embedding, k=self._top_k_situations)
-
-        retrieved = []
-        for sim, idx in zip(distances[0], indices[0]):
-            if sim >= self._situation_threshold:
-                situation_info = self._mapping_casebook.get(idx, None)
-                if situation_info:
-                    retrieved.append({
-                        "rule_id": situation_info["rule_id"],
-                        "situation_id": situation_info["situation_id"],
-                        "question": situation_info["question"],
-                        "answer": situation_info["answer"],
-                        "rule_reference": situation_info["rule_reference"],
-                        "similarity": sim
-                    })
-
-        return retrieved
\ No newline at end of file
+        return self.retrieve_situations_batch(query_embedding, top_k_situations, situation_threshold)[0]
+
+    def retrieve_situations_batch(self, query_embeddings: ndarray, top_k_situations: int, situation_threshold: float) -> list:
+        """
+        Same as retrieve_situations for several questions with a single search in the FAISS index (situation handbook).
+        :param query_embeddings: The embeddings of the input questions [of shape: (num_queries, embedding_dim)].
+        :param top_k_situations: Number of top situations to retrieve per question.
+        :param situation_threshold: Similarity threshold for situation retrieval.
+        :return: One list of retrieved situations per question, in the order of the embeddings.
+        """
+        distances, indices = self._faiss_manager_casebook.search(query_embeddings, k=top_k_situations)
+        return self._situations(distances, indices, situation_threshold)
+
+    def _situations(self, distances: ndarray, indices: ndarray, situation_threshold: float) -> list:
+        entry_positions = self._mapping_casebook.lookup(indices)
+
+        found = (entry_positions >= 0) & (distances >= situation_threshold)
+
+        retrieved_per_query = []
+        for query_distances, query_positions, query_found in zip(distances, entry_positions.tolist(), found.tolist()):
+            retrieved = []
+            for position, sim, is_found in zip(query_positions, query_distances, query_found):
+                if not is_found:
+                    continue
+                retrieved.append(self._situation(position, sim))
+            retrieved_per_query.append(retrieved)
+
+        return retrieved_per_query
+
+    def _situation(self, position: int, similarity) -> dict:
+        situation_info = self._mapping_casebook.entries[position]
+        return {
+            "rule_id": situation_info["rule_id"],
+            "situation_id": situation_info["situation_id"],
+            "question": situation_info["question"],
+            "answer": situation_info["answer"],
+            "rule_reference": situation_info["rule_reference"],
+            # resolved at build time, missing in casebook mappings built before
+            "referenced_rules_text": situation_info.get("referenced_rules_text"),
+            "similarity": similarity
+        }
+
+    def fuse_lexical(self, query_text: str, all_rules: list, retrieved_situations: list, top_k_rules: int,
+                     threshold: float, top_k_situations: int, lexical_top_k: int = 10, rrf_k: int = 60,
+                     min_bm25_score: float = 0.0) -> tuple:
+        """
+        Hybrid retrieval: fuses the dense (FAISS) results of a question with the BM25 hits of its keywords
+        (e.g. "double minor", "Rule 116") by reciprocal rank fusion. Needs lexical_search=True.
+
+        A rule reaches the top rules if its dense score passes the threshold or if it is among the top_k_rules
+        BM25 hits with a BM25 score of at least min_bm25_score, the fused rank decides between them. Situations
+        found only by BM25 are only taken if their BM25 score reaches min_bm25_score as well, the dense situations
+        have passed the situation threshold already. Rules and situations found only by BM25 are added with
+        score_sum 0 (rules) or similarity 0.0 (situations), so the scores stay numeric for the API and the frontend.
+        All results get their "rrf_score", BM25 hits also their "bm25_score".
+
+        :param query_text: The user's question.
+        :param all_rules: All dense rules of the question in ranked order, see retrieve_rules_from_hits.
+        :param retrieved_situations: Dense situations of the question, see retrieve_situations.
+        :param top_k_rules: Number of top rules to return.
+        :param threshold: Similarity threshold of the dense rule scores.
+        :param top_k_situations: Number of situations to return.
+        :param lexical_top_k: Number of BM25 rule hits taken into the fusion (situations: top_k_situations).
+        :param rrf_k: Rank constant of the reciprocal rank fusion.
+        :param min_bm25_score: Minimum BM25 score of a rule or situation that only the keyword search found,
+                               weaker keyword hits (e.g. a single common word) are only used for the ranking.
+        :return: Tuple (all_rules, top_rules, situations).
+        """
+        if self._rule_bm25 is None:
+            raise RuntimeError("Lexical search is disabled, create the Retriever with lexical_search=True.")
+        normalize = RuleBookRetriever.normalize_rule_id
+
+        # rules
+        bm25_scores, documents = self._rule_bm25.search(query_text, lexical_top_k)
+        bm25_by_key = {}
+        for score, document in zip(bm25_scores.tolist(), documents.tolist()):
+            bm25_by_key.setdefault(self._bm25_rule_keys[document], score)  # a rule ID can occur twice
+        lexical_keys = list(bm25_by_key)
+
+        rules_by_key = {normalize(rule["rule_id"]): rule for rule in all_rules}
+        missing_keys = [key for key in lexical_keys if key not in rules_by_key]
+        for key, rule in zip(missing_keys, self._rulebook_retriever.get_rules_by_ids(missing_keys)):
+            rules_by_key[key] = {
+                "rule_id": rule["rule_id"],
+                "score_sum": 0.0,
+                "score_count": 0,
+                "rule_title": rule["rule_title"],
+                "subrule_title": rule["subrule_title"],
+                "text": rule["text"],
+            }
+
+        eligible = {key for key, rule in rules_by_key.items() if rule.get("score", rule["score_sum"]) > threshold}
+        eligible.update(key for key in lexical_keys[:top_k_rules] if bm25_by_key[key] >= min_bm25_score)
+
+        fused_rules = []
+        for key, rrf_score in reciprocal_rank_fusion([[normalize(rule["rule_id"]) for rule in all_rules], lexical_keys],
+                                                     k=rrf_k).items():
+            rule = dict(rules_by_key[key], rrf_score=rrf_score)
+            if key in bm25_by_key:
+                rule["bm25_score"] = bm25_by_key[key]
+            fused_rules.append(rule)
+        top_rules = [rule for rule in fused_rules if normalize(rule["rule_id"]) in eligible][:top_k_rules]
+
+        # situations
+        situations_by_id = {situation["situation_id"]: situation for situation in retrieved_situations}
+        lexical_ids = []
+        bm25_by_id = {}
+        if self._situation_bm25 is not None:
+            bm25_scores, positions = self._situation_bm25.search(query_text, top_k_situations)
+            for score, position in zip(bm25_scores.tolist(), positions.tolist()):
+                situation = self._situation(position, 0.0)
+                if score < min_bm25_score and situation["situation_id"] not in situations_by_id:
+                    continue
+                situations_by_id.setdefault(situation["situation_id"], situation)
+                bm25_by_id[situation["situation_id"]] = score
+                lexical_ids.append(situation["situation_id"])
+
+        fused_situations = []
+        for situation_id, rrf_score in reciprocal_rank_fusion(
+                [[situation["situation_id"] for situation in retrieved_situations], lexical_ids], k=rrf_k).items():
+            situation = dict(situations_by_id[situation_id], rrf_score=rrf_score)
+            if situation_id in bm25_by_id:
+                situation["bm25_score"] = bm25_by_id[situation_id]
+            fused_situations.append(situation)
+
+        return fused_rules, top_rules, fused_situations[:top_k_situations]
@@ -8,25 +8,79 @@ class RuleBookRetriever:
         """
         self.rulebook_path = rulebook_path
         self.rules = self._load_rules()
+        self._rules_by_id = self._build_index(self.rules)
+        self._subrule_ids = self._build_subrule_index(self._rules_by_id)
 
     def _load_rules(self):
         """Loads the rulebook from the JSON file."""
         with open(self.rulebook_path, "r", encoding="utf-8") as f:
             return json.load(f)
 
-    def get_rule_by_id(self, rule_id: str):
+    @staticmethod
+    def normalize_rule_id(rule_id) -> str:
         """
-        Retrieves the full rule text for a given rule ID.
-        :param rule_id: The rule ID (e.g., "1.2." or "32.4.").
-        :return: A dictionary containing the rule ID, title, subrule title (if any), and the full text.
+        Normalizes a rule ID so that "1.2", "1.2." and " 1.2. " map to the same key.
+        Some IDs in the rulebook are stored as numbers (e.g. 7), so the ID is converted to a string first.
+        :param rule_id: The rule ID.
+        :return: The rule ID without surrounding whitespace and trailing dots.
+        """
+        return str(rule_id).strip().rstrip(".")
+
+    @classmethod
+    def _build_index(cls, rules: list) -> dict:
         """
-        rule_id = rule_id.rstrip(".") + "."  # Ensure the rule ID ends with a dot for consistent matching
-        for rule in self.rules:
-            if rule.get("id") == rule_id:
-                return {
+        Builds a hash index from the normalized rule ID to the rule dictionary returned by get_rule_by_id.
+        If an ID occurs more than once, the first rule wins (like the former linear search).
+        """
+        index = {}
+        for rule in rules:
+            key = cls.normalize_rule_id(rule.get("id"))
+            if key not in index:
+                index[key] = {
                     "rule_id": rule["id"],
                     "rule_title": rule.get("rule_title", None),
                     "subrule_title": rule.get("subrule_title", None),
                     "text": rule.get("text", None)
                 }
-        return None  # If the rule ID is not found
+        return index
+
+    @staticmethod
+    def _build_subrule_index(rules_by_id: dict) -> dict:
+        """Maps a rule number to the keys of its subrules in rulebook order, e.g. "9" -> ["9.1", "9.2", ...]."""
+        index = {}
+        for key in rules_by_id:
+            if "." in key:
+                index.setdefault(key.split(".", 1)[0], []).append(key)
+        return index
+
+    def get_rule_by_id(self, rule_id: str):
+        """
+        Retrieves the full rule text for a given rule ID.
+        :param rule_id: The rule ID (e.g., "1.2." or "32.4.").
+        :return: A dictionary containing the rule ID, title, subrule title (if any), and the full text.
+        """
+        rule = self._rules_by_id.get(self.normalize_rule_id(rule_id))
+        return dict(rule) if rule else None  # None if the rule ID is not found
+
+    def get_rules_by_ids(self, rule_ids: list) -> list:
+        """
+        Retrieves several rules in one call.
+        :param rule_ids: List of rule IDs.
+        :return: List with one entry per requested ID, in the same order: the rule dictionary
+                 (see get_rule_by_id) or None if the rule ID is not found.
+        """
+        rules_by_id = self._rules_by_id
+        normalize = self.normalize_rule_id
+        return [dict(rule) if rule else None for rule in (rules_by_id.get(normalize(rule_id)) for rule_id in rule_ids)]
+
+    def get_rules_by_reference(self, rule_id: str) -> list:
+        """
+        Resolves a rule reference: the rule itself if the rulebook contains the ID, otherwise all of its subrules
+        (e.g. "Rule 9" -> rules 9.1, 9.2, ...).
+        :param rule_id: The referenced rule ID (e.g., "9", "4.1." or "32.4").
+        :return: List of rule dictionaries (see get_rule_by_id), empty if nothing matches.
+        """
+        key = self.normalize_rule_id(rule_id)
+        if key in self._rules_by_id:
+            return [dict(self._rules_by_id[key])]
+        return [dict(self._rules_by_id[subrule]) for subrule in self._subrule_ids.get(key, [])]
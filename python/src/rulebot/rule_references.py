@@ -0,0 +1,217 @@
+import re
+
+from .chunk_mapping import ChunkMapping
+from .rule_book_retriever import RuleBookRetriever
+from .config import STOPWORDS
+
+# rule references like "Rule 63", "Rule 4.1." or "Rule 78.5 (IV)", same patterns as used for the casebook answers
+RULE_REFERENCE_PATTERN = re.compile(r"Rule\s(\d{1,3}(?:\.\d{1,3}){0,2}\.?(?:\s\((?:I|II|III|IV|V|VI|VII|VIII|IX|X|XI|XII|XIII|XIV|XV|XVI|XVII|XVIII|XIX|XX)\))?|\s\((?:\d{1,3}(?:\.\d{1,3}){0,2})\))?(?=\s|[.,;!?)]|$)")
+# in-text references with "and", "or" or "," in between, e.g. "Rules 20.4 and 78.5"
+RULE_REFERENCE_LIST_PATTERN = re.compile(r"(?i)\bRules?\s\d{1,3}(?:\.\d{1,3}){0,2}\.?(?:\s\((?=[\s.,;!?)]|$)(?:I|II|III|IV|V|VI|VII|VIII|IX|X|XI|XII|XIII|XIV|XV|XVI|XVII|XVIII|XIX|XX)(?=[\s.,;!?)]|$)\)|\s(?<=[\s(])(?:I|II|III|IV|V|VI|VII|VIII|IX|X|XI|XII|XIII|XIV|XV|XVI|XVII|XVIII|XIX|XX)(?=[\s.,;!?)]|$))?(?:\s(?:and|or)\s\d{1,3}(?:\.\d{1,3}){0,2}\.?(?:\s\((?=[\s.,;!?)]|$)(?:I|II|III|IV|V|VI|VII|VIII|IX|X|XI|XII|XIII|XIV|XV|XVI|XVII|XVIII|XIX|XX)(?=[\s.,;!?)]|$)\)|\s(?<=[\s(])(?:I|II|III|IV|V|VI|VII|VIII|IX|X|XI|XII|XIII|XIV|XV|XVI|XVII|XVIII|XIX|XX)(?=[\s.,;!?)]|$))?)?(?:,\s\d{1,3}(?:\.\d{1,3}){0,2}\.?(?:\s\((?=[\s.,;!?)]|$)(?:I|II|III|IV|V|VI|VII|VIII|IX|X|XI|XII|XIII|XIV|XV|XVI|XVII|XVIII|XIX|XX)(?=[\s.,;!?)]|$)\)|\s(?<=[\s(])(?:I|II|III|IV|V|VI|VII|VIII|IX|X|XI|XII|XIII|XIV|XV|XVI|XVII|XVIII|XIX|XX)(?=[\s.,;!?)]|$))?)*")
+RULE_NUMBER_PATTERN = re.compile(r"(\d{1,3}(?:\.\d{1,3}){0,2}\.?\s*(?:\((?:I|II|III|IV|V|VI|VII|VIII|IX|X|XI|XII|XIII|XIV|XV|XVI|XVII|XVIII|XIX|XX)\))?)")
+# casebook references like "Situation 5.1"
+SITUATION_REFERENCE_PATTERN = re.compile(r"(?i)\bsituations?\s(\d{1,3}\.\d{1,3})(?=\s|[.,;!?)]|$)")
+# roman numeral suffix of a rule reference, e.g. "78.5 (IV)" -> "78.5"
+ROMAN_SUFFIX_PATTERN = re.compile(r"\s*\([IVX]+\)$")
+# words of a pure lookup question besides the references and stopwords ("What does Rule 63 say?", "Show me Rule 4.1")
+LOOKUP_WORDS = frozenset(STOPWORDS) | {
+    "say", "says", "state", "states", "mean", "means", "text", "wording", "content", "contents", "show", "explain",
+    "read", "quote", "tell", "give", "me", "you", "please", "answer", "situation", "situations", "casebook",
+    "rulebook", "full", "exactly", "describe", "define", "definition", "cover", "covers", "regarding",
+}
+WORD_PATTERN = re.compile(r"[^\W\d_]+")
+# paragraph numbers a reference list leaves behind ("Rules 20.4 and 78.5 (IV)")
+ROMAN_PARAGRAPH_PATTERN = re.compile(r"\(\s*[IVX]+\s*\)")
+
+
+def extract_rule_references(text: str):
+    """
+    Extracts the referenced rule numbers of a text (e.g. "Rule 5.1." -> "5.1", "Rule 78.5 (IV)" -> "78.5 (IV)").
+    :param text: The text, e.g. a casebook answer or a user question.
+    :return: List of rule numbers in order of appearance without duplicates, None if there are none.
+    """
+    rule_references = []
+
+    for match in RULE_REFERENCE_PATTERN.findall(text):
+        if match.rstrip(".").strip() not in rule_references:
+            rule_references.append(match.rstrip(".").strip())
+
+    for match in RULE_REFERENCE_LIST_PATTERN.findall(text):
+        for rule_number in RULE_NUMBER_PATTERN.findall(match):
+            if rule_number.rstrip(".").strip() not in rule_references:
+                rule_references.append(rule_number.rstrip(".").strip())
+
+    return rule_references if len(rule_references) > 0 else None
+
+
+def extract_situation_references(text: str) -> list:
+    """
+    :param text: The text, e.g. a user question.
+    :return: List of referenced casebook situation IDs (e.g. "5.1") in order of appearance without duplicates.
+    """
+    return list(dict.fromkeys(SITUATION_REFERENCE_PATTERN.findall(text)))
+
+
+def expand_rule_references(rulebook_retriever: RuleBookRetriever, rule_reference: list) -> list:
+    """
+    Resolves the rule references of a casebook situation in the rulebook. Besides exact rule IDs, a paragraph
+    reference ("78.5 (IV)") resolves to its rule and a whole rule ("39") to the rule title of its subrules.
+    :param rulebook_retriever: Component for retrieving rules from the rulebook.
+    :param rule_reference: Rule references of the situation (e.g. ["5.1", "78.5 (IV)"]), may be None.
+    :return: List with one dictionary per reference: "reference", "rule_id" (None if not in the rulebook),
+             "rule_title", "subrule_title" and "text", the reference as shown in the prompt.
+    """
+    referenced_rules = []
+    for reference in rule_reference or []:
+        rule = rulebook_retriever.get_rule_by_id(reference)
+        label = None
+        if rule is None:
+            key = RuleBookRetriever.normalize_rule_id(ROMAN_SUFFIX_PATTERN.sub("", str(reference)))
+            rules = rulebook_retriever.get_rules_by_reference(key)
+            if len(rules) == 1 and RuleBookRetriever.normalize_rule_id(rules[0]["rule_id"]) == key:
+                rule, label = rules[0], reference
+            elif rules:
+                rule, label = {"rule_id": key, "rule_title": rules[0]["rule_title"], "subrule_title": None}, reference
+
+        if rule is None:
+            referenced_rules.append({"reference": reference, "rule_id": None, "rule_title": None,
+                                     "subrule_title": None, "text": str(reference)})
+            continue
+
+        label = label or rule["rule_id"]
+        if rule["subrule_title"] and rule["subrule_title"] != rule["rule_title"]:
+            text = f"{label}: {rule['rule_title']} - {rule['subrule_title']}"
+        else:
+            text = f"{label}: {rule['rule_title']}"
+        referenced_rules.append({"reference": reference, "rule_id": str(rule["rule_id"]),
+                                 "rule_title": rule["rule_title"], "subrule_title": rule["subrule_title"], "text": text})
+    return referenced_rules
+
+
+def format_referenced_rules(referenced_rules) -> str:
+    """
+    :param referenced_rules: Result of expand_rule_references, None if the situation has no rule references.
+    :return: The referenced rules as listed in the prompt, e.g. "5.1.: Rule title - Subrule title, 39: Rule title".
+    """
+    if referenced_rules is None:
+        return "None"
+    return ", ".join(rule["text"] for rule in referenced_rules)
+
+
+def expand_casebook_references(mapping: dict, rulebook_retriever: RuleBookRetriever) -> list:
+    """
+    Adds the resolved rule references to the entries of a casebook mapping ("referenced_rules" and the
+    prompt text "referenced_rules_text"), so the prompt does not resolve them on every request.
+    :param mapping: Casebook mapping from FAISS row to situation, changed in place.
+    :param rulebook_retriever: Component for retrieving rules from the rulebook.
+    :return: List of tuples (situation_id, reference) of the references not found in the rulebook.
+    """
+    unresolved = []
+    for situation_info in mapping.values():
+        rule_reference = situation_info.get("rule_reference")
+        referenced_rules = expand_rule_references(rulebook_retriever, rule_reference) \
+            if rule_reference is not None else None
+        situation_info["referenced_rules"] = referenced_rules
+        situation_info["referenced_rules_text"] = format_referenced_rules(referenced_rules)
+        unresolved.extend((situation_info.get("situation_id"), rule["reference"])
+                          for rule in referenced_rules or [] if rule["rule_id"] is None)
+    return unresolved
+
+
+class ReferenceRouter:
+    def __init__(self, rulebook_retriever: RuleBookRetriever, casebook_mapping: ChunkMapping = None, max_rules: int = 10):
+        """
+        Pre-retrieval router for questions that name rules or situations outright ("What does Rule 63 say?",
+        "Rule 4.1", "Situation 5.1"). The references are resolved directly in the rulebook and casebook.
+        Only pure lookups (besides the references only stopwords and words like "say" or "explain") skip
+        embedding and vector search, see route. Other questions with references ("Is a hand pass in Rule 79
+        allowed in the defending zone?") get the resolved rules in addition to the normal retrieval, see resolve.
+
+        :param rulebook_retriever: Component for retrieving rules from the rulebook.
+        :param casebook_mapping: Columnar casebook mapping to resolve situation references, None = rules only.
+        :param max_rules: A question is only routed if its references resolve to at most this many rules
+                          (a whole rule is expanded to its subrules).
+        """
+        self._rulebook_retriever = rulebook_retriever
+        self._max_rules = max_rules
+        self._situations_by_id = {}
+        if casebook_mapping is not None:
+            for entry in casebook_mapping.entries:
+                self._situations_by_id.setdefault(str(entry.get("situation_id")), entry)
+
+    @staticmethod
+    def is_lookup(query_text: str) -> bool:
+        """
+        :param query_text: The user's question.
+        :return: True if the question only asks for the referenced rules or situations, i.e. the rest of the
+                 question consists of stopwords and LOOKUP_WORDS.
+        """
+        remainder = RULE_REFERENCE_LIST_PATTERN.sub(" ", query_text)
+        remainder = SITUATION_REFERENCE_PATTERN.sub(" ", RULE_REFERENCE_PATTERN.sub(" ", remainder))
+        remainder = ROMAN_PARAGRAPH_PATTERN.sub(" ", remainder)
+        return all(word in LOOKUP_WORDS for word in WORD_PATTERN.findall(remainder.lower()))
+
+    def route(self, query_text: str):
+        """
+        Routes a pure lookup question (see is_lookup) past the vector search.
+        :param query_text: The user's question.
+        :return: Tuple (top_rules, situations) of resolve, or None if the question is no lookup or its references
+                 cannot be resolved unambiguously.
+        """
+        if not self.is_lookup(query_text):
+            return None
+        return self.resolve(query_text)
+
+    def resolve(self, query_text: str):
+        """
+        Resolves the explicit references of a question.
+        :param query_text: The user's question.
+        :return: Tuple (top_rules, situations) with the dictionaries of Retriever (score_sum 0, similarity 1.0 for
+                 the exact lookup, "reference" holds the matched reference), or None if the question has no references or they are
+                 ambiguous: a reference is not found or they resolve to more than max_rules rules.
+        """
+        rule_references = extract_rule_references(query_text) or []
+        situation_references = extract_situation_references(query_text)
+        if not rule_references and not situation_references:
+            return None
+
+        top_rules = []
+        seen = set()
+        for reference in rule_references:
+            rules = self._rulebook_retriever.get_rules_by_reference(ROMAN_SUFFIX_PATTERN.sub("", reference))
+            if not rules:
+                return None
+            for rule in rules:
+                key = RuleBookRetriever.normalize_rule_id(rule["rule_id"])
+                if key in seen:
+                    continue
+                seen.add(key)
+                top_rules.append({
+                    "rule_id": str(rule["rule_id"]),  # a few rulebook IDs are numbers
+                    "score_sum": 0.0,
+                    "score_count": 0,
+                    "rule_title": rule["rule_title"],
+                    "subrule_title": rule["subrule_title"],
+                    "text": rule["text"],
+                    "reference": reference,
+                })
+        if len(top_rules) > self._max_rules:
+            return None
+
+        situations = []
+        for situation_id in situation_references:
+            situation_info = self._situations_by_id.get(situation_id)
+            if situation_info is None:
+                return None
+            situations.append({
+                "rule_id": situation_info["rule_id"],
+                "situation_id": situation_info["situation_id"],
+                "question": situation_info["question"],
+                "answer": situation_info["answer"],
+                "rule_reference": situation_info["rule_reference"],
+                "referenced_rules_text": situation_info.get("referenced_rules_text"),
+                "similarity": 1.0,
+                "reference": situation_id,
+            })
+
+        return top_rules, situations
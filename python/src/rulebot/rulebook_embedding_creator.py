@@ -1,37 +1,67 @@
 ﻿import json
-import pickle
-from transformers import AutoTokenizer
 
-from text_chunker import TextChunker
-from embedder import Embedder
-from faiss_index_manager import FaissIndexManager
-from config import EmbeddingConfig
+from .parallel_chunker import ParallelTextChunker
+from .embedder import Embedder
+from .faiss_index_manager import FaissIndexManager
+from .incremental_build import IncrementalIndexBuild
+from .rule_book_retriever import RuleBookRetriever
+from .config import EmbeddingConfig
 
 class RuleBookEmbeddingCreator:
     def __init__(self,
                  tokenizer_name: str = "sentence-transformers/all-MiniLM-L6-v2",
                  embedder_model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
                  overlap: int = 1,
-                 embedding_dim: int = 384):
+                 embedding_dim: int = 384,
+                 segmenter: str = "parser",
+                 index_type: str = "flat",
+                 index_params: dict = None,
+                 embedding_cache_dir: str = None,
+                 embedding_cache_dtype: str = "float32",
+                 embed_batch_size: int = 1024,
+                 chunk_processes: int = 1):
         """
         Initializes the embedding creator for the rulebook.
         :param tokenizer_name: Name of the Hugging Face tokenizer.
         :param embedder_model_name: Name of the SentenceTransformer model.
         :param overlap: Number of overlapping sentences between chunks.
         :param embedding_dim: Dimension of the embeddings.
+        :param segmenter: Sentence segmentation backend of the TextChunker ("parser", "senter" or "rules").
+        :param index_type: FAISS index type ("flat", "flat_fp16", "flat_sq8", "hnsw", "ivf_flat" or
+                           "ivf_pq"), see FaissIndexManager.
+        :param index_params: Build and search parameters of the index, see FaissIndexManager.
+        :param embedding_cache_dir: Directory of the persistent embedding cache, None = every chunk is encoded.
+        :param embedding_cache_dtype: Storage type of the cached embeddings, "float32" or "float16".
+        :param embed_batch_size: Number of chunks encoded and added to the index at once, bounds the memory
+                                 of the embeddings during a build.
+        :param chunk_processes: Number of worker processes chunking the rules, 1 = chunking in the build process.
         """
-        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
-        self.embedder = Embedder(model_name=embedder_model_name)
-        self.chunker = TextChunker(self.tokenizer, max_tokens=self.embedder.model.get_max_seq_length(), overlap=overlap)
+        self.embedder = Embedder(model_name=embedder_model_name, cache_dir=embedding_cache_dir,
+                                 cache_dtype=embedding_cache_dtype)
+        self.chunker = ParallelTextChunker(tokenizer_name, max_tokens=self.embedder.model.get_max_seq_length(),
+                                           overlap=overlap, segmenter=segmenter, processes=chunk_processes)
         self.embedding_dim = embedding_dim
-        self.faiss_manager = FaissIndexManager(embedding_dim)
+        self.embed_batch_size = embed_batch_size
+        self.faiss_manager = FaissIndexManager(embedding_dim, index_type=index_type, index_params=index_params, id_map=True)
+        # a change of these settings rebuilds all rules, see IncrementalIndexBuild
+        self.build_settings = {
+            "tokenizer_name": tokenizer_name,
+            "embedder_model_name": embedder_model_name,
+            "max_tokens": self.chunker.max_tokens,
+            "overlap": overlap,
+            "segmenter": segmenter,
+            "embedding_dim": embedding_dim,
+            "index_type": index_type,
+            "index_params": self.faiss_manager.build_params,
+        }
 
         print(f"Selected tokenizer model: {tokenizer_name}")
         print(f"Selected embedder model: {embedder_model_name}")
 
     def process_rulebook(self, rulebook_path: str,
                          index_path: str = "rulebook_faiss_index.index",
-                         mapping_path: str = "rulebook_chunk_mapping.pkl"):
+                         mapping_path: str = "rulebook_chunk_mapping.pkl",
+                         incremental: bool = True):
         """
         Processes the full rulebook:
           - Loads the rulebook from a JSON file.
@@ -39,51 +69,48 @@ class RuleBookEmbeddingCreator:
           - Creates embeddings only for the rule text.
           - Stores metadata (rule ID, title, etc.) in the mapping.
           - Adds the embeddings to a FAISS index.
+        Incremental build: only new or changed rules are chunked and embedded, the vectors of changed and deleted
+        rules are removed from the existing index, and the mapping is patched (see IncrementalIndexBuild).
 
         :param rulebook_path: Path to the JSON rulebook file.
                               Expected format: A list of dicts, e.g.
                               [{ "id": "1.1.", "rule_title": "...", "subrule_title": "...", "text": "..." }, ...]
         :param index_path: Path where the FAISS index will be saved.
-        :param mapping_path: Path where the mapping (Pickle file) will be saved.
-        :return: Tuple (mapping, embeddings)
+        :param mapping_path: Path where the mapping (Pickle file) will be saved, the columnar mapping is saved next to it.
+        :param incremental: Update the index of the previous build, False = rebuild all rules.
+        :return: The mapping of all chunks.
         """
         # Lade das Regelbuch (JSON-Datei)
         with open(rulebook_path, "r", encoding="utf-8") as f:
             rules = json.load(f)
 
-        all_chunks = []
-        mapping = {}  # Mapping: globaler Index -> dict { "rule_id", "chunk_text", "rule_name", "subrule_name" }
-        current_index = 0
+        # Mapping: Vektor-ID -> dict { "rule_id", "chunk_text", "rule_title", "subrule_title" }
+        build = IncrementalIndexBuild(self.faiss_manager, index_path, mapping_path, self.build_settings,
+                                      lambda texts: self.embedder.embed(texts, show_progress_bar=False),
+                                      incremental=incremental, batch_size=self.embed_batch_size)
 
+        # unchanged rules are kept, the others are chunked together (in parallel, see ParallelTextChunker)
+        changed_rules = []
         for rule in rules:
-            rule_id = rule.get("id", "")
-            rule_text = rule.get("text", "")
-
-            if not rule_text.strip():
+            if not rule.get("text", "").strip():
                 continue
 
-            chunks = self.chunker.chunk_text(rule_text)
-            for chunk in chunks:
-                all_chunks.append(chunk)
-                mapping[current_index] = {
-                    "rule_id": rule_id,
-                    "chunk_text": chunk,
-                    "rule_title": rule.get("rule_title", None),
-                    "subrule_title": rule.get("subrule_title", None)
-                }
-                current_index += 1
-
-        print(f"Created {len(all_chunks)} chunks from {len(rules)} rules.")
+            key = RuleBookRetriever.normalize_rule_id(rule.get("id", ""))
+            if not build.keep(key, rule):
+                changed_rules.append((key, rule))
 
-        embeddings = self.embedder.embed(all_chunks)
-        self.faiss_manager.add_embeddings(embeddings)
-        self.faiss_manager.save_index(index_path)
+        for (key, rule), chunks in zip(changed_rules, self.chunker.chunk_texts([rule["text"] for _, rule in changed_rules])):
+            build.add(key, rule, chunks, [{
+                "rule_id": rule.get("id", ""),
+                "chunk_text": chunk,
+                "rule_title": rule.get("rule_title", None),
+                "subrule_title": rule.get("subrule_title", None)
+            } for chunk in chunks])
 
-        with open(mapping_path, "wb") as f:
-            pickle.dump(mapping, f)
-        print(f"Mapping saved to '{mapping_path}'.")
+        build.finish()
+        build.publish()
 
-        return mapping, embeddings
+        return build.mapping
 
 
 if __name__ == "__main__":
@@ -94,12 +121,28 @@ if __name__ == "__main__":
     mapping_path = EmbeddingConfig["chunk_mapping_path"]
     overlap = EmbeddingConfig["overlap"]
     embedding_dim = EmbeddingConfig["embedding_dim"]
+    segmenter = EmbeddingConfig["segmenter"]
+    index_type = EmbeddingConfig["index_type"]
+    index_params = EmbeddingConfig["index_params"]
+    embedding_cache_dir = EmbeddingConfig["embedding_cache_dir"]
+    embedding_cache_dtype = EmbeddingConfig["embedding_cache_dtype"]
+    embed_batch_size = EmbeddingConfig["embed_batch_size"]
+    incremental = EmbeddingConfig["incremental_build"]
+    chunk_processes = EmbeddingConfig["chunk_processes"]
 
     creator = RuleBookEmbeddingCreator(tokenizer_name=tokenizer_name,
                                        embedder_model_name=embedder_name,
                                        overlap=overlap,
-                                       embedding_dim=embedding_dim)
+                                       embedding_dim=embedding_dim,
+                                       segmenter=segmenter,
+                                       index_type=index_type,
+                                       index_params=index_params,
+                                       embedding_cache_dir=embedding_cache_dir,
+                                       embedding_cache_dtype=embedding_cache_dtype,
+                                       embed_batch_size=embed_batch_size,
+                                       chunk_processes=chunk_processes)
 
     creator.process_rulebook(rulebook_path=rulebook_path,
                              index_path=index_path,
-                             mapping_path=mapping_path)
+                             mapping_path=mapping_path,
+                             incremental=incremental)
@@ -0,0 +1,80 @@
+import re
+
+# spaCy components of en_core_web_sm, everything except the sentence recognizer is excluded for "senter"
+_SPACY_MODEL = "en_core_web_sm"
+_SPACY_COMPONENTS_WITHOUT_SENTER = ["tok2vec", "tagger", "parser", "attribute_ruler", "lemmatizer", "ner"]
+
+SEGMENTERS = ("parser", "senter", "rules")
+
+
+class RuleBasedSentenceSplitter:
+    # lower case abbreviations that never end a sentence in the rule- and casebook
+    ABBREVIATIONS = {"e.g.", "i.e.", "etc.", "incl.", "approx.", "vs.", "cf.", "resp.", "min.", "max.", "sec.", "art.", "fig."}
+
+    # end of sentence punctuation, optionally followed by closing quotes/brackets, and the whitespace after it
+    _CANDIDATE = re.compile(r"[.!?]+[\"”’)\]]*\s+")
+    # a new sentence starts with an upper case letter, an opening quote or a bracket that is not an
+    # enumeration like "(II)", "(a)" or "(3)" (e.g. "(Rule 66 – Forfeit of Game)" or "( » For more information ...)")
+    _SENTENCE_START = re.compile(r"[A-Z“\"‘']|\((?!\s*(?:[IVXLC]+|[a-z]|\d+)\))")
+    _PARAGRAPH = re.compile(r"\n\s*\n")
+
+    def split(self, text: str) -> list:
+        """
+        Splits a text into sentences with a few rules tuned for the rulebook:
+          - A sentence ends with ".", "!" or "?" followed by whitespace and the start of a new sentence.
+          - Abbreviations like "e.g.", "i.e." or "(min.)" do not end a sentence.
+          - Enumerations like "(I)", "(II)" or "(a)" after a dot continue the sentence.
+          - Rule numbers ("Rule 4.1.") only end a sentence if they are followed by a new sentence.
+          - Empty lines always end a sentence.
+        :param text: The input text.
+        :return: List of stripped, non-empty sentences.
+        """
+        sentences = []
+        for paragraph in self._PARAGRAPH.split(text):
+            start = 0
+            for candidate in self._CANDIDATE.finditer(paragraph):
+                if self._is_sentence_end(paragraph, start, candidate):
+                    sentences.append(paragraph[start:candidate.end()].strip())
+                    start = candidate.end()
+            sentences.append(paragraph[start:].strip())
+
+        return [sentence for sentence in sentences if sentence]
+
+    def _is_sentence_end(self, text: str, start: int, candidate: re.Match) -> bool:
+        if not self._SENTENCE_START.match(text, candidate.end()):
+            return False
+
+        words = text[start:candidate.end()].split()
+        last_word = words[-1].lower().lstrip("(“\"‘'").rstrip(")]”\"’")
+        return last_word not in self.ABBREVIATIONS
+
+
+def load_sentence_segmenter(segmenter: str = "parser"):
+    """
+    Creates a sentence segmentation function.
+    :param segmenter: Segmentation backend:
+        - "parser": full en_core_web_sm pipeline, sentences come from the dependency parser (most accurate, slowest).
+        - "senter": en_core_web_sm with every component except the statistical sentence recognizer excluded
+                    (a fraction of the memory and latency of "parser").
+        - "rules": RuleBasedSentenceSplitter, no spaCy model needs to be loaded at all.
+    :return: Function that takes a text and returns the list of stripped, non-empty sentences.
+    """
+    if segmenter == "rules":
+        return RuleBasedSentenceSplitter().split
+
+    if segmenter not in SEGMENTERS:
+        raise ValueError(f"Unknown segmenter '{segmenter}', expected one of {SEGMENTERS}.")
+
+    import spacy  # imported here, so the "rules" segmenter does not load spaCy at all
+
+    if segmenter == "senter":
+        nlp = spacy.load(_SPACY_MODEL, exclude=_SPACY_COMPONENTS_WITHOUT_SENTER)
+        nlp.enable_pipe("senter")
+    else:
+        nlp = spacy.load(_SPACY_MODEL)
+
+    def segment(text: str) -> list:
+        doc = nlp(text)
+        return [sent.text.strip() for sent in doc.sents if sent.text.strip()]
+
+    return segment
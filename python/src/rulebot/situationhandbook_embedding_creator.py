@@ -1,50 +1,83 @@
 ﻿import json
-import pickle
 
-from embedder import Embedder
-from faiss_index_manager import FaissIndexManager
-from config import EmbeddingConfig
+from .embedder import Embedder
+from .faiss_index_manager import FaissIndexManager
+from .incremental_build import IncrementalIndexBuild
+from .rule_book_retriever import RuleBookRetriever
+from .rule_references import expand_casebook_references
+from .config import EmbeddingConfig
 
 
 class SituationHandBookEmbeddingCreator:
     def __init__(self,
                  embedder_model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
-                 embedding_dim: int = 384):
+                 embedding_dim: int = 384,
+                 index_type: str = "flat",
+                 index_params: dict = None,
+                 embedding_cache_dir: str = None,
+                 embedding_cache_dtype: str = "float32",
+                 embed_batch_size: int = 1024,
+                 rulebook_path: str = None):
         """
         Initializes the embedding creator for the situation handbook.
         :param embedder_model_name: Name of the SentenceTransformer model.
         :param embedding_dim: Dimension of the embeddings.
+        :param index_type: FAISS index type ("flat", "flat_fp16", "flat_sq8", "hnsw", "ivf_flat" or
+                           "ivf_pq"), see FaissIndexManager.
+        :param index_params: Build and search parameters of the index, see FaissIndexManager.
+        :param embedding_cache_dir: Directory of the persistent embedding cache, None = every chunk is encoded.
+        :param embedding_cache_dtype: Storage type of the cached embeddings, "float32" or "float16".
+        :param embed_batch_size: Number of chunks encoded and added to the index at once, bounds the memory
+                                 of the embeddings during a build.
+        :param rulebook_path: Path to the rulebook JSON file to resolve the rule references of the situations,
+                              None = the references are resolved when the prompt is built.
         """
-        self.embedder = Embedder(model_name=embedder_model_name)
+        self.embedder = Embedder(model_name=embedder_model_name, cache_dir=embedding_cache_dir,
+                                 cache_dtype=embedding_cache_dtype)
         self.embedding_dim = embedding_dim
-        self.faiss_manager = FaissIndexManager(embedding_dim)
+        self.embed_batch_size = embed_batch_size
+        self.faiss_manager = FaissIndexManager(embedding_dim, index_type=index_type, index_params=index_params, id_map=True)
+        # a change of these settings rebuilds all situations, see IncrementalIndexBuild
+        self.build_settings = {
+            "embedder_model_name": embedder_model_name,
+            "embedding_dim": embedding_dim,
+            "index_type": index_type,
+            "index_params": self.faiss_manager.build_params,
+        }
+        self.rulebook_retriever = RuleBookRetriever(rulebook_path) if rulebook_path else None
 
         print(f"Selected embedder model: {embedder_model_name}")
 
     def process_casebook(self, casebook_path: str,
                          index_path: str = "casebook_faiss_index.index",
-                         mapping_path: str = "casebook_chunk_mapping.pkl"):
+                         mapping_path: str = "casebook_chunk_mapping.pkl",
+                         incremental: bool = True):
         """
         Processes the full casebook (situation handbook):
           - Loads the casebook from a JSON file.
           - Uses the full question text as a single chunk (no splitting into multiple chunks).
           - Creates embeddings for the full question text.
           - Stores metadata (rule_id, rule_title, subrule_title) in the mapping.
+          - Resolves the rule references of the situations in the rulebook and reports the unresolved ones.
           - Adds embeddings to a FAISS index.
+        Incremental build: only new or changed situations are embedded, the vectors of changed and deleted
+        situations are removed from the existing index, and the mapping is patched (see IncrementalIndexBuild).
+        The rule references of all situations are resolved again, the rulebook may have changed.
 
         :param casebook_path: Path to the JSON file with the casebook.
                               Expected format: A list of objects, e.g.
                               [{ "id": "1.1.", "rule_title": "...", "subrule_title": "...", "text": "..." }, ...]
         :param index_path: Path where the FAISS index will be saved.
-        :param mapping_path: Path where the mapping (Pickle file) will be saved.
-        :return: Tuple (mapping, embeddings)
+        :param mapping_path: Path where the mapping (Pickle file) will be saved, the columnar mapping is saved next to it.
+        :param incremental: Update the index of the previous build, False = rebuild all situations.
+        :return: The mapping of all situations.
         """
         with open(casebook_path, "r", encoding="utf-8") as f:
             situations = json.load(f)
 
-        all_chunks = []
-        mapping = {}
-        current_index = 0
+        build = IncrementalIndexBuild(self.faiss_manager, index_path, mapping_path, self.build_settings,
+                                      lambda texts: self.embedder.embed(texts, show_progress_bar=False),
+                                      incremental=incremental, batch_size=self.embed_batch_size)
 
         for situation in situations:
             rule_id = situation.get("rule_id")
@@ -53,27 +86,30 @@ class SituationHandBookEmbeddingCreator:
             answer_text = situation.get("answer")
             rule_reference = situation.get("rule_reference")
 
-            all_chunks.append(question_text)
-            mapping[current_index] = {
+            key = str(situation_id)
+            if build.keep(key, situation):
+                continue
+
+            build.add(key, situation, [question_text], [{
                 "rule_id": rule_id,
                 "situation_id": situation_id,
                 "question": question_text,
                 "answer": answer_text,
                 "rule_reference": rule_reference,
-            }
-            current_index += 1
+            }])
 
-        print(f"Created {len(all_chunks)} chunks from {len(situations)} situations.")
+        build.finish()
 
-        embeddings = self.embedder.embed(all_chunks)
-        self.faiss_manager.add_embeddings(embeddings)
-        self.faiss_manager.save_index(index_path)
+        if self.rulebook_retriever is not None:
+            unresolved = expand_casebook_references(build.mapping, self.rulebook_retriever)
+            print(f"Resolved the rule references of {len(build.mapping)} situations, {len(unresolved)} not found in the rulebook"
+                  + (":" if unresolved else "."))
+            for situation_id, reference in unresolved:
+                print(f"  Situation {situation_id}: Rule {reference}")
 
-        with open(mapping_path, "wb") as f:
-            pickle.dump(mapping, f)
-        print(f"Mapping saved to '{mapping_path}'.")
+        build.publish()
 
-        return mapping, embeddings
+        return build.mapping
 
 
 if __name__ == "__main__":
@@ -82,11 +118,25 @@ if __name__ == "__main__":
     index_path = EmbeddingConfig["casebook_index_output_path"]
     mapping_path = EmbeddingConfig["casebook_chunk_mapping_path"]
     embedding_dim = EmbeddingConfig["embedding_dim"]
+    index_type = EmbeddingConfig["casebook_index_type"]
+    index_params = EmbeddingConfig["index_params"]
+    embedding_cache_dir = EmbeddingConfig["embedding_cache_dir"]
+    embedding_cache_dtype = EmbeddingConfig["embedding_cache_dtype"]
+    embed_batch_size = EmbeddingConfig["embed_batch_size"]
+    rulebook_path = EmbeddingConfig["rulebook_path"]
+    incremental = EmbeddingConfig["incremental_build"]
 
     creator = SituationHandBookEmbeddingCreator(
                                                 embedder_model_name=embedder_name,
-                                                embedding_dim=embedding_dim)
+                                                embedding_dim=embedding_dim,
+                                                index_type=index_type,
+                                                index_params=index_params,
+                                                embedding_cache_dir=embedding_cache_dir,
+                                                embedding_cache_dtype=embedding_cache_dtype,
+                                                embed_batch_size=embed_batch_size,
+                                                rulebook_path=rulebook_path)
 
     creator.process_casebook(casebook_path=casebook_path,
                              index_path=index_path,
-                             mapping_path=mapping_path)
+                             mapping_path=mapping_path,
+                             incremental=incremental)
@@ -1,17 +1,20 @@
-﻿import spacy
-from transformers import AutoTokenizer
+﻿from transformers import AutoTokenizer
+
+from .sentence_splitter import load_sentence_segmenter
 
 class TextChunker:
-    def __init__(self, tokenizer: AutoTokenizer, max_tokens: int = 256, overlap: int = 0):
+    def __init__(self, tokenizer: AutoTokenizer, max_tokens: int = 256, overlap: int = 0, segmenter: str = "parser"):
         """
         :param tokenizer: A Hugging Face tokenizer.
         :param max_tokens: Maximum number of tokens per chunk.
         :param overlap: Number of overlapping sentences between consecutive chunks.
+        :param segmenter: Sentence segmentation backend ("parser", "senter" or "rules"), see load_sentence_segmenter.
         """
         self.tokenizer = tokenizer
         self.max_tokens = max_tokens
         self.overlap = overlap
-        self.nlp = spacy.load("en_core_web_sm")
+        self.segmenter = segmenter
+        self.split_sentences = load_sentence_segmenter(segmenter)
 
     def chunk_text(self, text: str):
         """
@@ -19,32 +22,55 @@ class TextChunker:
         :param text: The full input text.
         :return: List of text chunks.
         """
-        doc = self.nlp(text)
         # Create a list of sentences
-        sentences = [sent.text.strip() for sent in doc.sents if sent.text.strip()]
+        sentences = self.split_sentences(text)
+        return self.chunk_sentences(sentences)
+
+    def sentence_token_counts(self, sentences: list) -> tuple:
+        """
+        Tokenizes every sentence once in a single batched tokenizer call.
+        Chunks are sentences joined by a space, so the token count of a chunk is the count of its first sentence
+        plus the counts of the following sentences with a leading space. The leading space matters for BPE tokenizers
+        (e.g. RoBERTa), where it becomes part of the first token; for WordPiece tokenizers both counts are equal.
+        :param sentences: List of (stripped) sentences.
+        :return: Tuple (counts, joined_counts) with the token count of each sentence at the start of a chunk
+                 and following another sentence.
+        """
+        if not sentences:
+            return [], []
+
+        input_ids = self.tokenizer(sentences + [" " + sentence for sentence in sentences], add_special_tokens=False)["input_ids"]
+        counts = [len(ids) for ids in input_ids]
+        return counts[:len(sentences)], counts[len(sentences):]
+
+    def chunk_sentences(self, sentences: list):
+        """
+        Packs sentences into chunks of at most max_tokens tokens, using cached per-sentence token counts
+        instead of re-tokenizing the growing chunk. The last 'overlap' sentences of a chunk are repeated
+        at the start of the next chunk.
+        :param sentences: List of (stripped) sentences.
+        :return: List of text chunks.
+        """
+        counts, joined_counts = self.sentence_token_counts(sentences)
         chunks = []
-        current_chunk = ""
+        current_chunk = []  # sentence indices of the current chunk
+        current_token_count = 0
 
-        for sentence in sentences:
+        for i, sentence in enumerate(sentences):
             # Calculate how many tokens the current chunk would have with this sentence added
-            test_chunk = current_chunk + " " + sentence if current_chunk else sentence
-            token_count = len(self.tokenizer.encode(test_chunk, add_special_tokens=False))
+            token_count = current_token_count + joined_counts[i] if current_chunk else counts[i]
 
             if token_count <= self.max_tokens:
-                current_chunk = test_chunk
+                current_chunk.append(i)
+                current_token_count = token_count
             else:
                 # If the current chunk, including this sentence, exceeds the chunk, save the previous chunk (without this sentence)
                 if current_chunk:
-                    chunks.append(current_chunk.strip())
-                    # If overlap is desired, extract the last 'overlap' sentences from the current chunk
-                    if self.overlap > 0:
-                        current_chunk_sentences = current_chunk.split('. ')
-                        overlap_sentences = ". ".join(current_chunk_sentences[-self.overlap:]) if len(
-                            current_chunk_sentences) >= self.overlap else current_chunk
-                    else:
-                        overlap_sentences = ""
-                    # Start the new chunk with the overlap sentences and the current sentence
-                    current_chunk = (overlap_sentences + " " + sentence).strip()
+                    chunks.append(" ".join(sentences[j] for j in current_chunk))
+                    # If overlap is desired, start the new chunk with the last 'overlap' sentences of the current chunk
+                    overlap_sentences = current_chunk[-self.overlap:] if self.overlap > 0 else []
+                    current_chunk = overlap_sentences + [i]
+                    current_token_count = counts[current_chunk[0]] + sum(joined_counts[j] for j in current_chunk[1:])
                 else:
                     # If a single sentence is longer than max_tokens, add it anyway as its own chunk
                     print("------------------------------------------")
@@ -52,9 +78,10 @@ class TextChunker:
                     print("Sentence:", sentence)
                     print("------------------------------------------")
                     chunks.append(sentence)
-                    current_chunk = ""
+                    current_chunk = []
+                    current_token_count = 0
 
         if current_chunk:
-            chunks.append(current_chunk.strip())
+            chunks.append(" ".join(sentences[j] for j in current_chunk))
 
         return chunks
@@ -0,0 +1,99 @@
+import os
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+from rulebot.faiss_index_manager import FaissIndexManager
+from rulebot.config import ApiConfig
+
+# corpus sizes, larger corpora are simulated with perturbed copies of the real rule- and casebook vectors
+CORPUS_SIZES = [None, 20000, 100000]  # None = real vectors only
+NUM_QUERIES = 200
+K = 10
+NOISE = 0.6  # perturbation of the copies and queries, relative to the unit length of the vectors
+
+CONFIGURATIONS = [
+    ("flat", {}, [{}]),
+    ("hnsw", {"hnsw_m": 32, "ef_construction": 200}, [{"ef_search": ef} for ef in (16, 32, 64, 128, 256)]),
+    ("ivf_flat", {}, [{"nprobe": nprobe} for nprobe in (1, 4, 8, 16, 32)]),
+    ("ivf_pq", {"pq_m": 48, "pq_nbits": 8}, [{"nprobe": nprobe} for nprobe in (1, 4, 8, 16, 32)]),
+]
+
+
+def load_vectors(path: str) -> np.ndarray:
+    index = faiss.read_index(path)
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def perturb(vectors: np.ndarray, size: int, rng: np.random.Generator) -> np.ndarray:
+    copies = vectors[rng.integers(0, len(vectors), size=size)]
+    copies = copies + rng.normal(scale=NOISE / np.sqrt(vectors.shape[1]), size=copies.shape).astype("float32")
+    return copies / np.linalg.norm(copies, axis=1, keepdims=True)
+
+
+def recall_at_k(indices: np.ndarray, queries: np.ndarray, corpus: np.ndarray, exact_similarities: np.ndarray) -> float:
+    """
+    Share of the found vectors that are at least as similar as the k-th exact result.
+    Compared by similarity instead of by id, since the rule- and casebook contain identical vectors.
+    """
+    similarities = np.einsum("qd,qkd->qk", queries, corpus[indices])
+    found = (indices >= 0) & (similarities >= exact_similarities[:, -1:] - 1e-5)
+    return found.sum(axis=1).mean() / exact_similarities.shape[1]
+
+
+def build(index_type: str, build_params: dict, corpus: np.ndarray) -> tuple:
+    """Builds the index, saves and reloads it (the training is part of the saved file)."""
+    params = dict(build_params)
+    if index_type.startswith("ivf"):
+        # rule of thumb 4 * sqrt(n) clusters, but at least 39 training vectors per cluster
+        params["nlist"] = max(1, min(int(4 * np.sqrt(len(corpus))), len(corpus) // 39))
+
+    manager = FaissIndexManager(corpus.shape[1], index_type=index_type, index_params=params)
+    start = time.perf_counter()
+    manager.add_embeddings(corpus)
+    build_seconds = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "index.index")
+        manager.save_index(path)
+        size = os.path.getsize(path)
+        loaded = FaissIndexManager(corpus.shape[1], index_params=params)
+        loaded.load_index(path)
+
+    assert loaded.index_type == index_type
+    return loaded, build_seconds, size
+
+
+def latency(manager: FaissIndexManager, queries: np.ndarray, search_params: dict) -> float:
+    """Mean latency of single-query searches, like the API does them."""
+    start = time.perf_counter()
+    for query in queries:
+        manager.search(query.reshape(1, -1), k=K, **search_params)
+    return (time.perf_counter() - start) / len(queries)
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(2025)
+    vectors = np.concatenate([load_vectors(ApiConfig["index_path"]), load_vectors(ApiConfig["casebook_index_path"])])
+    queries = perturb(vectors, NUM_QUERIES, rng)
+
+    for corpus_size in CORPUS_SIZES:
+        corpus = vectors if corpus_size is None else np.concatenate([vectors, perturb(vectors, corpus_size - len(vectors), rng)])
+
+        exact = FaissIndexManager(corpus.shape[1])
+        exact.add_embeddings(corpus)
+        exact_similarities, _ = exact.search(queries, k=K)
+
+        print(f"\ncorpus: {len(corpus)} vectors, {NUM_QUERIES} queries, recall@{K} against the flat index")
+        print(f"{'index':10} {'search params':18} {'recall':>7} {'latency':>10} {'build':>8} {'size':>9}")
+        for index_type, build_params, search_grid in CONFIGURATIONS:
+            manager, build_seconds, size = build(index_type, build_params, corpus)
+
+            for search_params in search_grid:
+                _, indices = manager.search(queries, k=K, **search_params)
+                recall = recall_at_k(indices, queries, corpus, exact_similarities)
+                print(f"{index_type:10} {str(search_params or '-'):18} {recall:7.3f} "
+                      f"{latency(manager, queries, search_params) * 1e6:7.0f} µs {build_seconds:7.2f}s "
+                      f"{size / 2 ** 20:6.1f} MiB")
@@ -0,0 +1,37 @@
+import time
+
+from rulebot import auth
+from rulebot.auth import get_api_key_local, check_openai_api_key, validate_api_key
+
+NUM_REQUESTS = 20
+
+
+def measure(function, api_key: str) -> list:
+    durations = []
+    for _ in range(NUM_REQUESTS):
+        start = time.perf_counter()
+        result = function(api_key)
+        durations.append(time.perf_counter() - start)
+        assert result["success"], result["error_message"]
+    return durations
+
+
+def print_durations(name: str, durations: list):
+    durations = sorted(durations)
+    print(f"{name:<28} mean: {sum(durations) / len(durations) * 1000:9.3f} ms   "
+          f"p50: {durations[len(durations) // 2] * 1000:9.3f} ms   max: {durations[-1] * 1000:9.3f} ms")
+
+
+if __name__ == "__main__":
+    openai_api_key = get_api_key_local()
+    auth.get_api_key_cache().delete(auth.hash_api_key(openai_api_key))
+
+    uncached = measure(check_openai_api_key, openai_api_key)
+    cached = measure(validate_api_key, openai_api_key)
+
+    print(f"API key validation, {NUM_REQUESTS} requests with the same key:")
+    print_durations("without cache", uncached)
+    print_durations("with cache (first = miss)", cached)
+    print_durations("with cache (hits only)", cached[1:])
+    print(f"Saved per request: {(sum(uncached) - sum(cached)) / NUM_REQUESTS * 1000:.1f} ms")
+    print("Cache stats:", auth.get_api_key_cache().stats())
@@ -0,0 +1,71 @@
+import time
+
+from rulebot import rag_pipeline
+from rulebot.rag_pipeline import RagPipeline
+from rulebot.query_options import QueryOptions
+from rulebot.config import ApiConfig
+
+NUM_QUESTIONS = 200
+OPENAI_LATENCY = 0.5  # seconds, typical duration of a gpt-4o-mini completion
+
+QUESTIONS = [
+    "Are commercial breaks allowed during overtime?",
+    "Is a player off-side, when he enters the offending zone prior to the puck?",
+    "The attacking team is substituting and is not playing the puck to avoid a too many players penalty. Should icing be called?",
+    "Which penalty should be applied when a player looses his helmet on the ice?",
+    "If a stick breaks, can the player still use it? What happens if he plays with it? What should the player do with a broken stick?",
+    "The game clock shows that time has expired, but the horn has not sounded to signal the end of the period. Is the period over?",
+    "Player A12 gets a minor penalty for roughing and a minor penalty for slashing. Player B6 gets a minor penalty for roughing. What penalties should be shown on the game clock and at what strength will both teams play?",
+]
+
+
+class LatencyAnswerGenerator:
+    """Replaces the OpenAI call, waits like the API would and answers with the prompt."""
+    def __init__(self, client_pool=None):
+        pass
+
+    def generate_answer(self, prompt: str, options: QueryOptions) -> dict:
+        time.sleep(OPENAI_LATENCY)
+        return {"success": True, "answer": prompt}
+
+
+if __name__ == "__main__":
+    rag_pipeline.AnswerGenerator = LatencyAnswerGenerator
+
+    pipeline = RagPipeline(
+        openai_api_key="",
+        embedder_model_name=ApiConfig["embedder_model_name"],
+        embedding_dim=ApiConfig["embedding_dim"],
+        index_path=ApiConfig["index_path"],
+        mapping_path=ApiConfig["chunk_mapping_path"],
+        casebook_index_path=ApiConfig["casebook_index_path"],
+        casebook_mapping_path=ApiConfig["casebook_chunk_mapping_path"],
+        # distinct questions, neither run may profit from cached embeddings or answers of the other
+        query_cache_size=0,
+        answer_cache_size=0,
+        batch_max_concurrency=ApiConfig["batch_max_concurrency"],
+    )
+
+    # numbered, so every question of the quiz set is different
+    questions = [f"Question {i}: {QUESTIONS[i % len(QUESTIONS)]}" for i in range(NUM_QUESTIONS)]
+    options = pipeline.default_options.with_changes(openai_api_key="sk-test")
+
+    start = time.perf_counter()
+    serial = [pipeline.process_query(question, options) for question in questions]
+    serial_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = pipeline.process_queries(questions, options)
+    batch_seconds = time.perf_counter() - start
+
+    # the batch must return exactly what the single requests return
+    for serial_result, batch_result in zip(serial, batch):
+        assert serial_result[0] == batch_result[0]
+        assert [rule["rule_id"] for rule in serial_result[2]] == [rule["rule_id"] for rule in batch_result[2]]
+        assert [s["situation_id"] for s in serial_result[4]] == [s["situation_id"] for s in batch_result[4]]
+
+    print(f"{NUM_QUESTIONS} questions, simulated OpenAI latency {OPENAI_LATENCY}s, "
+          f"concurrency {ApiConfig['batch_max_concurrency']}")
+    print(f"serial process_query: {serial_seconds:8.2f}s ({serial_seconds / NUM_QUESTIONS * 1000:7.1f} ms per question)")
+    print(f"process_queries:      {batch_seconds:8.2f}s ({batch_seconds / NUM_QUESTIONS * 1000:7.1f} ms per question)")
+    print(f"-> {serial_seconds / batch_seconds:.1f}x throughput")
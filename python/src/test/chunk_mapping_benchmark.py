@@ -0,0 +1,72 @@
+import pickle
+import timeit
+import tracemalloc
+
+import numpy as np
+
+from rulebot.chunk_mapping import ChunkMapping
+from rulebot.config import ApiConfig
+
+REPETITIONS = 200
+NUM_QUERIES = 32
+TOP_K = 10
+
+
+def load_pickle(path: str) -> dict:
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def traced_memory(function) -> int:
+    tracemalloc.start()
+    result = function()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def lookup_dict(mapping: dict, indices: np.ndarray, distances: np.ndarray) -> list:
+    """The former lookup of Retriever.retrieve_chunks (dict.get per hit)."""
+    retrieved_per_query = []
+    for query_distances, query_indices in zip(distances, indices):
+        retrieved = []
+        for sim, idx in zip(query_distances, query_indices):
+            chunk_info = mapping.get(idx, None)
+            if chunk_info:
+                retrieved.append({"rule_id": chunk_info["rule_id"], "similarity": sim})
+        retrieved_per_query.append(retrieved)
+    return retrieved_per_query
+
+
+def lookup_columnar(mapping: ChunkMapping, indices: np.ndarray, distances: np.ndarray) -> list:
+    """Same as Retriever.retrieve_chunks_batch after the FAISS search."""
+    entry_positions = mapping.lookup(indices)
+    found = entry_positions >= 0
+    rule_ids = mapping.column("rule_id")[np.where(found, entry_positions, 0)]
+    return [
+        [{"rule_id": rule_id, "similarity": sim} for rule_id, sim, is_found in zip(query_rule_ids, query_distances, query_found) if is_found]
+        for query_distances, query_rule_ids, query_found in zip(distances, rule_ids.tolist(), found.tolist())
+    ]
+
+
+if __name__ == "__main__":
+    for name, path in [("rulebook", ApiConfig["chunk_mapping_path"]), ("casebook", ApiConfig["casebook_chunk_mapping_path"])]:
+        ChunkMapping.load(path)  # converts the pickle file on first use
+
+        pickled = load_pickle(path)
+        columnar = ChunkMapping.load(path)
+        rng = np.random.default_rng(0)
+        indices = rng.integers(-1, len(pickled), size=(NUM_QUERIES, TOP_K))
+        distances = rng.random((NUM_QUERIES, TOP_K), dtype=np.float32)
+        assert lookup_dict(pickled, indices, distances) == lookup_columnar(columnar, indices, distances)
+
+        print(f"{name}: {len(pickled)} chunks, {len(columnar.entries)} distinct entries")
+        print(f"  load pickle:         {timeit.timeit(lambda: load_pickle(path), number=REPETITIONS) / REPETITIONS * 1000:7.2f} ms, "
+              f"{traced_memory(lambda: load_pickle(path)) / 1024:8.1f} KiB")
+        print(f"  load columnar mmap:  {timeit.timeit(lambda: ChunkMapping.load(path), number=REPETITIONS) / REPETITIONS * 1000:7.2f} ms, "
+              f"{traced_memory(lambda: ChunkMapping.load(path)) / 1024:8.1f} KiB")
+        print(f"  lookup dict:         {timeit.timeit(lambda: lookup_dict(pickled, indices, distances), number=REPETITIONS) / REPETITIONS * 1e6:7.1f} µs "
+              f"per {NUM_QUERIES}x{TOP_K} hits")
+        print(f"  lookup columnar:     {timeit.timeit(lambda: lookup_columnar(columnar, indices, distances), number=REPETITIONS) / REPETITIONS * 1e6:7.1f} µs "
+              f"per {NUM_QUERIES}x{TOP_K} hits")
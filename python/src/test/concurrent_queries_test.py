@@ -0,0 +1,100 @@
+import numbers
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from rulebot import rag_pipeline
+from rulebot.rag_pipeline import RagPipeline
+from rulebot.query_options import QueryOptions
+from rulebot.config import ApiConfig
+
+NUM_REQUESTS = 300
+NUM_THREADS = 32
+
+QUESTIONS = [
+    "Are commercial breaks allowed during overtime?",
+    "Is a player off-side, when he enters the offending zone prior to the puck?",
+    "The attacking team is substituting and is not playing the puck to avoid a too many players penalty. Should icing be called?",
+    "Which penalty should be applied when a player looses his helmet on the ice?",
+    "If a stick breaks, can the player still use it? What happens if he plays with it? What should the player do with a broken stick?",
+    # explicit references: a pure lookup (routed) and a question with the named rules in front of the retrieval
+    "What does Situation 4.1 say?",
+    "Is a player off-side according to Rule 83.1 when his skate is on the blue line?",
+]
+
+
+class EchoAnswerGenerator:
+    """Replaces the OpenAI call and answers with the settings of the request."""
+    def __init__(self, client_pool=None):
+        pass
+
+    def generate_answer(self, prompt: str, options: QueryOptions) -> dict:
+        return {"success": True, "answer": f"{options.openai_api_key}|{options.model}|{options.temperature}|{options.max_length}"}
+
+
+def random_options(request_number: int) -> QueryOptions:
+    return QueryOptions(
+        openai_api_key=f"sk-test-{request_number}",
+        model=random.choice(["gpt-4o-mini", "gpt-4o", "gpt-3.5-turbo"]),
+        top_k_chunks=random.randint(1, 30),
+        top_k_rules=random.randint(1, 5),
+        top_k_situations=random.randint(1, 5),
+        threshold=random.choice([0.0, 0.3, 0.6, 0.9]),
+        situation_threshold=random.choice([0.0, 0.5, 0.8]),
+        temperature=random.choice([0.0, 0.5, 1.0]),
+        max_length=random.randint(16, 4096),
+    )
+
+
+def check_result(options: QueryOptions, result: tuple, expected: tuple):
+    answer, prompt, all_rules, top_rules, situations = result
+
+    assert answer == f"{options.openai_api_key}|{options.model}|{options.temperature}|{options.max_length}", answer
+    # rules and situations named in the question ("reference") come on top of the retrieved ones
+    all_rules, top_rules = [[rule for rule in rules if "reference" not in rule] for rules in (all_rules, top_rules)]
+    assert all(situation["similarity"] == 1.0 for situation in situations if "reference" in situation)
+    situations = [situation for situation in situations if "reference" not in situation]
+    assert len(all_rules) <= options.top_k_chunks
+    assert len(top_rules) <= options.top_k_rules
+    # hybrid retrieval: rules and situations found by BM25 pass by their BM25 score instead of the threshold
+    assert all(rule["score_sum"] > options.threshold or rule.get("bm25_score", 0.0) >= ApiConfig["bm25_min_score"]
+               for rule in top_rules)
+    assert len(situations) <= options.top_k_situations
+    assert all(isinstance(situation["similarity"], numbers.Real) for situation in situations)
+    assert all(situation["similarity"] >= options.situation_threshold or "bm25_score" in situation
+               for situation in situations)
+    # a concurrent run must return exactly what a serial run returns for the same settings
+    assert result == expected
+
+
+if __name__ == "__main__":
+    random.seed(2025)
+    rag_pipeline.AnswerGenerator = EchoAnswerGenerator
+
+    pipeline = RagPipeline(
+        openai_api_key="",
+        embedder_model_name=ApiConfig["embedder_model_name"],
+        embedding_dim=ApiConfig["embedding_dim"],
+        index_path=ApiConfig["index_path"],
+        mapping_path=ApiConfig["chunk_mapping_path"],
+        casebook_index_path=ApiConfig["casebook_index_path"],
+        casebook_mapping_path=ApiConfig["casebook_chunk_mapping_path"],
+        # every request echoes its own api key, cached answers of other keys would not match
+        answer_cache_size=0,
+        hybrid_retrieval=True,
+        bm25_min_score=ApiConfig["bm25_min_score"],
+        reference_routing=True,
+    )
+
+    requests = [(random.choice(QUESTIONS), random_options(i)) for i in range(NUM_REQUESTS)]
+
+    # serial reference run
+    expected = [pipeline.process_query(question, options) for question, options in requests]
+
+    # concurrent run with mixed configurations on the same pipeline instance
+    with ThreadPoolExecutor(max_workers=NUM_THREADS) as executor:
+        results = list(executor.map(lambda request: pipeline.process_query(*request), requests))
+
+    for (question, options), result, expected_result in zip(requests, results, expected):
+        check_result(options, result, expected_result)
+
+    print(f"{NUM_REQUESTS} concurrent requests with mixed configurations used their own settings.")
@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+import numpy as np
+
+from rulebot.cache import EmbeddingCache
+from rulebot.config import EmbeddingConfig
+
+MODEL_NAME = EmbeddingConfig["embedder_model_name"]
+# chunking settings of a configuration sweep: (sentences per chunk, overlapping sentences)
+SWEEP = [(3, 1), (4, 1), (3, 0), (2, 1), (3, 1)]
+
+
+class CountingEncoder:
+    """Replaces SentenceTransformer.encode: a deterministic pseudo-embedding per text, counts the encoded texts."""
+    def __init__(self, embedding_dim: int):
+        self.embedding_dim = embedding_dim
+        self.encoded = 0
+
+    def __call__(self, texts: list) -> np.ndarray:
+        self.encoded += len(texts)
+        return np.array([np.random.default_rng(int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16], 16))
+                         .standard_normal(self.embedding_dim, dtype=np.float32) for text in texts])
+
+
+def chunk_rules(rules: list, sentences_per_chunk: int, overlap: int) -> list:
+    """Replaces the TextChunker: sentence windows of every rule text."""
+    chunks = []
+    for rule in rules:
+        sentences = [sentence for sentence in re.split(r"(?<=[.!?])\s+", rule.get("text", "").strip()) if sentence]
+        step = sentences_per_chunk - overlap
+        for start in range(0, max(len(sentences) - overlap, 1), step):
+            chunks.append(" ".join(sentences[start:start + sentences_per_chunk]))
+    return chunks
+
+
+def directory_size(directory: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names)
+
+
+if __name__ == "__main__":
+    with open(EmbeddingConfig["rulebook_path"], "r", encoding="utf-8") as f:
+        rules = json.load(f)
+    embedding_dim = EmbeddingConfig["embedding_dim"]
+
+    for dtype in ("float32", "float16"):
+        with tempfile.TemporaryDirectory() as directory:
+            encoder = CountingEncoder(embedding_dim)
+            print(f"\n{dtype} cache, chunking sweep over {len(rules)} rules")
+            without_cache = with_cache = 0
+            for sentences_per_chunk, overlap in SWEEP:
+                chunks = chunk_rules(rules, sentences_per_chunk, overlap)
+                encoded_before = encoder.encoded
+                # a new cache object per build, as every build is a new process
+                embeddings = EmbeddingCache(directory, MODEL_NAME, dtype=dtype).embed(chunks, encoder)
+                expected = CountingEncoder(embedding_dim)(chunks)
+                if dtype == "float32":
+                    assert np.array_equal(embeddings, expected), "cached embeddings differ from the model output"
+                else:
+                    assert np.array_equal(embeddings, expected.astype(np.float16).astype(np.float32))
+                without_cache += len(chunks)
+                with_cache += encoder.encoded - encoded_before
+                print(f"  {sentences_per_chunk} sentences, overlap {overlap}: {len(chunks):5d} chunks, "
+                      f"{encoder.encoded - encoded_before:5d} encoded")
+            print(f"  total: {with_cache} of {without_cache} chunks encoded "
+                  f"({(1 - with_cache / without_cache) * 100:.0f}% saved), "
+                  f"cache size {directory_size(directory) / 2 ** 20:.2f} MiB")
+
+            # an interrupted write (half a vector) is cut off, the text is encoded again
+            cache = EmbeddingCache(directory, MODEL_NAME, dtype=dtype)
+            size = len(cache)
+            cache.embed(["An interrupted text."], encoder)
+            vectors_path = os.path.join(cache._directory, f"vectors.{dtype}.bin")
+            os.truncate(vectors_path, os.path.getsize(vectors_path) - embedding_dim)
+            cache = EmbeddingCache(directory, MODEL_NAME, dtype=dtype)
+            assert len(cache) == size, "a half-written row was not cut off"
+            encoded_before = encoder.encoded
+            cache.embed(["An interrupted text.", "An interrupted text."], encoder)
+            assert encoder.encoded == encoded_before + 1, "a text missing in the cache must be encoded exactly once"
+
+            # embeddings of another model are not reused
+            other = CountingEncoder(embedding_dim)
+            EmbeddingCache(directory, "another-model", dtype=dtype).embed(chunk_rules(rules[:10], 3, 1), other)
+            assert other.encoded > 0
+
+    print("\nEmbedding cache checks passed.")
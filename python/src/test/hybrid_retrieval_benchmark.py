@@ -0,0 +1,118 @@
+import re
+import timeit
+
+import numpy as np
+
+from rulebot.chunk_mapping import ChunkMapping
+from rulebot.faiss_index_manager import FaissIndexManager
+from rulebot.retriever import Retriever
+from rulebot.rule_book_retriever import RuleBookRetriever
+from rulebot.config import ApiConfig, EmbeddingConfig, STOPWORDS
+
+RECALL_AT = [1, 3, 5, 10]
+REPETITIONS = 3
+
+
+def keyword_search(rules_text: list, keywords: list) -> list:
+    """The former substring search of roberta/semantic_searcher.py over every rule text."""
+    matching_rules = []
+    for idx, rule in enumerate(rules_text):
+        for keyword in keywords:
+            if keyword in rule.lower():
+                matching_rules.append(idx)
+                break
+    return matching_rules
+
+
+def reference_keys(rule_reference: list) -> set:
+    """Normalized rule IDs of a casebook reference list, e.g. "78.5 (IV)" -> "78.5"."""
+    keys = set()
+    for reference in rule_reference or []:
+        match = re.match(r"\d+(?:\.\d+)*", str(reference).strip())
+        if match:
+            keys.add(match.group(0))
+    return keys
+
+
+def recall(ranked_rule_ids: list, references: set) -> float:
+    """Share of the referenced rules found, a reference to a whole rule ("4") is found by any of its subrules."""
+    keys = [RuleBookRetriever.normalize_rule_id(rule_id) for rule_id in ranked_rule_ids]
+    return sum(any(key == reference or key.startswith(reference + ".") for key in keys)
+               for reference in references) / len(references)
+
+
+if __name__ == "__main__":
+    rulebook_index = FaissIndexManager(ApiConfig["embedding_dim"])
+    rulebook_index.load_index(ApiConfig["index_path"])
+    casebook_index = FaissIndexManager(ApiConfig["embedding_dim"])
+    casebook_index.load_index(ApiConfig["casebook_index_path"])
+    casebook_mapping = ChunkMapping.load(ApiConfig["casebook_chunk_mapping_path"])
+    rulebook_retriever = RuleBookRetriever(EmbeddingConfig["rulebook_path"])
+    retriever = Retriever(ApiConfig["embedding_dim"], rulebook_index, casebook_index,
+                          ChunkMapping.load(ApiConfig["chunk_mapping_path"]), casebook_mapping,
+                          rulebook_retriever, lexical_search=True)
+
+    # casebook questions with known rule references, the casebook index holds exactly their MiniLM embeddings
+    questions, query_embeddings, references = [], [], []
+    for row, position in enumerate(casebook_mapping.rows.tolist()):
+        entry = casebook_mapping.entries[position]
+        if position >= 0 and entry["question"] and reference_keys(entry["rule_reference"]):
+            questions.append(entry["question"])
+            query_embeddings.append(casebook_index.index.reconstruct(row))
+            references.append(reference_keys(entry["rule_reference"]))
+    query_embeddings = np.array(query_embeddings)
+
+    similarities, rule_codes = retriever.retrieve_rule_hits_batch(query_embeddings, ApiConfig["top_k_chunks"])
+    top_k = max(RECALL_AT)
+    results = {"dense": [], "bm25": [], "hybrid": []}
+    prompt_results = {"dense": [], "hybrid": []}
+    for question, query_similarities, query_rule_codes, query_references in zip(questions, similarities, rule_codes, references):
+        all_rules, top_rules = retriever.retrieve_rules_from_hits(query_similarities, query_rule_codes,
+                                                                  ApiConfig["top_k_rules"], ApiConfig["threshold"])
+        fused_rules, _, _ = retriever.fuse_lexical(question, all_rules, [], top_k, -np.inf, 0,
+                                                   lexical_top_k=ApiConfig["bm25_top_k"], rrf_k=ApiConfig["rrf_k"])
+        _, fused_top_rules, _ = retriever.fuse_lexical(question, all_rules, [], ApiConfig["top_k_rules"],
+                                                       ApiConfig["threshold"], 0,
+                                                       lexical_top_k=ApiConfig["bm25_top_k"], rrf_k=ApiConfig["rrf_k"],
+                                                       min_bm25_score=ApiConfig["bm25_min_score"])
+        _, documents = retriever._rule_bm25.search(question, top_k)
+
+        results["dense"].append([rule["rule_id"] for rule in all_rules])
+        results["bm25"].append([rulebook_retriever.rules[document]["id"] for document in documents.tolist()])
+        results["hybrid"].append([rule["rule_id"] for rule in fused_rules])
+        prompt_results["dense"].append([rule["rule_id"] for rule in top_rules])
+        prompt_results["hybrid"].append([rule["rule_id"] for rule in fused_top_rules])
+
+    print(f"rule recall on {len(questions)} casebook questions with rule references "
+          f"(top_k_chunks {ApiConfig['top_k_chunks']}, bm25_top_k {ApiConfig['bm25_top_k']}, rrf_k {ApiConfig['rrf_k']})")
+    print(f"{'method':8} " + " ".join(f"{f'recall@{k}':>10}" for k in RECALL_AT))
+    for method, ranked in results.items():
+        print(f"{method:8} " + " ".join(f"{np.mean([recall(r[:k], refs) for r, refs in zip(ranked, references)]):10.3f}"
+                                        for k in RECALL_AT))
+    print(f"\nprompt rules (top_k_rules {ApiConfig['top_k_rules']}, threshold {ApiConfig['threshold']}, "
+          f"bm25_min_score {ApiConfig['bm25_min_score']})")
+    for method, ranked in prompt_results.items():
+        print(f"{method:8} recall {np.mean([recall(r, refs) for r, refs in zip(ranked, references)]):.3f}, "
+              f"{np.mean([len(r) for r in ranked]):.2f} rules per question")
+
+    rules_text = [rule.get("text") or "" for rule in rulebook_retriever.rules]
+    keywords = [[token for token in question.lower().split() if token not in STOPWORDS] for question in questions]
+    situations = retriever.retrieve_situations_batch(query_embeddings, ApiConfig["top_k_situations"],
+                                                     ApiConfig["situation_threshold"])
+    results_rules = [retriever.retrieve_rules_from_hits(s, c, ApiConfig["top_k_rules"], ApiConfig["threshold"])[0]
+                     for s, c in zip(similarities, rule_codes)]
+    timings = {
+        "keyword_search (substring)": lambda: [keyword_search(rules_text, words) for words in keywords],
+        "BM25 rules": lambda: [retriever._rule_bm25.search(question, ApiConfig["bm25_top_k"]) for question in questions],
+        "BM25 situations": lambda: [retriever._situation_bm25.search(question, ApiConfig["top_k_situations"])
+                                    for question in questions],
+        "fuse_lexical (both + RRF)": lambda: [
+            retriever.fuse_lexical(question, all_rules, query_situations, ApiConfig["top_k_rules"], ApiConfig["threshold"],
+                                   ApiConfig["top_k_situations"], ApiConfig["bm25_top_k"], ApiConfig["rrf_k"],
+                                   ApiConfig["bm25_min_score"])
+            for question, all_rules, query_situations in zip(questions, results_rules, situations)],
+    }
+    print(f"\nlatency per question ({len(rulebook_retriever.rules)} rules, {len(casebook_mapping.entries)} situations)")
+    for label, function in timings.items():
+        seconds = min(timeit.repeat(function, number=1, repeat=REPETITIONS)) / len(questions)
+        print(f"  {label:28} {seconds * 1e6:8.1f} µs")
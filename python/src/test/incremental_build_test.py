@@ -0,0 +1,136 @@
+import copy
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from rulebot.chunk_mapping import ChunkMapping
+from rulebot.faiss_index_manager import FaissIndexManager
+from rulebot.incremental_build import IncrementalIndexBuild
+from rulebot.rule_book_retriever import RuleBookRetriever
+from rulebot.config import EmbeddingConfig
+
+INDEX_TYPES = ["flat", "ivf_flat", "hnsw"]
+INDEX_PARAMS = {"nlist": 16}
+BATCH_SIZE = 100  # several batches per build
+CHUNK_CHARACTERS = 400
+NUM_QUERIES = 50
+
+
+class HashEmbedder:
+    """Replaces the SentenceTransformer: a deterministic pseudo-embedding per text, counts the embedded texts."""
+    def __init__(self, embedding_dim: int):
+        self.embedding_dim = embedding_dim
+        self.embedded = 0
+
+    def embed(self, texts: list) -> np.ndarray:
+        self.embedded += len(texts)
+        return np.array([np.random.default_rng(int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16], 16))
+                         .standard_normal(self.embedding_dim, dtype=np.float32) for text in texts])
+
+
+def chunk_text(rule: dict) -> list:
+    """Replaces the TextChunker, the rule ID keeps the chunks of different rules distinct."""
+    text = rule["text"]
+    return [f"{rule.get('id')} {text[start:start + CHUNK_CHARACTERS]}" for start in range(0, len(text), CHUNK_CHARACTERS)]
+
+
+def build(rules: list, index_type: str, index_path: str, mapping_path: str, embedder: HashEmbedder,
+          incremental: bool = True, publish: bool = True) -> FaissIndexManager:
+    """The loop of RuleBookEmbeddingCreator.process_rulebook with the stand-in embedder and chunker."""
+    manager = FaissIndexManager(embedder.embedding_dim, index_type=index_type, index_params=INDEX_PARAMS, id_map=True)
+    settings = {"chunk_characters": CHUNK_CHARACTERS, "index_type": index_type, "index_params": manager.index_params}
+    incremental_build = IncrementalIndexBuild(manager, index_path, mapping_path, settings, embedder.embed,
+                                              incremental=incremental, batch_size=BATCH_SIZE)
+    for rule in rules:
+        if not rule.get("text", "").strip():
+            continue
+        key = RuleBookRetriever.normalize_rule_id(rule.get("id"))
+        if incremental_build.keep(key, rule):
+            continue
+        chunks = chunk_text(rule)
+        incremental_build.add(key, rule, chunks, [{"rule_id": rule.get("id"), "chunk_text": chunk,
+                                                   "rule_title": rule.get("rule_title"),
+                                                   "subrule_title": rule.get("subrule_title")} for chunk in chunks])
+    incremental_build.finish()
+    if publish:
+        incremental_build.publish()
+    else:
+        # interrupted update: the index is saved, the mapping and the manifest are not
+        manager.save_index(index_path)
+    return manager
+
+
+def results(index_path: str, mapping_path: str, queries: np.ndarray, index_type: str) -> list:
+    """Exhaustive search of the saved build, as (rule_id, similarity) per hit."""
+    manager = FaissIndexManager(queries.shape[1], index_params=INDEX_PARAMS)
+    manager.load_index(index_path, mmap=True)
+    mapping = ChunkMapping.load(mapping_path)
+    distances, indices = manager.search(queries, k=10, ef_search=4096, nprobe=INDEX_PARAMS["nlist"])
+    positions = mapping.lookup(indices)
+    assert (positions >= 0).all(), "a search result has no mapping entry"
+    return [[(str(mapping.entries[position]["rule_id"]), round(float(distance), 4))
+             for position, distance in zip(query_positions, query_distances)]
+            for query_positions, query_distances in zip(positions.tolist(), distances)]
+
+
+if __name__ == "__main__":
+    with open(EmbeddingConfig["rulebook_path"], "r", encoding="utf-8") as f:
+        rules = json.load(f)
+    embedding_dim = EmbeddingConfig["embedding_dim"]
+    queries = np.random.default_rng(2025).standard_normal((NUM_QUERIES, embedding_dim), dtype=np.float32)
+
+    # mid-season correction: one rule text changed, one rule removed, one rule added
+    edited_rules = copy.deepcopy(rules)
+    edited = next(rule for rule in edited_rules if rule.get("text", "").strip())
+    edited["text"] += " (Interpretation: this also applies during overtime.)"
+    removed = edited_rules.pop(len(edited_rules) // 2)
+    edited_rules.append({"id": "999.1.", "rule_title": "TEST", "subrule_title": "NEW RULE", "text": "A new rule. " * 20})
+    changed_chunks = len(chunk_text(edited)) + len(chunk_text(edited_rules[-1]))
+
+    for index_type in INDEX_TYPES:
+        with tempfile.TemporaryDirectory() as directory:
+            index_path = os.path.join(directory, "rulebook_faiss_index.index")
+            mapping_path = os.path.join(directory, "rulebook_chunk_mapping.pkl")
+            full_index_path = os.path.join(directory, "full.index")
+            full_mapping_path = os.path.join(directory, "full_mapping.pkl")
+
+            embedder = HashEmbedder(embedding_dim)
+            start = time.perf_counter()
+            build(rules, index_type, index_path, mapping_path, embedder, incremental=False)
+            full_seconds = time.perf_counter() - start
+            full_embedded = embedder.embedded
+
+            embedder = HashEmbedder(embedding_dim)
+            build(rules, index_type, index_path, mapping_path, embedder)
+            assert embedder.embedded == 0, "an unchanged rulebook must not be embedded again"
+
+            embedder = HashEmbedder(embedding_dim)
+            start = time.perf_counter()
+            build(edited_rules, index_type, index_path, mapping_path, embedder)
+            incremental_seconds = time.perf_counter() - start
+            assert embedder.embedded == changed_chunks, (embedder.embedded, changed_chunks)
+
+            build(edited_rules, index_type, full_index_path, full_mapping_path, HashEmbedder(embedding_dim),
+                  incremental=False)
+            expected = results(full_index_path, full_mapping_path, queries, index_type)
+            actual = results(index_path, mapping_path, queries, index_type)
+            assert actual == expected, "incremental != full build"
+
+            # an interrupted update is completed by the next build
+            build(rules, index_type, index_path, mapping_path, HashEmbedder(embedding_dim), publish=False)
+            build(edited_rules, index_type, index_path, mapping_path, HashEmbedder(embedding_dim))
+            assert results(index_path, mapping_path, queries, index_type) == expected, "interrupted update not recovered"
+            # rows and entries are versioned as a pair, only the current and the previous version are kept
+            versions = [name for name in os.listdir(directory)
+                        if name.startswith("rulebook_chunk_mapping.") and name.endswith(".rows.npy")]
+            assert 1 <= len(versions) <= 2, versions
+
+            print(f"{index_type:8} full build {full_embedded} chunks embedded in {full_seconds * 1000:7.1f} ms, "
+                  f"one-rule edit {changed_chunks} chunks embedded in {incremental_seconds * 1000:7.1f} ms "
+                  f"(without the model time)")
+
+    print("Incremental builds match the full builds.")
@@ -0,0 +1,87 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from rulebot.faiss_index_manager import FaissIndexManager
+from rulebot.config import ApiConfig
+
+WORKER_COUNTS = [1, 2, 4, 8]
+SYNTHETIC_SIZE = 100000  # vectors of the synthetic index (about 150 MiB as flat index)
+NUM_QUERIES = 32
+
+
+def memory_kib() -> dict:
+    """Rss, Pss and private memory of the current process from /proc/self/smaps_rollup (Linux only)."""
+    values = {}
+    with open("/proc/self/smaps_rollup", "r") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1])
+    return {"rss": values["Rss"], "pss": values["Pss"],
+            "private": values["Private_Clean"] + values["Private_Dirty"]}
+
+
+def worker(index_paths: list, mmap: bool, barrier, results):
+    """Loads the indexes like one API worker at startup, searches once and reports its memory."""
+    before = memory_kib()
+    start = time.perf_counter()
+    managers = []
+    for path in index_paths:
+        manager = FaissIndexManager(ApiConfig["embedding_dim"])
+        manager.load_index(path, mmap=mmap)
+        managers.append(manager)
+    load_seconds = time.perf_counter() - start
+
+    # a flat search reads every vector, so all pages of the index are resident afterwards
+    queries = np.random.default_rng(os.getpid()).normal(size=(NUM_QUERIES, ApiConfig["embedding_dim"])).astype("float32")
+    for manager in managers:
+        manager.search(queries, k=10)
+
+    barrier.wait()  # Pss splits shared pages between the processes mapping them, so all workers must be alive
+    after = memory_kib()
+    results.put({"load": load_seconds, **{key: after[key] - before[key] for key in after}})
+    barrier.wait()
+
+
+def run(index_paths: list, mmap: bool, num_workers: int) -> list:
+    context = multiprocessing.get_context("spawn")  # like uvicorn workers, nothing is inherited via fork
+    barrier = context.Barrier(num_workers)
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(index_paths, mmap, barrier, results)) for _ in range(num_workers)]
+    for process in processes:
+        process.start()
+    measurements = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return measurements
+
+
+def report(name: str, index_paths: list):
+    size = sum(os.path.getsize(path) for path in index_paths) / 2 ** 20
+    print(f"\n{name}: {len(index_paths)} index file(s), {size:.1f} MiB")
+    print(f"{'mode':6} {'workers':>7} {'load/worker':>12} {'rss/worker':>11} {'pss total':>10} {'private total':>14}")
+    for mmap in (False, True):
+        for num_workers in WORKER_COUNTS:
+            measurements = run(index_paths, mmap, num_workers)
+            print(f"{'mmap' if mmap else 'read':6} {num_workers:>7} "
+                  f"{np.mean([m['load'] for m in measurements]) * 1000:9.1f} ms "
+                  f"{np.mean([m['rss'] for m in measurements]) / 1024:7.1f} MiB "
+                  f"{sum(m['pss'] for m in measurements) / 1024:6.1f} MiB "
+                  f"{sum(m['private'] for m in measurements) / 1024:10.1f} MiB")
+
+
+if __name__ == "__main__":
+    # memory growth caused by the indexes (measured after load and one search, startup of the interpreter excluded)
+    report("rulebook + casebook", [ApiConfig["index_path"], ApiConfig["casebook_index_path"]])
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "synthetic.index")
+        manager = FaissIndexManager(ApiConfig["embedding_dim"])
+        manager.add_embeddings(np.random.default_rng(2025).normal(size=(SYNTHETIC_SIZE, ApiConfig["embedding_dim"])).astype("float32"))
+        manager.save_index(path)
+        del manager
+        report(f"synthetic flat index ({SYNTHETIC_SIZE} vectors)", [path])
@@ -0,0 +1,76 @@
+import os
+import timeit
+
+import numpy as np
+
+from rulebot.chunk_mapping import ChunkMapping
+from rulebot.faiss_index_manager import FaissIndexManager
+from rulebot.multi_index_search import MultiIndexSearch
+from rulebot.retriever import Retriever
+from rulebot.rule_book_retriever import RuleBookRetriever
+from rulebot.config import ApiConfig, EmbeddingConfig
+
+NUM_QUERIES = 200
+SYNTHETIC_SIZES = [20000, 100000]  # vectors per synthetic index
+TOP_K = {"rulebook": ApiConfig["top_k_chunks"], "casebook": ApiConfig["top_k_situations"]}
+
+
+def load_index(path: str) -> FaissIndexManager:
+    manager = FaissIndexManager(ApiConfig["embedding_dim"])
+    manager.load_index(path)
+    return manager
+
+
+def synthetic_index(size: int, rng: np.random.Generator) -> FaissIndexManager:
+    manager = FaissIndexManager(ApiConfig["embedding_dim"])
+    manager.add_embeddings(rng.normal(size=(size, ApiConfig["embedding_dim"])).astype("float32"))
+    return manager
+
+
+def check_parity(retriever: Retriever, query_embeddings: np.ndarray):
+    """The combined search returns the same hits as the two separate searches."""
+    similarities, rule_codes = retriever.retrieve_rule_hits_batch(query_embeddings, TOP_K["rulebook"])
+    situations = retriever.retrieve_situations_batch(query_embeddings, TOP_K["casebook"], 0.0)
+    fused_similarities, fused_rule_codes, fused_situations = retriever.retrieve_batch(
+        query_embeddings, TOP_K["rulebook"], TOP_K["casebook"], 0.0)
+    assert np.array_equal(rule_codes, fused_rule_codes) and np.allclose(similarities, fused_similarities)
+    assert [[s["situation_id"] for s in q] for q in situations] == [[s["situation_id"] for s in q] for q in fused_situations]
+
+
+def sequential(indexes: dict, query_embedding: np.ndarray):
+    """The former retrieval: each index normalizes the query and is searched after the other."""
+    return {name: index.search(query_embedding, k=TOP_K[name]) for name, index in indexes.items()}
+
+
+def report(name: str, indexes: dict, queries: np.ndarray):
+    """Mean latency of single-query searches, like the API does them."""
+    searches = {"sequential": lambda query: sequential(indexes, query)}
+    for max_workers in (0, 1):
+        search = MultiIndexSearch(indexes, max_workers=max_workers)
+        searches[f"combined, {max_workers} thread(s)"] = lambda query, search=search: search.search(query, k=TOP_K)
+
+    print(f"\n{name}: " + ", ".join(f"{index_name} {index.index.ntotal} vectors" for index_name, index in indexes.items()))
+    baseline = None
+    for label, search in searches.items():
+        seconds = timeit.timeit(lambda: [search(query.reshape(1, -1)) for query in queries], number=1) / len(queries)
+        baseline = baseline or seconds
+        print(f"  {label:24} {seconds * 1e6:8.1f} µs ({(1 - seconds / baseline) * 100:+5.1f}% saved)")
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(2025)
+    queries = rng.normal(size=(NUM_QUERIES, ApiConfig["embedding_dim"])).astype("float32")
+    print(f"{os.cpu_count()} CPU core(s)")
+
+    rulebook_index = load_index(ApiConfig["index_path"])
+    casebook_index = load_index(ApiConfig["casebook_index_path"])
+    retriever = Retriever(ApiConfig["embedding_dim"], rulebook_index, casebook_index,
+                          ChunkMapping.load(ApiConfig["chunk_mapping_path"]),
+                          ChunkMapping.load(ApiConfig["casebook_chunk_mapping_path"]),
+                          RuleBookRetriever(EmbeddingConfig["rulebook_path"]))
+    check_parity(retriever, queries)
+    retriever.close()
+
+    report("real indexes", {"rulebook": rulebook_index, "casebook": casebook_index}, queries)
+    for size in SYNTHETIC_SIZES:
+        report("synthetic indexes", {"rulebook": synthetic_index(size, rng), "casebook": synthetic_index(size, rng)}, queries)
@@ -0,0 +1,65 @@
+import multiprocessing
+import resource
+import timeit
+import tracemalloc
+
+import numpy as np
+
+from rulebot.faiss_index_manager import FaissIndexManager
+from rulebot.config import ApiConfig
+
+NUM_QUERIES = 200
+BUILD_SIZE = 100000  # vectors of the synthetic corpus (about 150 MiB float32)
+
+
+def allocated_bytes(function) -> int:
+    """Peak of the NumPy allocations made by function (the FAISS index storage itself is not traced)."""
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def build(mode: str, results):
+    """Builds a flat index in a fresh process and reports the peak RSS growth of add_embeddings."""
+    embeddings = np.random.default_rng(2025).standard_normal((BUILD_SIZE, ApiConfig["embedding_dim"]), dtype=np.float32)
+    if mode == "pre-normalized":
+        FaissIndexManager.normalize(embeddings, inplace=True)
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    manager = FaissIndexManager(ApiConfig["embedding_dim"])
+    manager.add_embeddings(embeddings, normalized=mode == "pre-normalized", inplace=mode == "in place")
+
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((after - before) / 1024)
+
+
+if __name__ == "__main__":
+    manager = FaissIndexManager(ApiConfig["embedding_dim"])
+    manager.load_index(ApiConfig["index_path"])
+
+    # unit vectors, as returned by QueryEmbedder
+    queries = FaissIndexManager.normalize(np.random.default_rng(0).normal(size=(NUM_QUERIES, ApiConfig["embedding_dim"])))
+    queries = [query.reshape(1, -1) for query in queries]
+    for query in queries[:10]:
+        expected = manager.search(query, k=10)
+        actual = manager.search(query, k=10, normalized=True)
+        assert np.array_equal(expected[1], actual[1]) and np.allclose(expected[0], actual[0], atol=1e-6)
+
+    print(f"single-query search, rulebook index ({manager.index.ntotal} vectors)")
+    for label, normalized in (("normalized copy", False), ("pre-normalized", True)):
+        seconds = timeit.timeit(lambda: [manager.search(query, k=10, normalized=normalized) for query in queries],
+                                number=10) / (10 * NUM_QUERIES)
+        allocated = allocated_bytes(lambda: manager.search(queries[0], k=10, normalized=normalized))
+        print(f"  {label:16} {seconds * 1e6:7.1f} µs {allocated:6d} B allocated")
+
+    print(f"\nbuild of a flat index with {BUILD_SIZE} vectors "
+          f"({BUILD_SIZE * ApiConfig['embedding_dim'] * 4 / 2 ** 20:.0f} MiB), peak RSS growth of add_embeddings")
+    context = multiprocessing.get_context("spawn")
+    for mode in ("normalized copy", "in place", "pre-normalized"):
+        results = context.Queue()
+        process = context.Process(target=build, args=(mode, results))
+        process.start()
+        print(f"  {mode:16} {results.get():7.1f} MiB")
+        process.join()
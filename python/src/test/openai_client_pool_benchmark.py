@@ -0,0 +1,98 @@
+import json
+import threading
+import timeit
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import openai
+
+from rulebot.answer_generator import AnswerGenerator
+from rulebot.openai_client_pool import OpenAIClientPool
+from rulebot.query_options import QueryOptions
+
+REQUESTS = 200
+API_KEY = "sk-benchmark"
+
+COMPLETION = {
+    "id": "chatcmpl-benchmark",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-4o-mini",
+    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "No icing."}}],
+}
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    """Answers every request with a fixed chat completion and counts the opened TCP connections."""
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True  # headers and body are sent separately, avoid delayed ACKs on kept-alive connections
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        StubOpenAIHandler.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        body = json.dumps(COMPLETION).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def generate_with_new_client(base_url: str, prompt: str, options: QueryOptions):
+    """The former hot path: a new OpenAI client (and HTTP connection pool) for every request."""
+    client = openai.OpenAI(api_key=options.openai_api_key, base_url=base_url)
+    response = client.chat.completions.create(model=options.model,
+                                              messages=[{"role": "user", "content": prompt}],
+                                              temperature=options.temperature,
+                                              max_tokens=options.max_length)
+    return response.choices[0].message.content
+
+
+def profile(name: str, function):
+    StubOpenAIHandler.connections = 0
+    tracemalloc.start()
+    seconds = timeit.timeit(function, number=REQUESTS)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{name:22} {seconds / REQUESTS * 1000:8.3f} ms per request, "
+          f"{StubOpenAIHandler.connections:4} TCP connections, peak traced memory {peak / 1024:8.1f} KiB")
+    return seconds
+
+
+def pooled_client_of_key(pool: OpenAIClientPool):
+    with pool.client(API_KEY) as client:
+        return client
+
+
+if __name__ == "__main__":
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOpenAIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+
+    options = QueryOptions(openai_api_key=API_KEY)
+    pool = OpenAIClientPool(max_size=8, base_url=base_url)
+    generator = AnswerGenerator(client_pool=pool)
+
+    # client construction alone, without any network traffic
+    print(f"{REQUESTS} requests against a local OpenAI stub\n")
+    print("client construction:")
+    new_client = profile("  new client", lambda: openai.OpenAI(api_key=API_KEY, base_url=base_url))
+    pooled_client = profile("  pooled client", lambda: pooled_client_of_key(pool))
+    print(f"  -> {new_client / pooled_client:.0f}x faster\n")
+
+    # complete answer generation including the HTTP request
+    print("answer generation:")
+    new_client = profile("  new client", lambda: generate_with_new_client(base_url, "Icing?", options))
+    pooled_client = profile("  pooled client", lambda: generator.generate_answer("Icing?", options))
+    print(f"  -> {new_client / pooled_client:.1f}x faster")
+    print(f"\npool: {pool.stats()}")
+
+    server.shutdown()
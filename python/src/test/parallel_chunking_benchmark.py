@@ -0,0 +1,38 @@
+import json
+import os
+import time
+
+from rulebot.parallel_chunker import ParallelTextChunker
+from rulebot.config import EmbeddingConfig
+
+PROCESSES = [1, 2, 4, 8]
+CORPUS_COPIES = 4  # the rulebook repeated, a corpus of the size of several rulebooks (all rules changed)
+
+
+def chunk_corpus(texts: list, processes: int) -> tuple:
+    """Chunks the texts as a full build does, the time includes the start of the worker processes."""
+    chunker = ParallelTextChunker(EmbeddingConfig["tokenizer_model_name"], max_tokens=EmbeddingConfig["max_tokens"],
+                                  overlap=EmbeddingConfig["overlap"], segmenter=EmbeddingConfig["segmenter"],
+                                  processes=processes)
+    start = time.perf_counter()
+    chunks = list(chunker.chunk_texts(texts))
+    return chunks, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    with open(EmbeddingConfig["rulebook_path"], "r", encoding="utf-8") as f:
+        rules = json.load(f)
+    texts = [rule["text"] for rule in rules if rule.get("text", "").strip()] * CORPUS_COPIES
+
+    print(f"chunking {len(texts)} rule texts ({CORPUS_COPIES}x the rulebook), segmenter "
+          f"'{EmbeddingConfig['segmenter']}', {os.cpu_count()} CPUs")
+    expected, serial_seconds = chunk_corpus(texts, 1)
+    print(f"  1 process   {serial_seconds:6.1f} s")
+    for processes in PROCESSES[1:]:
+        if processes > (os.cpu_count() or 1):
+            print(f"  {processes} processes skipped, only {os.cpu_count()} CPUs (ParallelTextChunker uses at most one per CPU)")
+            continue
+        chunks, seconds = chunk_corpus(texts, processes)
+        assert chunks == expected, f"the chunks of {processes} processes differ from the serial chunks"
+        print(f"  {processes} processes {seconds:6.1f} s  speedup {serial_seconds / seconds:4.1f}x")
+    print(f"{sum(len(chunks) for chunks in expected)} chunks, identical for all process counts.")
@@ -0,0 +1,173 @@
+import os
+import re
+import tempfile
+import time
+
+import numpy as np
+
+from rulebot.chunk_mapping import ChunkMapping
+from rulebot.faiss_index_manager import FaissIndexManager
+from rulebot.rule_book_retriever import RuleBookRetriever
+from rulebot.config import ApiConfig
+
+RECALL_AT = [1, 3, 5, 10]
+K = ApiConfig["top_k_chunks"]
+SYNTHETIC_SIZE = 20000  # perturbed copies of the real vectors, enough to train 8-bit PQ codebooks
+NOISE = 0.6  # perturbation of the copies, relative to the unit length of the vectors
+
+CONFIGURATIONS = [
+    ("flat", {}),
+    ("flat_fp16", {}),
+    ("flat_sq8", {}),
+    ("ivf_pq", {"pq_m": 48}),
+    ("ivf_pq", {"pq_m": 48, "refine": "sq8"}),
+    ("ivf_pq", {"pq_m": 48, "refine": "fp16"}),
+    ("ivf_pq", {"pq_m": 24, "refine": "sq8"}),
+]
+
+
+def load_vectors(path: str) -> tuple:
+    """The stored vectors of an index with their IDs, as the chunk mapping references them."""
+    manager = FaissIndexManager(ApiConfig["embedding_dim"])
+    manager.load_index(path)
+    return manager.index.reconstruct_n(0, manager.index.ntotal), manager.ids
+
+
+def perturb(vectors: np.ndarray, size: int, rng: np.random.Generator) -> np.ndarray:
+    copies = vectors[rng.integers(0, len(vectors), size=size)]
+    copies = copies + rng.normal(scale=NOISE / np.sqrt(vectors.shape[1]), size=copies.shape).astype("float32")
+    return copies / np.linalg.norm(copies, axis=1, keepdims=True)
+
+
+def reference_keys(rule_reference: list) -> set:
+    """Normalized rule IDs of a casebook reference list, e.g. "78.5 (IV)" -> "78.5"."""
+    keys = set()
+    for reference in rule_reference or []:
+        match = re.match(r"\d+(?:\.\d+)*", str(reference).strip())
+        if match:
+            keys.add(match.group(0))
+    return keys
+
+
+def rule_recall(ranked_rule_ids: list, references: set) -> float:
+    """Share of the referenced rules found, a reference to a whole rule ("4") is found by any of its subrules."""
+    keys = [RuleBookRetriever.normalize_rule_id(rule_id) for rule_id in ranked_rule_ids]
+    return sum(any(key == reference or key.startswith(reference + ".") for key in keys)
+               for reference in references) / len(references)
+
+
+def neighbor_recall(distances: np.ndarray, exact_distances: np.ndarray) -> float:
+    """
+    Share of the found vectors that are at least as similar as the k-th exact result (by the exact similarity of
+    the stored float32 vectors), compared by similarity since the corpora contain identical vectors.
+    """
+    return (distances >= exact_distances[:, -1:] - 1e-5).sum(axis=1).mean() / exact_distances.shape[1]
+
+
+def build(index_type: str, params: dict, vectors: np.ndarray, ids: np.ndarray, path: str) -> tuple:
+    """Builds the index with the IDs of the mapping, saves and reloads it (memory-mapped, as the API does)."""
+    params = {**params, "nlist": max(1, min(int(4 * np.sqrt(len(vectors))), len(vectors) // 39))}
+    params["nprobe"] = params["nlist"]  # all clusters: only the error of the quantization is measured
+    manager = FaissIndexManager(vectors.shape[1], index_type=index_type, index_params=params, id_map=True)
+    manager.add_embeddings(vectors, ids=ids)
+    manager.save_index(path)
+    loaded = FaissIndexManager(vectors.shape[1], index_params=params)
+    loaded.load_index(path, mmap=True)
+    assert loaded.index_type == index_type and loaded.index_params["refine"] == params.get("refine")
+    return loaded, os.path.getsize(path)
+
+
+def exact_similarities(queries: np.ndarray, vectors: np.ndarray, ids: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    """Similarities of the found vectors recomputed with the float32 vectors (the quantized scores are approximate)."""
+    order = np.argsort(ids)
+    rows = order[np.minimum(np.searchsorted(ids, indices, sorter=order), len(ids) - 1)]
+    similarities = np.einsum("qd,qkd->qk", queries, vectors[rows])
+    return np.where(indices >= 0, similarities, -np.inf)
+
+
+def label(index_type: str, params: dict) -> str:
+    if index_type != "ivf_pq":
+        return index_type
+    return f"ivf_pq{params['pq_m']}" + (f"+{params['refine']}" if params.get("refine") else "")
+
+
+def latency(manager: FaissIndexManager, queries: np.ndarray) -> float:
+    """Mean latency of single-query searches, like the API does them."""
+    start = time.perf_counter()
+    for query in queries:
+        manager.search(query.reshape(1, -1), k=K)
+    return (time.perf_counter() - start) / len(queries)
+
+
+def report(directory: str):
+    rulebook_vectors, rulebook_ids = load_vectors(ApiConfig["index_path"])
+    casebook_vectors, casebook_ids = load_vectors(ApiConfig["casebook_index_path"])
+    rulebook_vectors = FaissIndexManager.normalize(rulebook_vectors)
+    casebook_vectors = FaissIndexManager.normalize(casebook_vectors)
+    rulebook_mapping = ChunkMapping.load(ApiConfig["chunk_mapping_path"])
+    casebook_mapping = ChunkMapping.load(ApiConfig["casebook_chunk_mapping_path"])
+
+    # the casebook retrieval set: casebook questions with known rule references, embedded as stored in the casebook
+    queries, references = [], []
+    for vector, position in zip(casebook_vectors, casebook_mapping.lookup(casebook_ids).tolist()):
+        entry = casebook_mapping.entries[position] if position >= 0 else {}
+        if entry.get("question") and reference_keys(entry.get("rule_reference")):
+            queries.append(vector)
+            references.append(reference_keys(entry["rule_reference"]))
+    queries = np.array(queries)
+
+    print(f"casebook retrieval set: {len(queries)} questions with rule references, rulebook {len(rulebook_vectors)} "
+          f"chunks, casebook {len(casebook_vectors)} situations, top {K} chunks, all IVF clusters probed")
+    print(f"{'index':16} {'memory':>9} {'ratio':>6} " + " ".join(f"{f'rules@{k}':>8}" for k in RECALL_AT)
+          + f" {'chunks@' + str(K):>10} {'situations':>10} {'latency':>10}")
+    exact_rulebook = exact_casebook = flat_memory = None
+    for index_type, params in CONFIGURATIONS:
+        name = label(index_type, params)
+        rulebook, rulebook_size = build(index_type, params, rulebook_vectors, rulebook_ids,
+                                        os.path.join(directory, f"rulebook_{name}.index"))
+        casebook, casebook_size = build(index_type, params, casebook_vectors, casebook_ids,
+                                        os.path.join(directory, f"casebook_{name}.index"))
+        _, rule_indices = rulebook.search(queries, k=K, normalized=True)
+        _, situation_indices = casebook.search(queries, k=ApiConfig["top_k_situations"], normalized=True)
+        rule_similarities = exact_similarities(queries, rulebook_vectors, rulebook_ids, rule_indices)
+        situation_similarities = exact_similarities(queries, casebook_vectors, casebook_ids, situation_indices)
+        if exact_rulebook is None:
+            exact_rulebook, exact_casebook = rule_similarities, situation_similarities
+            flat_memory = rulebook_size + casebook_size
+
+        ranked = []
+        for positions in rulebook_mapping.lookup(rule_indices).tolist():
+            rule_ids = [rulebook_mapping.entries[position]["rule_id"] for position in positions if position >= 0]
+            ranked.append(list(dict.fromkeys(rule_ids)))
+        memory = rulebook_size + casebook_size
+        print(f"{name:16} {memory / 2 ** 20:5.2f} MiB {flat_memory / memory:5.1f}x "
+              + " ".join(f"{np.mean([rule_recall(r[:k], refs) for r, refs in zip(ranked, references)]):8.3f}"
+                         for k in RECALL_AT)
+              + f" {neighbor_recall(rule_similarities, exact_rulebook):10.3f}"
+              + f" {neighbor_recall(situation_similarities, exact_casebook):10.3f}"
+              + f" {latency(rulebook, queries) * 1e6:7.0f} µs")
+
+    # a corpus large enough for the codebooks of PQ: perturbed copies of the rule- and casebook vectors
+    rng = np.random.default_rng(2025)
+    vectors = np.concatenate([rulebook_vectors, casebook_vectors])
+    corpus = np.concatenate([vectors, perturb(vectors, SYNTHETIC_SIZE - len(vectors), rng)])
+    ids = np.arange(len(corpus), dtype=np.int64)
+    print(f"\nsynthetic corpus: {len(corpus)} vectors, the {len(queries)} casebook questions as queries")
+    print(f"{'index':16} {'memory':>9} {'ratio':>6} {'bytes/vector':>13} {f'recall@{K}':>10} {'latency':>10}")
+    exact_similarity = flat_memory = None
+    for index_type, params in CONFIGURATIONS:
+        manager, size = build(index_type, params, corpus, ids,
+                              os.path.join(directory, f"synthetic_{label(index_type, params)}.index"))
+        _, indices = manager.search(queries, k=K, normalized=True)
+        similarities = exact_similarities(queries, corpus, ids, indices)
+        if exact_similarity is None:
+            exact_similarity, flat_memory = similarities, size
+        print(f"{label(index_type, params):16} {size / 2 ** 20:5.2f} MiB {flat_memory / size:5.1f}x "
+              f"{size / len(corpus):13.0f} {neighbor_recall(similarities, exact_similarity):10.3f} "
+              f"{latency(manager, queries) * 1e6:7.0f} µs")
+
+
+if __name__ == "__main__":
+    # the indexes are memory-mapped from their files, as in the API
+    with tempfile.TemporaryDirectory() as directory:
+        report(directory)
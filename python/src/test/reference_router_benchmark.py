@@ -0,0 +1,72 @@
+import timeit
+
+from rulebot.chunk_mapping import ChunkMapping
+from rulebot.faiss_index_manager import FaissIndexManager
+from rulebot.retriever import Retriever
+from rulebot.rule_book_retriever import RuleBookRetriever
+from rulebot.rule_references import ReferenceRouter
+from rulebot.config import ApiConfig, EmbeddingConfig
+
+REPETITIONS = 200
+
+ROUTED_QUESTIONS = [
+    "What does Rule 63 say?",
+    "Rule 4.1",
+    "Explain Rules 20.4 and 78.5 (IV).",
+    "What is the answer to Situation 5.1?",
+    "Can you show me rule 46.2?",
+]
+NOT_ROUTED_QUESTIONS = [
+    "What happens if a player shoots the puck out of the rink?",  # no reference
+    "What does Rule 9 say?",  # whole rule with more than max_rules subrules
+    "What does Rule 999 say?",  # unknown rule
+    "Is a hand pass in rule 79 allowed in the defending zone?",  # no lookup, rule 79 is put in front of the retrieval
+]
+
+
+if __name__ == "__main__":
+    rulebook_retriever = RuleBookRetriever(EmbeddingConfig["rulebook_path"])
+    casebook_mapping = ChunkMapping.load(ApiConfig["casebook_chunk_mapping_path"])
+    router = ReferenceRouter(rulebook_retriever, casebook_mapping, max_rules=ApiConfig["reference_max_rules"])
+
+    for question in ROUTED_QUESTIONS:
+        top_rules, situations = router.route(question)
+        print(f"{question!r:45} -> rules {[rule['rule_id'] for rule in top_rules]}, "
+              f"situations {[situation['situation_id'] for situation in situations]}")
+    for question in NOT_ROUTED_QUESTIONS:
+        assert router.route(question) is None
+        resolved = router.resolve(question)
+        print(f"{question!r:45} -> normal retrieval"
+              + (f" + rules {[rule['rule_id'] for rule in resolved[0]]}" if resolved else ""))
+
+    questions = [entry["question"] for entry in casebook_mapping.entries if entry["question"]]
+    routed = sum(router.route(question) is not None for question in questions)
+    resolved = sum(router.resolve(question) is not None for question in questions)
+    print(f"\n{routed} of {len(questions)} casebook questions would be routed, "
+          f"{resolved} get their named rules in front of the retrieval")
+
+    # the skipped part of the normal retrieval, without the query embedding (SentenceTransformer not measured here)
+    rulebook_index = FaissIndexManager(ApiConfig["embedding_dim"])
+    rulebook_index.load_index(ApiConfig["index_path"])
+    casebook_index = FaissIndexManager(ApiConfig["embedding_dim"])
+    casebook_index.load_index(ApiConfig["casebook_index_path"])
+    retriever = Retriever(ApiConfig["embedding_dim"], rulebook_index, casebook_index,
+                          ChunkMapping.load(ApiConfig["chunk_mapping_path"]), casebook_mapping, rulebook_retriever)
+    query_embedding = casebook_index.index.reconstruct(0).reshape(1, -1)
+
+    def vector_search():
+        similarities, rule_codes, _ = retriever.retrieve_batch(query_embedding, ApiConfig["top_k_chunks"],
+                                                               ApiConfig["top_k_situations"],
+                                                               ApiConfig["situation_threshold"], normalized=True)
+        retriever.retrieve_rules_from_hits(similarities[0], rule_codes[0], ApiConfig["top_k_rules"], ApiConfig["threshold"])
+
+    print("\nlatency per question")
+    timings = [
+        ("route, with reference", ROUTED_QUESTIONS, router.route),
+        ("route, without reference", NOT_ROUTED_QUESTIONS, router.route),
+        ("vector search + aggregation", ROUTED_QUESTIONS, lambda question: vector_search()),
+    ]
+    for label, timed_questions, function in timings:
+        seconds = timeit.timeit(lambda: [function(question) for question in timed_questions], number=REPETITIONS)
+        print(f"  {label:28} {seconds / (REPETITIONS * len(timed_questions)) * 1e6:8.1f} µs")
+    retriever.close()
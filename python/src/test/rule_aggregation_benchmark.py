@@ -0,0 +1,106 @@
+import timeit
+
+import numpy as np
+
+from rulebot.chunk_mapping import ChunkMapping
+from rulebot.faiss_index_manager import FaissIndexManager
+from rulebot import retriever as retriever_module
+from rulebot.retriever import Retriever, VECTORIZED_MIN_HITS
+from rulebot.rule_book_retriever import RuleBookRetriever
+from rulebot.config import ApiConfig, EmbeddingConfig
+
+NUM_QUERIES = 20
+REPETITIONS = 20
+
+
+class HitsIndex:
+    """Stands in for the rulebook FAISS index and returns prepared hits, so top_k_chunks can exceed the index size."""
+    def __init__(self, distances: np.ndarray, indices: np.ndarray):
+        self._distances = distances
+        self._indices = indices
+
+    def search(self, query_embeddings: np.ndarray, k: int = 5):
+        return self._distances[:, :k], self._indices[:, :k]
+
+
+def reference_scores(chunks: list, aggregation: str) -> dict:
+    """Aggregated score per rule computed with the dictionary path."""
+    similarities = {}
+    for chunk in chunks:
+        similarities.setdefault(chunk["rule_id"], []).append(chunk["similarity"])
+    aggregate = {"sum": None, "max": max, "mean": lambda values: np.float32(sum(values) / len(values))}[aggregation]
+    return {rule_id: aggregate(values) for rule_id, values in similarities.items()} if aggregate else None
+
+
+def vectorized_from(min_hits: int):
+    """Sets the number of hits from which retrieve_rules_from_hits groups with NumPy (0 = always)."""
+    retriever_module.VECTORIZED_MIN_HITS = min_hits
+
+
+def check_parity(retriever: Retriever, query_embeddings: np.ndarray, top_k_chunks: int, top_k_rules: int, threshold: float):
+    # both paths of retrieve_rules_from_hits, the dictionary and the NumPy group by
+    for min_hits in (top_k_chunks + 1, 0):
+        vectorized_from(min_hits)
+        check_path_parity(retriever, query_embeddings, top_k_chunks, top_k_rules, threshold)
+    vectorized_from(VECTORIZED_MIN_HITS)
+
+
+def check_path_parity(retriever: Retriever, query_embeddings: np.ndarray, top_k_chunks: int, top_k_rules: int,
+                      threshold: float):
+    chunks_per_query = retriever.retrieve_chunks_batch(query_embeddings, top_k_chunks)
+    similarities, rule_codes = retriever.retrieve_rule_hits_batch(query_embeddings, top_k_chunks)
+
+    for chunks, query_similarities, query_rule_codes in zip(chunks_per_query, similarities, rule_codes):
+        expected = retriever.retrieve_rules_from_chunks(chunks, top_k_rules, threshold)
+        assert retriever.retrieve_rules_from_hits(query_similarities, query_rule_codes, top_k_rules, threshold) == expected
+
+        for aggregation in ("max", "mean"):
+            all_rules, top_rules = retriever.retrieve_rules_from_hits(query_similarities, query_rule_codes,
+                                                                      top_k_rules, threshold, aggregation)
+            expected_scores = reference_scores(chunks, aggregation)
+            assert all(np.isclose(rule["score"], expected_scores[rule["rule_id"]]) for rule in all_rules)
+            assert all(a["score"] >= b["score"] for a, b in zip(all_rules, all_rules[1:]))
+            assert top_rules == [rule for rule in all_rules if rule["score"] > threshold][:top_k_rules]
+
+
+if __name__ == "__main__":
+    rulebook_index = FaissIndexManager(ApiConfig["embedding_dim"])
+    rulebook_index.load_index(ApiConfig["index_path"])
+    mapping = ChunkMapping.load(ApiConfig["chunk_mapping_path"])
+    rulebook_retriever = RuleBookRetriever(EmbeddingConfig["rulebook_path"])
+
+    rng = np.random.default_rng(2025)
+    query_embeddings = rng.normal(size=(NUM_QUERIES, ApiConfig["embedding_dim"])).astype("float32")
+
+    # real index, top_k_chunks up to the number of chunks
+    retriever = Retriever(ApiConfig["embedding_dim"], rulebook_index, None, mapping, None, rulebook_retriever)
+    for top_k_chunks in (10, 100, rulebook_index.index.ntotal):
+        check_parity(retriever, query_embeddings, top_k_chunks, top_k_rules=3, threshold=0.0)
+
+    # prepared hits with many chunks per rule, as a larger (e.g. finer chunked) rulebook would return
+    max_k = 20000
+    distances = -np.sort(-rng.random((NUM_QUERIES, max_k), dtype=np.float32), axis=1)
+    indices = rng.integers(0, len(mapping), size=(NUM_QUERIES, max_k))
+    retriever = Retriever(ApiConfig["embedding_dim"], HitsIndex(distances, indices), None, mapping, None, rulebook_retriever)
+
+    print(f"{NUM_QUERIES} questions, {len(mapping.entries)} rules")
+    print(f"vectorized from {VECTORIZED_MIN_HITS} hits")
+    print(f"{'top_k_chunks':>12} {'from chunks':>12} {'dict':>12} {'vectorized':>12} {'dispatched':>12}")
+    for top_k_chunks in (10, 100, 1000, 5000, max_k):
+        check_parity(retriever, query_embeddings, top_k_chunks, top_k_rules=3, threshold=top_k_chunks / 1000)
+
+        chunks_per_query = retriever.retrieve_chunks_batch(query_embeddings, top_k_chunks)
+        similarities, rule_codes = retriever.retrieve_rule_hits_batch(query_embeddings, top_k_chunks)
+
+        from_chunks = timeit.timeit(lambda: [retriever.retrieve_rules_from_chunks(chunks, 3, 0.6)
+                                             for chunks in chunks_per_query], number=REPETITIONS)
+        timings = []
+        for min_hits in (top_k_chunks + 1, 0, VECTORIZED_MIN_HITS):
+            vectorized_from(min_hits)
+            timings.append(timeit.timeit(lambda: [retriever.retrieve_rules_from_hits(s, c, 3, 0.6)
+                                                  for s, c in zip(similarities, rule_codes)], number=REPETITIONS))
+        vectorized_from(VECTORIZED_MIN_HITS)
+
+        queries = NUM_QUERIES * REPETITIONS
+        print(f"{top_k_chunks:>12} " + " ".join(f"{seconds / queries * 1000:9.3f} ms"
+                                                 for seconds in [from_chunks] + timings))
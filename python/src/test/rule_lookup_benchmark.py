@@ -0,0 +1,44 @@
+import json
+import timeit
+
+from rulebot.rule_book_retriever import RuleBookRetriever
+from rulebot.config import EmbeddingConfig
+
+REPETITIONS = 20
+
+
+def get_rule_by_id_linear(rules: list, rule_id):
+    """The former implementation of RuleBookRetriever.get_rule_by_id (linear scan)."""
+    rule_id = str(rule_id).rstrip(".") + "."
+    for rule in rules:
+        if rule.get("id") == rule_id:
+            return {
+                "rule_id": rule["id"],
+                "rule_title": rule.get("rule_title", None),
+                "subrule_title": rule.get("subrule_title", None),
+                "text": rule.get("text", None)
+            }
+    return None
+
+
+if __name__ == "__main__":
+    retriever = RuleBookRetriever(EmbeddingConfig["rulebook_path"])
+
+    # all rule references of the casebook, i.e. what PromptBuilder resolves
+    with open(EmbeddingConfig["casebook_path"], "r", encoding="utf-8") as f:
+        situations = json.load(f)
+    references = [reference for situation in situations for reference in (situation.get("rule_reference") or [])]
+
+    # both implementations must return the same rules (except for numeric IDs, which the scan never found)
+    for reference in references:
+        assert get_rule_by_id_linear(retriever.rules, reference) == retriever.get_rule_by_id(reference), reference
+
+    linear = timeit.timeit(lambda: [get_rule_by_id_linear(retriever.rules, r) for r in references], number=REPETITIONS)
+    indexed = timeit.timeit(lambda: [retriever.get_rule_by_id(r) for r in references], number=REPETITIONS)
+    batch = timeit.timeit(lambda: retriever.get_rules_by_ids(references), number=REPETITIONS)
+
+    lookups = len(references) * REPETITIONS
+    print(f"{len(references)} casebook rule references, {len(retriever.rules)} rules, {REPETITIONS} repetitions")
+    print(f"linear scan:      {linear / lookups * 1e6:8.2f} µs per lookup")
+    print(f"hash index:       {indexed / lookups * 1e6:8.2f} µs per lookup ({linear / indexed:.0f}x faster)")
+    print(f"get_rules_by_ids: {batch / lookups * 1e6:8.2f} µs per lookup ({linear / batch:.0f}x faster)")
@@ -0,0 +1,76 @@
+import json
+import time
+import tracemalloc
+from transformers import AutoTokenizer
+
+from rulebot.sentence_splitter import load_sentence_segmenter, SEGMENTERS
+from rulebot.text_chunker import TextChunker
+from rulebot.config import EmbeddingConfig
+
+REFERENCE = "parser"
+MAX_EXAMPLES = 10
+
+
+def sentence_ends(text: str, sentences: list) -> set:
+    """Character offsets in the text at which the sentences end."""
+    ends = set()
+    position = 0
+    for sentence in sentences:
+        position = text.index(sentence, position) + len(sentence)
+        ends.add(position)
+    return ends
+
+
+def load(segmenter: str):
+    tracemalloc.start()
+    start = time.perf_counter()
+    segment = load_sentence_segmenter(segmenter)
+    load_time = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return segment, load_time, memory
+
+
+if __name__ == "__main__":
+    with open(EmbeddingConfig["rulebook_path"], "r", encoding="utf-8") as f:
+        texts = [rule["text"] for rule in json.load(f) if rule.get("text") and rule["text"].strip()]
+    with open(EmbeddingConfig["casebook_path"], "r", encoding="utf-8") as f:
+        texts += [situation["question"] for situation in json.load(f) if situation.get("question")]
+
+    tokenizer = AutoTokenizer.from_pretrained(EmbeddingConfig["tokenizer_model_name"])
+    results = {}
+
+    print(f"{len(texts)} texts (rules and casebook questions)\n")
+    print(f"{'segmenter':<10} {'load time':>10} {'load memory':>12} {'segmentation':>14} {'sentences':>10}")
+    for segmenter in SEGMENTERS:
+        segment, load_time, memory = load(segmenter)
+        start = time.perf_counter()
+        sentences = [segment(text) for text in texts]
+        duration = time.perf_counter() - start
+        results[segmenter] = sentences
+        print(f"{segmenter:<10} {load_time:9.2f}s {memory / 2 ** 20:10.1f}MB "
+              f"{duration / len(texts) * 1000:11.3f}ms {sum(map(len, sentences)):10d}")
+
+    for segmenter in SEGMENTERS:
+        if segmenter == REFERENCE:
+            continue
+
+        chunker = TextChunker(tokenizer, max_tokens=EmbeddingConfig["max_tokens"], overlap=EmbeddingConfig["overlap"], segmenter=segmenter)
+        different_texts, different_chunks, missing, additional, examples = 0, 0, 0, 0, []
+        for text, reference, sentences in zip(texts, results[REFERENCE], results[segmenter]):
+            reference_ends = sentence_ends(text, reference)
+            ends = sentence_ends(text, sentences)
+            if reference_ends != ends:
+                different_texts += 1
+                missing += len(reference_ends - ends)
+                additional += len(ends - reference_ends)
+                if len(examples) < MAX_EXAMPLES:
+                    examples.append([f"   {'+' if end in ends else '-'} ...{text[max(0, end - 60):end]}|{text[end:end + 30]}..."
+                                     for end in sorted(reference_ends ^ ends)])
+            if chunker.chunk_sentences(reference) != chunker.chunk_sentences(sentences):
+                different_chunks += 1
+
+        print(f"\n'{segmenter}' vs '{REFERENCE}': {different_texts} of {len(texts)} texts with different boundaries "
+              f"({missing} missing, {additional} additional), {different_chunks} texts with different chunks")
+        for example in examples:
+            print("\n".join(example))
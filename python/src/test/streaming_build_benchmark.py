@@ -0,0 +1,78 @@
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import numpy as np
+
+from rulebot.faiss_index_manager import FaissIndexManager
+from rulebot.incremental_build import IncrementalIndexBuild
+from rulebot.config import EmbeddingConfig
+
+NUM_CHUNKS = 100000  # synthetic corpus, about 150 MiB of float32 embeddings
+BATCH_SIZES = [256, 1024, 8192]
+INDEX_TYPES = ["flat", "ivf_pq"]
+INDEX_PARAMS = {"nlist": 256}
+
+
+def encode(texts: list) -> np.ndarray:
+    """Replaces the SentenceTransformer: random embeddings, as the model returns them (float32, not normalized)."""
+    return np.random.default_rng(len(texts)).standard_normal((len(texts), EmbeddingConfig["embedding_dim"]),
+                                                             dtype=np.float32)
+
+
+def chunks():
+    """The chunks of the corpus, generated one after the other."""
+    for number in range(NUM_CHUNKS):
+        yield f"rule {number // 4}", f"Chunk {number % 4} of rule {number // 4}."
+
+
+def build(index_type: str, batch_size: int, results):
+    """Builds the index in a fresh process and reports the peak RSS growth and the duration."""
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    manager = FaissIndexManager(EmbeddingConfig["embedding_dim"], index_type=index_type, index_params=INDEX_PARAMS,
+                                id_map=batch_size is not None)
+
+    with tempfile.TemporaryDirectory() as directory:
+        index_path = os.path.join(directory, "index.index")
+        mapping_path = os.path.join(directory, "mapping.pkl")
+        if batch_size is None:
+            # the former build: all chunks collected, encoded at once and added with a normalized copy
+            mapping, texts = {}, []
+            for row, (rule_id, text) in enumerate(chunks()):
+                texts.append(text)
+                mapping[row] = {"rule_id": rule_id, "chunk_text": text}
+            manager.add_embeddings(encode(texts))
+        else:
+            incremental_build = IncrementalIndexBuild(manager, index_path, mapping_path, {}, encode,
+                                                      incremental=False, batch_size=batch_size)
+            texts_by_rule = {}
+            for rule_id, text in chunks():
+                texts_by_rule.setdefault(rule_id, []).append(text)
+                if len(texts_by_rule[rule_id]) == 4:
+                    texts = texts_by_rule.pop(rule_id)
+                    incremental_build.add(rule_id, texts, texts, [{"rule_id": rule_id, "chunk_text": text}
+                                                                  for text in texts])
+            incremental_build.finish()
+
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put(((after - before) / 1024, time.perf_counter() - start, manager.index.ntotal))
+
+
+if __name__ == "__main__":
+    embedding_mib = NUM_CHUNKS * EmbeddingConfig["embedding_dim"] * 4 / 2 ** 20
+    print(f"build of {NUM_CHUNKS} chunks ({embedding_mib:.0f} MiB of float32 embeddings), peak RSS growth")
+    context = multiprocessing.get_context("spawn")
+    for index_type in INDEX_TYPES:
+        print(f"\n{index_type}")
+        for batch_size in [None] + BATCH_SIZES:
+            results = context.Queue()
+            process = context.Process(target=build, args=(index_type, batch_size, results))
+            process.start()
+            peak, seconds, ntotal = results.get()
+            process.join()
+            assert ntotal == NUM_CHUNKS
+            label = "all at once (former)" if batch_size is None else f"streaming, batch {batch_size}"
+            print(f"  {label:22} {peak:7.1f} MiB {seconds:6.1f} s")
@@ -0,0 +1,76 @@
+import json
+import time
+from transformers import AutoTokenizer
+
+from rulebot.text_chunker import TextChunker
+from rulebot.config import EmbeddingConfig
+
+LONG_QUERY = (
+    "Team A is on the power play. The puck is cleared down the ice and goes all the way to the Team A goalkeeper. "
+    "There is no pressure being applied by Team B as they are in the process of a line change. "
+    "The Team A goalkeeper covers the puck trying in an obvious attempt to get a stoppage of play. "
+    "The Referee blows the whistle and proceeds to assess the goalkeeper a minor penalty for delay of game. "
+) * 20
+
+
+def chunk_sentences_reference(tokenizer, sentences: list, max_tokens: int, overlap: int) -> list:
+    """The former TextChunker.chunk_text packing loop, which re-tokenizes the growing chunk for every sentence."""
+    chunks = []
+    current_chunk = ""
+    for sentence in sentences:
+        test_chunk = current_chunk + " " + sentence if current_chunk else sentence
+        token_count = len(tokenizer.encode(test_chunk, add_special_tokens=False))
+        if token_count <= max_tokens:
+            current_chunk = test_chunk
+        else:
+            if current_chunk:
+                chunks.append(current_chunk.strip())
+                if overlap > 0:
+                    current_chunk_sentences = current_chunk.split('. ')
+                    overlap_sentences = ". ".join(current_chunk_sentences[-overlap:]) if len(
+                        current_chunk_sentences) >= overlap else current_chunk
+                else:
+                    overlap_sentences = ""
+                current_chunk = (overlap_sentences + " " + sentence).strip()
+            else:
+                chunks.append(sentence)
+                current_chunk = ""
+    if current_chunk:
+        chunks.append(current_chunk.strip())
+    return chunks
+
+
+if __name__ == "__main__":
+    tokenizer = AutoTokenizer.from_pretrained(EmbeddingConfig["tokenizer_model_name"])
+    chunker = TextChunker(tokenizer, max_tokens=EmbeddingConfig["max_tokens"], overlap=EmbeddingConfig["overlap"])
+
+    with open(EmbeddingConfig["rulebook_path"], "r", encoding="utf-8") as f:
+        rules = json.load(f)
+    texts = [rule["text"] for rule in rules if rule.get("text") and rule["text"].strip()]
+    # segmentation is the same for both implementations, only the packing is compared
+    corpus = [chunker.split_sentences(text) for text in texts]
+
+    mismatches = 0
+    for sentences in corpus:
+        expected = chunk_sentences_reference(tokenizer, sentences, chunker.max_tokens, chunker.overlap)
+        if chunker.chunk_sentences(sentences) != expected:
+            mismatches += 1
+            # the former overlap split the chunk at '. ', which cuts sentences like "... (e.g. a stick) ..."
+            print("Different chunks for:", sentences[0][:80], "...")
+    print(f"Rulebook: {len(corpus)} rules, {mismatches} with different chunks.")
+
+    query_sentences = chunker.split_sentences(LONG_QUERY)
+    for name, inputs in [("rulebook", corpus),
+                         ("longest 20 rules", sorted(corpus, key=lambda s: -sum(map(len, s)))[:20]),
+                         (f"long query ({len(query_sentences)} sentences)", [query_sentences])]:
+        start = time.perf_counter()
+        for sentences in inputs:
+            chunk_sentences_reference(tokenizer, sentences, chunker.max_tokens, chunker.overlap)
+        reference = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for sentences in inputs:
+            chunker.chunk_sentences(sentences)
+        cached = time.perf_counter() - start
+
+        print(f"{name:<32} former: {reference * 1000:8.1f} ms   cached counts: {cached * 1000:8.1f} ms   ({reference / cached:.1f}x)")